@@ -0,0 +1,61 @@
+import argparse
+import json
+import sys
+from typing import Optional
+
+METRICS = ["p50_ms", "p95_ms", "p99_ms", "throughput_per_s"]
+
+
+def compare(base: dict, head: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """
+    Compares the benchmarks present in both result files.
+
+    Returns:
+        tuple[list[str], list[str]]: A table row per benchmark, and the benchmarks whose
+        p99 grew or throughput shrank by more than `threshold` (a fraction).
+    """
+    rows, regressions = [], []
+    for name in sorted(set(base["results"]) & set(head["results"])):
+        before, after = base["results"][name], head["results"][name]
+        cells = []
+        for metric in METRICS:
+            change = (
+                (after[metric] - before[metric]) / before[metric]
+                if before[metric]
+                else 0.0
+            )
+            cells.append(f"{after[metric]:10.2f} ({change:+6.1%})")
+            worse = -change if metric == "throughput_per_s" else change
+            if metric in ("p99_ms", "throughput_per_s") and worse > threshold:
+                regressions.append(f"{name}: {metric} {change:+.1%}")
+        rows.append(f"{name:40} " + " ".join(cells))
+    return rows, regressions
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compares two benchmark result files, e.g. from two commits."
+    )
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Exit non-zero when a p99 grows or a throughput drops by more than this fraction.",
+    )
+    args = parser.parse_args(argv)
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    rows, regressions = compare(base, head, args.threshold)
+    print(f"{'benchmark':40} " + " ".join(f"{metric:>19}" for metric in METRICS))
+    print("\n".join(rows))
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
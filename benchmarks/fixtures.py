@@ -0,0 +1,100 @@
+import os
+from typing import Optional
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+FIXTURE_DIR = os.environ.get("BENCH_FIXTURE_DIR", os.path.join("benchmarks", ".fixtures"))
+
+FIXTURE_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+
+FIXTURE_FORMATS = ["JPEG", "PNG", "WEBP"]
+
+_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "SVG": ".svg"}
+
+_SVG = """<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" viewBox="0 0 {w} {h}">
+<defs><linearGradient id="g"><stop offset="0" stop-color="#1d4e89"/><stop offset="1" stop-color="#f2a541"/></linearGradient></defs>
+<rect width="{w}" height="{h}" fill="url(#g)"/>
+{circles}
+</svg>
+"""
+
+
+class Fixture(BaseModel):
+    """
+    A generated benchmark image.
+    """
+
+    name: str
+    path: str
+    format: str
+    width: int
+    height: int
+
+
+def photo_like(size: tuple[int, int], seed: int = 0) -> Image.Image:
+    """
+    A deterministic RGB image with smooth gradients and fine noise, so encoders see
+    roughly the entropy of a photograph rather than a flat color that compresses to
+    nothing.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    channels = []
+    for phase in rng.uniform(0, 2 * np.pi, 3):
+        wave = np.sin(x / width * 6 + phase) * np.cos(y / height * 4 - phase)
+        channels.append(127 + 100 * wave)
+    pixels = np.stack(channels, axis=-1)
+    pixels += rng.normal(0, 12, pixels.shape)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+
+
+def _svg(size: tuple[int, int], seed: int) -> str:
+    rng = np.random.default_rng(seed)
+    width, height = size
+    circles = "\n".join(
+        f'<circle cx="{rng.integers(width)}" cy="{rng.integers(height)}" '
+        f'r="{rng.integers(5, max(6, width // 8))}" fill="#{rng.integers(0xFFFFFF):06x}" '
+        'fill-opacity="0.6"/>'
+        for _ in range(200)
+    )
+    return _SVG.format(w=width, h=height, circles=circles)
+
+
+def generate_fixtures(
+    directory: str = FIXTURE_DIR,
+    sizes: Optional[list[tuple[int, int]]] = None,
+    formats: Optional[list[str]] = None,
+    svg: bool = True,
+) -> list[Fixture]:
+    """
+    Writes one image per size and format to `directory`, reusing files from earlier runs.
+    Content only depends on the size, so results are comparable across machines.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fixtures = []
+    for width, height in sizes or FIXTURE_SIZES:
+        image = None
+        for image_format in [*(formats or FIXTURE_FORMATS), *(["SVG"] if svg else [])]:
+            name = f"{width}x{height}-{image_format.lower()}"
+            path = os.path.join(directory, name + _EXTENSIONS[image_format])
+            if not os.path.exists(path):
+                if image_format == "SVG":
+                    with open(path, "w") as f:
+                        f.write(_svg((width, height), width * height))
+                else:
+                    if image is None:
+                        image = photo_like((width, height), width * height)
+                    image.save(path, image_format, quality=85)
+            fixtures.append(
+                Fixture(
+                    name=name,
+                    path=path,
+                    format=image_format,
+                    width=width,
+                    height=height,
+                )
+            )
+    return fixtures
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from benchmarks.fixtures import FIXTURE_DIR, Fixture, generate_fixtures
+from benchmarks.results import environment, peak_rss_bytes, summarize, write_results
+
+SCENARIOS = ["login", "subscription_details", "upload", "crop", "mixed"]
+
+# Share of each request type in the mixed scenario, roughly what a client that polls its
+# subscription and edits images sends.
+MIXED_WEIGHTS = {"subscription_details": 50, "crop": 30, "login": 10, "upload": 10}
+
+
+class Session:
+    """
+    A registered benchmark user with a token and an uploaded image to crop.
+    """
+
+    def __init__(self, email: str, password: str, token: str, image_id: str):
+        self.email = email
+        self.password = password
+        self.token = token
+        self.image_id = image_id
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    """
+    Starts the app with uvicorn against the DATABASE_URL in the environment.
+    """
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "project.server:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+        ],
+        env={**os.environ, "PYTHONPATH": os.getcwd()},
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/metrics")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Server did not become ready")
+        await asyncio.sleep(0.5)
+
+
+async def _upload(client: httpx.AsyncClient, session: Session, fixture: Fixture) -> str:
+    with open(fixture.path, "rb") as f:
+        response = await client.post(
+            "/image/upload",
+            params={"format": fixture.format},
+            files={"image": (os.path.basename(fixture.path), f.read())},
+            headers=session.headers,
+        )
+    response.raise_for_status()
+    body = response.json()
+    if not body.get("success"):
+        raise RuntimeError(f"Upload failed: {body.get('message')}")
+    return body["image_id"]
+
+
+async def create_sessions(
+    client: httpx.AsyncClient, users: int, fixture: Fixture
+) -> list[Session]:
+    """
+    Registers `users` fresh users, logs each in and uploads `fixture` for each.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    sessions = []
+    for index in range(users):
+        email, password = f"bench-{run_id}-{index}@example.com", "benchmark-password"
+        response = await client.post(
+            "/user/register",
+            params={"email": email, "username": email, "password": password},
+        )
+        response.raise_for_status()
+        response = await client.post(
+            "/auth/login", params={"email": email, "password": password}
+        )
+        response.raise_for_status()
+        session = Session(email, password, response.json()["access_token"], "")
+        session.image_id = await _upload(client, session, fixture)
+        sessions.append(session)
+    return sessions
+
+
+def _requests(
+    client: httpx.AsyncClient, fixture: Fixture, rng: random.Random
+) -> dict[str, Callable[[Session], Awaitable[httpx.Response]]]:
+    with open(fixture.path, "rb") as f:
+        content = f.read()
+
+    def crop(session: Session) -> Awaitable[httpx.Response]:
+        # Random boxes, so most crops miss the derivative cache.
+        width = rng.randrange(fixture.width // 8, fixture.width // 2)
+        height = rng.randrange(fixture.height // 8, fixture.height // 2)
+        return client.post(
+            "/image/crop",
+            params={
+                "image_id": session.image_id,
+                "x": rng.randrange(0, fixture.width - width),
+                "y": rng.randrange(0, fixture.height - height),
+                "width": width,
+                "height": height,
+            },
+        )
+
+    return {
+        "login": lambda session: client.post(
+            "/auth/login",
+            params={"email": session.email, "password": session.password},
+        ),
+        "subscription_details": lambda session: client.get(
+            "/subscription/details", headers=session.headers
+        ),
+        "upload": lambda session: client.post(
+            "/image/upload",
+            params={"format": fixture.format},
+            files={"image": (os.path.basename(fixture.path), content)},
+            headers=session.headers,
+        ),
+        "crop": crop,
+    }
+
+
+async def run_scenario(
+    scenario: str,
+    client: httpx.AsyncClient,
+    sessions: list[Session],
+    fixture: Fixture,
+    concurrency: int,
+    duration: float,
+    seed: int,
+) -> dict[str, Any]:
+    """
+    Sends requests from `concurrency` closed-loop clients for `duration` seconds.
+    """
+    rng = random.Random(seed)
+    requests = _requests(client, fixture, rng)
+    latencies: list[float] = []
+    errors = 0
+    statuses: dict[str, int] = {}
+    deadline = time.monotonic() + duration
+
+    async def user(index: int) -> None:
+        nonlocal errors
+        session = sessions[index % len(sessions)]
+        while time.monotonic() < deadline:
+            kind = scenario
+            if scenario == "mixed":
+                kind = rng.choices(
+                    list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values())
+                )[0]
+            start = time.perf_counter()
+            try:
+                response = await requests[kind](session)
+                code = str(response.status_code)
+            except httpx.HTTPError as e:
+                code = type(e).__name__
+            elapsed = time.perf_counter() - start
+            statuses[code] = statuses.get(code, 0) + 1
+            if code.startswith("2"):
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(concurrency)))
+    return summarize(
+        latencies, time.perf_counter() - started, errors, statuses=statuses
+    )
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    fixture = next(
+        f
+        for f in generate_fixtures(args.fixtures, svg=False)
+        if f.name == args.fixture
+    )
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        await wait_until_ready(client)
+        sessions = await create_sessions(client, args.users, fixture)
+        results = {}
+        for index, scenario in enumerate(args.scenarios):
+            results[scenario] = await run_scenario(
+                scenario,
+                client,
+                sessions,
+                fixture,
+                args.concurrency,
+                args.duration,
+                args.seed + index,
+            )
+        return results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Concurrent load profile against the upload, crop, login and subscription endpoints."
+    )
+    parser.add_argument(
+        "--base-url",
+        help="Benchmark a running server instead of starting one (peak RSS is then not reported).",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per scenario.")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixture", default="1920x1080-jpeg")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS
+    )
+    parser.add_argument("--out", help="Write JSON results here instead of stdout.")
+    args = parser.parse_args(argv)
+    server = None
+    if args.base_url is None:
+        args.base_url = f"http://127.0.0.1:{args.port}"
+        server = start_server(args.port, args.workers)
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    write_results(
+        {
+            "suite": "load",
+            "environment": environment(),
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("out", "fixtures")
+            },
+            # Largest waited-for child, i.e. the server (the biggest worker with --workers > 1).
+            "server_peak_rss_bytes": peak_rss_bytes(children=True)
+            if server is not None
+            else None,
+            "results": results,
+        },
+        args.out,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from benchmarks.fixtures import FIXTURE_DIR, Fixture, generate_fixtures
+from benchmarks.results import environment, peak_rss_bytes, summarize, write_results
+from starlette.datastructures import UploadFile
+
+# Uploads are streamed into UPLOAD_DIR; keep them out of the working tree.
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="bench-uploads-"))
+
+from project.auth import claims_cache, verify_token  # noqa: E402
+from project.crop_image_service import crop_to_file  # noqa: E402
+from project.login_user_service import create_access_token  # noqa: E402
+from project.password_hashing import pwd_context  # noqa: E402
+from project.upload_image_service import _probe, stream_to_temp_file  # noqa: E402
+
+
+async def measure(
+    fn: Callable[[], Awaitable[Any]], iterations: int, warmup: int = 1
+) -> dict[str, Any]:
+    """
+    Runs `fn` sequentially and summarizes the latency of each call.
+    """
+    for _ in range(warmup):
+        await fn()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _sync(fn: Callable[..., Any], *args: Any) -> Callable[[], Awaitable[Any]]:
+    async def call():
+        return fn(*args)
+
+    return call
+
+
+def _upload(fixture: Fixture) -> Callable[[], Awaitable[Any]]:
+    with open(fixture.path, "rb") as f:
+        content = f.read()
+
+    async def call():
+        upload = await stream_to_temp_file(
+            UploadFile(filename=os.path.basename(fixture.path), file=io.BytesIO(content))
+        )
+        try:
+            if upload.format != "SVG":
+                _probe(upload.path)
+        finally:
+            os.unlink(upload.path)
+
+    return call
+
+
+async def run(fixtures: list[Fixture], iterations: int) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    output_dir = tempfile.mkdtemp(prefix="bench-out-")
+    for fixture in fixtures:
+        if fixture.format == "SVG":
+            continue
+        box = (
+            fixture.width // 4,
+            fixture.height // 4,
+            fixture.width * 3 // 4,
+            fixture.height * 3 // 4,
+        )
+        results[f"crop/{fixture.name}"] = await measure(
+            _sync(
+                crop_to_file,
+                fixture.path,
+                box,
+                os.path.join(output_dir, fixture.name),
+                fixture.format,
+            ),
+            iterations,
+        )
+    for fixture in fixtures:
+        results[f"upload/{fixture.name}"] = await measure(_upload(fixture), iterations)
+    password_hash = pwd_context.hash("benchmark-password")
+    results["hash/bcrypt_hash"] = await measure(
+        _sync(pwd_context.hash, "benchmark-password"), max(1, iterations // 4)
+    )
+    results["hash/bcrypt_verify"] = await measure(
+        _sync(pwd_context.verify, "benchmark-password", password_hash),
+        max(1, iterations // 4),
+    )
+    token = create_access_token(
+        {"sub": "bench@example.com", "uid": "bench", "jti": "bench"}
+    )
+
+    def verify_uncached():
+        claims_cache.discard(token)
+        return verify_token(token)
+
+    results["auth/verify_token_uncached"] = await measure(
+        _sync(verify_uncached), iterations * 10
+    )
+    results["auth/verify_token_cached"] = await measure(
+        _sync(verify_token, token), iterations * 10
+    )
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks of the crop, upload and hashing paths."
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--fixtures", default=FIXTURE_DIR)
+    parser.add_argument("--out", help="Write JSON results here instead of stdout.")
+    args = parser.parse_args(argv)
+    fixtures = generate_fixtures(args.fixtures)
+    results = asyncio.run(run(fixtures, args.iterations))
+    write_results(
+        {
+            "suite": "micro",
+            "environment": environment(),
+            "parameters": {"iterations": args.iterations},
+            "peak_rss_bytes": peak_rss_bytes(),
+            "results": results,
+        },
+        args.out,
+    )
+
+
+if __name__ == "__main__":
+    main()
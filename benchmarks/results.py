@@ -0,0 +1,86 @@
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an ascending list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(
+    latencies: list[float], elapsed: float, errors: int = 0, **extra: Any
+) -> dict[str, Any]:
+    """
+    Latency percentiles (milliseconds) and throughput of one benchmark.
+
+    Args:
+        latencies (list[float]): Seconds taken by each successful operation.
+        elapsed (float): Wall-clock seconds the benchmark ran for.
+        errors (int): Operations that failed.
+    """
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "errors": errors,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1000,
+        "mean_ms": (sum(ordered) / len(ordered) if ordered else 0.0) * 1000,
+        "throughput_per_s": len(ordered) / elapsed if elapsed > 0 else 0.0,
+        **extra,
+    }
+
+
+def peak_rss_bytes(children: bool = False) -> int:
+    """
+    Peak resident set size of this process, or of its largest waited-for child.
+    """
+    usage = resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    )
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict[str, Any]:
+    """
+    Where and on what a benchmark ran, so results are only compared like for like.
+    """
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_results(results: dict[str, Any], path: Optional[str]) -> None:
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if path is None or path == "-":
+        print(text)
+    else:
+        with open(path, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,201 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from PIL import Image
+from project.audit_log import audit_log
+from project.image_encoding import save_image
+from project.image_executor import image_executor, run_image_task
+from project.image_kernels import PointOperation, apply_point_operations
+from project.image_operations import point_operation
+from project.image_pipeline_service import PipelineOperation, parse_step
+from project.storage import storage
+from project.upload_image_service import UPLOAD_DIR
+from pydantic import BaseModel
+
+MAX_BATCH_ADJUST_IMAGES = int(os.environ.get("MAX_BATCH_ADJUST_IMAGES", "500"))
+
+BATCH_ADJUST_CHUNK_SIZE = int(os.environ.get("BATCH_ADJUST_CHUNK_SIZE", "16"))
+
+
+class BatchAdjustResult(BaseModel):
+    """
+    The outcome of adjusting a single image in a batch.
+    """
+
+    image_id: str
+    success: bool
+    message: str
+    result_image_id: Optional[str] = None
+    image_url: Optional[str] = None
+
+
+class BatchAdjustResponse(BaseModel):
+    """
+    Response model for a batch adjustment, with one result per requested image in request order.
+    """
+
+    results: list[BatchAdjustResult]
+
+
+def _adjust_chunk(
+    jobs: list[tuple[str, str]], operations: list[PointOperation]
+) -> list[Optional[str]]:
+    """
+    Applies the same point operations to a chunk of images, one image at a time, so only
+    one decoded image is held in memory per worker.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Args:
+        jobs (list[tuple[str, str]]): (source path, destination path) pairs.
+        operations (list[PointOperation]): The fused point operations.
+
+    Returns:
+        list[Optional[str]]: None for each image written successfully, otherwise the error message.
+    """
+    errors: list[Optional[str]] = [None] * len(jobs)
+    for index, (source_path, dest_path) in enumerate(jobs):
+        try:
+            with Image.open(source_path) as img:
+                img.load()
+                image_format = img.format
+                result = apply_point_operations(img, operations)
+            save_image(result, dest_path, image_format)
+        except Exception as e:
+            errors[index] = str(e)
+    return errors
+
+
+async def adjust_images(
+    user_id: str, image_ids: list[str], operations: list[PipelineOperation]
+) -> BatchAdjustResponse:
+    """
+    Endpoint for applying the same brightness, contrast and invert adjustments to many images in one call.
+
+    Args:
+        user_id (str): The ID of the user requesting the adjustments. Images of other users are reported as not found.
+        image_ids (list[str]): The IDs of the images to adjust.
+        operations (list[PipelineOperation]): ADJUST_BRIGHTNESS, ADJUST_CONTRAST or APPLY_FILTER (invert) steps, applied in order.
+
+    Returns:
+        BatchAdjustResponse: Response model for a batch adjustment, with one result per requested image in request order.
+    """
+    if not image_ids or len(image_ids) > MAX_BATCH_ADJUST_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch needs between 1 and {MAX_BATCH_ADJUST_IMAGES} images.",
+        )
+    point_operations = []
+    for operation in operations:
+        fused = point_operation(*parse_step(operation))
+        if fused is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{operation.type} is not a point adjustment and cannot be batched.",
+            )
+        point_operations.append(fused)
+    image_records = {
+        record.id: record
+        for record in await prisma.models.ImageFile.prisma().find_many(
+            where={"id": {"in": image_ids}, "userId": user_id}
+        )
+    }
+    results = {
+        image_id: BatchAdjustResult(
+            image_id=image_id, success=False, message="Image not found."
+        )
+        for image_id in image_ids
+    }
+    jobs = []
+    for image_id, record in image_records.items():
+        new_image_id = str(uuid.uuid4())
+        file_ext = os.path.splitext(record.storagePath)[1]
+        jobs.append(
+            (record, new_image_id, f"{UPLOAD_DIR}/{new_image_id}{file_ext}", file_ext)
+        )
+    for start in range(0, len(jobs), BATCH_ADJUST_CHUNK_SIZE * image_executor.workers):
+        window = jobs[start : start + BATCH_ADJUST_CHUNK_SIZE * image_executor.workers]
+        sources = await asyncio.gather(
+            *(storage.fetch(record.storagePath) for record, _, _, _ in window),
+            return_exceptions=True,
+        )
+        ready = []
+        for job, source in zip(window, sources):
+            if isinstance(source, BaseException):
+                results[job[0].id] = BatchAdjustResult(
+                    image_id=job[0].id,
+                    success=False,
+                    message=f"Image file unavailable: {source}",
+                )
+            else:
+                ready.append((job, source))
+        chunks = [
+            ready[i : i + BATCH_ADJUST_CHUNK_SIZE]
+            for i in range(0, len(ready), BATCH_ADJUST_CHUNK_SIZE)
+        ]
+        chunk_errors = await asyncio.gather(
+            *(
+                run_image_task(
+                    _adjust_chunk,
+                    [
+                        (source, storage.staging_path(path))
+                        for (_, _, path, _), source in chunk
+                    ],
+                    point_operations,
+                )
+                for chunk in chunks
+            )
+        )
+        for chunk, errors in zip(chunks, chunk_errors):
+            for ((record, new_image_id, path, file_ext), _), error in zip(
+                chunk, errors
+            ):
+                if error is None:
+                    try:
+                        await storage.store(storage.staging_path(path), path)
+                    except Exception as e:
+                        error = str(e)
+                results[record.id] = BatchAdjustResult(
+                    image_id=record.id,
+                    success=error is None,
+                    message=error or "Image adjusted successfully.",
+                    result_image_id=new_image_id if error is None else None,
+                    image_url=f"/files/{new_image_id}{file_ext}"
+                    if error is None
+                    else None,
+                )
+    adjusted = [job for job in jobs if results[job[0].id].success]
+    if adjusted:
+        created_at = datetime.now()
+        await prisma.models.ImageFile.prisma().create_many(
+            data=[
+                {
+                    "id": new_image_id,
+                    "userId": record.userId,
+                    "format": record.format,
+                    "originalFilename": record.originalFilename,
+                    "storagePath": path,
+                    "uploadedAt": created_at,
+                }
+                for record, new_image_id, path, _ in adjusted
+            ]
+        )
+        for record, new_image_id, _, _ in adjusted:
+            for index, operation in enumerate(operations):
+                audit_log.record_manipulation(
+                    record.id,
+                    record.userId,
+                    operation.type,
+                    {
+                        **operation.parameters,
+                        "step": index,
+                        "resultImageId": new_image_id,
+                    },
+                )
+    return BatchAdjustResponse(results=[results[image_id] for image_id in image_ids])
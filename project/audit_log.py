@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+
+logger = logging.getLogger(__name__)
+
+AUDIT_FLUSH_SIZE = int(os.environ.get("AUDIT_FLUSH_SIZE", "500"))
+
+AUDIT_FLUSH_INTERVAL = float(os.environ.get("AUDIT_FLUSH_INTERVAL", "1"))
+
+AUDIT_MAX_BUFFERED = int(os.environ.get("AUDIT_MAX_BUFFERED", "20000"))
+
+_MODELS = {
+    "ImageManipulationRecord": prisma.models.ImageManipulationRecord,
+    "SystemEvent": prisma.models.SystemEvent,
+}
+
+
+class AuditLog:
+    """
+    Buffers ImageManipulationRecord and SystemEvent rows in memory and writes them in the
+    background with one `create_many` per table, so request handlers never wait on
+    bookkeeping inserts.
+
+    The buffer is flushed every AUDIT_FLUSH_INTERVAL seconds, as soon as it holds
+    AUDIT_FLUSH_SIZE rows, and on shutdown. It holds at most AUDIT_MAX_BUFFERED rows:
+    when the database falls that far behind, the oldest rows are dropped (and counted in
+    `dropped`) rather than growing memory without bound or blocking requests. Rows that a
+    batch insert rejects, e.g. records of an image deleted before the flush, are retried
+    one by one and the failing rows are discarded.
+    """
+
+    def __init__(
+        self,
+        flush_size: int = AUDIT_FLUSH_SIZE,
+        flush_interval: float = AUDIT_FLUSH_INTERVAL,
+        max_buffered: int = AUDIT_MAX_BUFFERED,
+    ):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._buffer: deque[tuple[str, dict[str, Any]]] = deque(maxlen=max_buffered)
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def record_manipulation(
+        self,
+        image_id: str,
+        user_id: str,
+        manipulation: prisma.enums.ManipulationType,
+        parameters: dict[str, Any],
+    ) -> None:
+        self._append(
+            "ImageManipulationRecord",
+            {
+                "imageFileId": image_id,
+                "userId": user_id,
+                "manipulation": manipulation,
+                "parameters": prisma.Json(parameters),
+                "createdAt": datetime.now(),
+            },
+        )
+
+    def record_event(
+        self, event_type: prisma.enums.EventType, details: dict[str, Any]
+    ) -> None:
+        self._append(
+            "SystemEvent",
+            {
+                "type": event_type,
+                "details": prisma.Json(details),
+                "createdAt": datetime.now(),
+            },
+        )
+
+    def _append(self, model: str, data: dict[str, Any]) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(
+                    "Audit log buffer full, dropped %d rows so far", self.dropped
+                )
+        self._buffer.append((model, data))
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Error flushing audit log on shutdown")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Error flushing audit log")
+
+    async def flush(self) -> None:
+        """
+        Writes everything buffered so far, in batches of at most `flush_size` rows.
+        """
+        async with self._flush_lock:
+            while self._buffer:
+                batch: dict[str, list[dict[str, Any]]] = {}
+                for _ in range(min(self.flush_size, len(self._buffer))):
+                    model, data = self._buffer.popleft()
+                    batch.setdefault(model, []).append(data)
+                for model, rows in batch.items():
+                    await self._write(model, rows)
+
+    async def _write(self, model: str, rows: list[dict[str, Any]]) -> None:
+        actions = _MODELS[model].prisma()
+        try:
+            self.written += await actions.create_many(data=rows)
+            return
+        except Exception:
+            logger.exception("Error writing %d %s rows", len(rows), model)
+        for row in rows:
+            try:
+                await actions.create(data=row)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Discarding %s row: %s", model, e)
+
+
+audit_log = AuditLog()
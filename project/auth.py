@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import prisma
+import prisma.models
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import ExpiredSignatureError, JWTError, jwt
+from project.login_user_service import ALGORITHM, SECRET_KEY
+from project.sessions import token_hash
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+AUTH_CLAIMS_CACHE_SIZE = int(os.environ.get("AUTH_CLAIMS_CACHE_SIZE", "10000"))
+
+# Seconds between pulls of tokens revoked by other API processes; 0 keeps revocations
+# local to the process that handled the logout.
+AUTH_DENYLIST_SYNC_INTERVAL = float(
+    os.environ.get("AUTH_DENYLIST_SYNC_INTERVAL", "5")
+)
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+class AuthenticatedUser(BaseModel):
+    """
+    The verified claims of the access token a request was made with.
+    """
+
+    id: str
+    email: str
+    jti: str
+    exp: int
+    token_hash: str
+
+
+class TokenDenylist:
+    """
+    The IDs (`jti`) of revoked tokens that have not expired yet.
+
+    Lookups are a single dict access. Each entry is dropped once its token would have
+    expired anyway, using a heap ordered by expiry, so the set only ever holds tokens
+    revoked within the last token lifetime.
+    """
+
+    def __init__(self):
+        self._expiry: dict[str, int] = {}
+        self._heap: list[tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def revoke(self, jti: str, exp: int) -> None:
+        if exp <= time.time() or jti in self._expiry:
+            return
+        self._expiry[jti] = exp
+        heapq.heappush(self._heap, (exp, jti))
+        self._purge()
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._expiry
+
+    def _purge(self) -> None:
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, jti = heapq.heappop(self._heap)
+            self._expiry.pop(jti, None)
+
+
+class ClaimsCache:
+    """
+    An LRU of decoded, signature-checked claims keyed by the raw token, so repeat
+    requests with the same token skip base64, JSON and HMAC work. Expiry and revocation
+    are still checked on every hit.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CLAIMS_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, AuthenticatedUser] = OrderedDict()
+
+    def get(self, token: str) -> Optional[AuthenticatedUser]:
+        claims = self._entries.get(token)
+        if claims is not None:
+            self._entries.move_to_end(token)
+        return claims
+
+    def put(self, token: str, claims: AuthenticatedUser) -> None:
+        self._entries[token] = claims
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, token: str) -> None:
+        self._entries.pop(token, None)
+
+
+denylist = TokenDenylist()
+
+claims_cache = ClaimsCache()
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def verify_token(token: str) -> AuthenticatedUser:
+    """
+    Verifies an access token locally, without touching the database.
+
+    Raises:
+        HTTPException: 401 if the token is malformed, badly signed, expired or revoked.
+    """
+    claims = claims_cache.get(token)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            claims = AuthenticatedUser(
+                id=payload["uid"],
+                email=payload["sub"],
+                jti=payload["jti"],
+                exp=payload["exp"],
+                token_hash=token_hash(token),
+            )
+        except ExpiredSignatureError:
+            raise _unauthorized("Authentication token has expired")
+        except (JWTError, KeyError, ValidationError):
+            raise _unauthorized("Invalid authentication token")
+        claims_cache.put(token, claims)
+    if claims.exp <= time.time():
+        claims_cache.discard(token)
+        raise _unauthorized("Authentication token has expired")
+    if denylist.is_revoked(claims.jti):
+        raise _unauthorized("Authentication token has been revoked")
+    return claims
+
+
+async def authenticated_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+) -> AuthenticatedUser:
+    """
+    Request dependency returning the user a request is authenticated as, from an
+    `Authorization: Bearer` access token.
+    """
+    if credentials is None:
+        raise _unauthorized("Not authenticated")
+    return verify_token(credentials.credentials)
+
+
+async def revoke_token(claims: AuthenticatedUser) -> None:
+    """
+    Revokes a token in this process and, when sync is enabled, records it for the others.
+    """
+    denylist.revoke(claims.jti, claims.exp)
+    if AUTH_DENYLIST_SYNC_INTERVAL > 0:
+        await prisma.models.RevokedToken.prisma().upsert(
+            where={"jti": claims.jti},
+            data={
+                "create": {
+                    "jti": claims.jti,
+                    "expiresAt": datetime.fromtimestamp(claims.exp, timezone.utc),
+                },
+                "update": {},
+            },
+        )
+
+
+class DenylistSync:
+    """
+    Keeps the in-memory denylist in step with tokens revoked by other API processes.
+
+    Every AUTH_DENYLIST_SYNC_INTERVAL seconds the RevokedToken rows created since the
+    previous pull are added to the denylist and expired rows are deleted. Revocation in
+    another process therefore takes effect here within one interval, while request-time
+    checks never wait on the database.
+    """
+
+    def __init__(self, interval: float = AUTH_DENYLIST_SYNC_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._synced_until: Optional[datetime] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Error syncing revoked tokens")
+            await asyncio.sleep(self.interval)
+
+    async def sync(self) -> None:
+        now = datetime.now(timezone.utc)
+        where = {"expiresAt": {"gt": now}}
+        if self._synced_until is not None:
+            # Overlap by one interval so rows committed late by a slow writer are not missed.
+            where["createdAt"] = {
+                "gte": self._synced_until - timedelta(seconds=self.interval)
+            }
+        for row in await prisma.models.RevokedToken.prisma().find_many(where=where):
+            denylist.revoke(row.jti, int(row.expiresAt.timestamp()))
+        await prisma.models.RevokedToken.prisma().delete_many(
+            where={"expiresAt": {"lte": now}}
+        )
+        self._synced_until = now
+
+
+denylist_sync = DenylistSync()
@@ -0,0 +1,153 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi import HTTPException, status
+from project.audit_log import audit_log
+from project.batch_worker import batch_worker
+from project.image_pipeline_service import PipelineOperation, parse_step
+from pydantic import BaseModel
+
+MAX_BATCH_JOB_IMAGES = int(os.environ.get("MAX_BATCH_JOB_IMAGES", "10000"))
+
+
+class CreateBatchJobResponse(BaseModel):
+    """
+    Response model returned as soon as a batch job is queued, with the ID used to poll its progress.
+    """
+
+    job_id: str
+    status: prisma.enums.BatchJobStatus
+    total: int
+
+
+class BatchJobItemResult(BaseModel):
+    """
+    The outcome of one finished image in a batch job.
+    """
+
+    image_id: str
+    status: prisma.enums.BatchJobStatus
+    result_image_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BatchJobStatusResponse(BaseModel):
+    """
+    Progress of a batch job, including the results of every image finished so far.
+    """
+
+    job_id: str
+    status: prisma.enums.BatchJobStatus
+    total: int
+    completed: int
+    failed: int
+    progress: float
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    results: list[BatchJobItemResult]
+
+
+async def create_batch_job(
+    user_id: str, image_ids: list[str], operations: list[PipelineOperation]
+) -> CreateBatchJobResponse:
+    """
+    Endpoint for queueing the same pipeline of operations over many images.
+
+    Args:
+        user_id (str): The ID of the user submitting the job. Every image must belong to this user.
+        image_ids (list[str]): The IDs of the images to process.
+        operations (list[PipelineOperation]): The operations applied to each image, as for /image/pipeline.
+
+    Returns:
+        CreateBatchJobResponse: Response model returned as soon as a batch job is queued, with the ID used to poll its progress.
+    """
+    image_ids = list(dict.fromkeys(image_ids))
+    if not image_ids or len(image_ids) > MAX_BATCH_JOB_IMAGES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch job needs between 1 and {MAX_BATCH_JOB_IMAGES} images.",
+        )
+    try:
+        for operation in operations:
+            parse_step(operation)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    owned = await prisma.models.ImageFile.prisma().count(
+        where={"id": {"in": image_ids}, "userId": user_id}
+    )
+    if owned != len(image_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="One or more images were not found.",
+        )
+    async with prisma.get_client().tx() as tx:
+        job = await prisma.models.BatchJob.prisma(tx).create(
+            data={
+                "userId": user_id,
+                "operations": prisma.Json([operation.dict() for operation in operations]),
+                "total": len(image_ids),
+            }
+        )
+        await prisma.models.BatchJobItem.prisma(tx).create_many(
+            data=[{"jobId": job.id, "imageFileId": image_id} for image_id in image_ids]
+        )
+    batch_worker.notify()
+    audit_log.record_event(
+        prisma.enums.EventType.MANIPULATION_REQUEST,
+        {"userId": user_id, "batchJobId": job.id, "images": len(image_ids)},
+    )
+    return CreateBatchJobResponse(job_id=job.id, status=job.status, total=job.total)
+
+
+async def view_batch_job(user_id: str, job_id: str) -> BatchJobStatusResponse:
+    """
+    Endpoint for polling the status, progress and partial results of a batch job.
+
+    Args:
+        user_id (str): The ID of the user who submitted the job.
+        job_id (str): The ID returned when the job was created.
+
+    Returns:
+        BatchJobStatusResponse: Progress of a batch job, including the results of every image finished so far.
+    """
+    job = await prisma.models.BatchJob.prisma().find_first(
+        where={"id": job_id, "userId": user_id}
+    )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Batch job not found."
+        )
+    items = await prisma.models.BatchJobItem.prisma().find_many(
+        where={
+            "jobId": job_id,
+            "status": {
+                "in": [
+                    prisma.enums.BatchJobStatus.COMPLETED,
+                    prisma.enums.BatchJobStatus.FAILED,
+                ]
+            },
+        }
+    )
+    return BatchJobStatusResponse(
+        job_id=job.id,
+        status=job.status,
+        total=job.total,
+        completed=job.completed,
+        failed=job.failed,
+        progress=(job.completed + job.failed) / job.total if job.total else 1.0,
+        created_at=job.createdAt,
+        finished_at=job.finishedAt,
+        results=[
+            BatchJobItemResult(
+                image_id=item.imageFileId,
+                status=item.status,
+                result_image_id=item.resultImageId,
+                error=item.error,
+            )
+            for item in items
+        ],
+    )
@@ -0,0 +1,230 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi import HTTPException, status
+from project.image_pipeline_service import (
+    PipelineOperation,
+    PipelineResponse,
+    run_pipeline,
+)
+from project.record_cache import get_user
+from project.resize_image_service import ImageReference
+
+logger = logging.getLogger(__name__)
+
+BATCH_POLL_INTERVAL = float(os.environ.get("BATCH_POLL_INTERVAL", "2"))
+
+BATCH_STALE_AFTER = float(os.environ.get("BATCH_STALE_AFTER", "300"))
+
+BATCH_MAX_ACTIVE_JOBS = int(os.environ.get("BATCH_MAX_ACTIVE_JOBS", "8"))
+
+BATCH_ITEM_PAGE_SIZE = int(os.environ.get("BATCH_ITEM_PAGE_SIZE", "100"))
+
+# Per API process: every process runs its own worker, so a user's images can run up to
+# this many times the number of processes at once.
+BATCH_USER_CONCURRENCY = {
+    prisma.enums.Role.FREEUSER: int(os.environ.get("BATCH_FREE_CONCURRENCY", "1")),
+    prisma.enums.Role.PREMIUMUSER: int(
+        os.environ.get("BATCH_PREMIUM_CONCURRENCY", "4")
+    ),
+}
+
+
+class BatchWorker:
+    """
+    Runs queued batch jobs in the background of the API process.
+
+    Jobs are claimed from the BatchJob table with a conditional status update, so several
+    API processes can share the queue without running a job twice. Images within a job
+    run concurrently, bounded per user by a limit derived from the user's role. The limit
+    is kept in memory, so it holds per process rather than across processes. Every
+    finished image bumps the job's counters, which also serves as a heartbeat: a RUNNING
+    job whose heartbeat is older than BATCH_STALE_AFTER seconds is put back in the queue.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._active: dict[str, asyncio.Task] = {}
+        self._user_limits: dict[str, asyncio.Semaphore] = {}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._active.values()) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def notify(self) -> None:
+        """
+        Wakes the worker up to claim newly created jobs without waiting for the next poll.
+        """
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._requeue_stale_jobs()
+                await self._claim_jobs()
+            except Exception:
+                logger.exception("Error polling batch jobs")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), BATCH_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _requeue_stale_jobs(self) -> None:
+        await prisma.models.BatchJob.prisma().update_many(
+            where={
+                "status": prisma.enums.BatchJobStatus.RUNNING,
+                "updatedAt": {
+                    "lt": datetime.utcnow() - timedelta(seconds=BATCH_STALE_AFTER)
+                },
+                "id": {"not_in": list(self._active)},
+            },
+            data={"status": prisma.enums.BatchJobStatus.QUEUED},
+        )
+
+    async def _claim_jobs(self) -> None:
+        free_slots = BATCH_MAX_ACTIVE_JOBS - len(self._active)
+        if free_slots <= 0:
+            return
+        candidates = await prisma.models.BatchJob.prisma().find_many(
+            where={"status": prisma.enums.BatchJobStatus.QUEUED},
+            order={"createdAt": "asc"},
+            take=free_slots,
+        )
+        for job in candidates:
+            claimed = await prisma.models.BatchJob.prisma().update_many(
+                where={"id": job.id, "status": prisma.enums.BatchJobStatus.QUEUED},
+                data={"status": prisma.enums.BatchJobStatus.RUNNING},
+            )
+            if not claimed:
+                continue
+            task = asyncio.create_task(self._run_job(job))
+            self._active[job.id] = task
+            task.add_done_callback(lambda _, job_id=job.id: self._active.pop(job_id))
+
+    def _user_limit(self, user: prisma.models.User) -> asyncio.Semaphore:
+        if user.id not in self._user_limits:
+            self._user_limits[user.id] = asyncio.Semaphore(
+                BATCH_USER_CONCURRENCY.get(user.role, 1)
+            )
+        return self._user_limits[user.id]
+
+    async def _run_job(self, job: prisma.models.BatchJob) -> None:
+        try:
+            # Items left RUNNING by a worker that died are retried.
+            await prisma.models.BatchJobItem.prisma().update_many(
+                where={"jobId": job.id, "status": prisma.enums.BatchJobStatus.RUNNING},
+                data={"status": prisma.enums.BatchJobStatus.QUEUED},
+            )
+            operations = [PipelineOperation(**operation) for operation in job.operations]
+            user = await get_user(job.userId)
+            if user is None:
+                await self._fail_job(job, "User not found.")
+                return
+            limit = self._user_limit(user)
+            while True:
+                items = await prisma.models.BatchJobItem.prisma().find_many(
+                    where={
+                        "jobId": job.id,
+                        "status": prisma.enums.BatchJobStatus.QUEUED,
+                    },
+                    take=BATCH_ITEM_PAGE_SIZE,
+                )
+                if not items:
+                    break
+                await asyncio.gather(
+                    *(self._run_item(job, item, operations, limit) for item in items)
+                )
+            finished = await prisma.models.BatchJob.prisma().find_unique(
+                where={"id": job.id}
+            )
+            await prisma.models.BatchJob.prisma().update(
+                where={"id": job.id},
+                data={
+                    "status": prisma.enums.BatchJobStatus.FAILED
+                    if finished.completed == 0 and finished.failed > 0
+                    else prisma.enums.BatchJobStatus.COMPLETED,
+                    "finishedAt": datetime.utcnow(),
+                },
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error running batch job %s", job.id)
+
+    async def _fail_job(self, job: prisma.models.BatchJob, error: str) -> None:
+        """
+        Fails every queued item of a job and the job itself, so it is not picked up again.
+        """
+        failed = await prisma.models.BatchJobItem.prisma().update_many(
+            where={"jobId": job.id, "status": prisma.enums.BatchJobStatus.QUEUED},
+            data={"status": prisma.enums.BatchJobStatus.FAILED, "error": error},
+        )
+        await prisma.models.BatchJob.prisma().update(
+            where={"id": job.id},
+            data={
+                "status": prisma.enums.BatchJobStatus.FAILED,
+                "failed": {"increment": failed},
+                "finishedAt": datetime.utcnow(),
+            },
+        )
+
+    async def _run_item(
+        self,
+        job: prisma.models.BatchJob,
+        item: prisma.models.BatchJobItem,
+        operations: list[PipelineOperation],
+        limit: asyncio.Semaphore,
+    ) -> None:
+        async with limit:
+            await prisma.models.BatchJobItem.prisma().update(
+                where={"id": item.id},
+                data={"status": prisma.enums.BatchJobStatus.RUNNING},
+            )
+            while True:
+                try:
+                    result = await run_pipeline(
+                        job.userId, item.imageFileId, operations
+                    )
+                    break
+                except HTTPException as e:
+                    if e.status_code != status.HTTP_503_SERVICE_UNAVAILABLE:
+                        # e.g. a job queued before a limit on its operations was lowered.
+                        result = PipelineResponse(
+                            success=False,
+                            message=str(e.detail),
+                            image_reference=ImageReference(),
+                        )
+                        break
+                    # The image executor is saturated by interactive traffic; back off.
+                    await asyncio.sleep(float((e.headers or {}).get("Retry-After", 1)))
+        await prisma.models.BatchJobItem.prisma().update(
+            where={"id": item.id},
+            data={
+                "status": prisma.enums.BatchJobStatus.COMPLETED
+                if result.success
+                else prisma.enums.BatchJobStatus.FAILED,
+                "resultImageId": result.image_reference.image_id,
+                "error": None if result.success else result.message,
+            },
+        )
+        await prisma.models.BatchJob.prisma().update(
+            where={"id": job.id},
+            data={"completed" if result.success else "failed": {"increment": 1}},
+        )
+
+
+batch_worker = BatchWorker()
@@ -0,0 +1,98 @@
+import os
+import uuid
+from typing import Optional
+
+import prisma
+import prisma.models
+from project.record_cache import blobs
+from project.storage import delete_object
+from project.tiles import delete_tiles
+
+BLOB_DIR = os.environ.get(
+    "BLOB_DIR", os.path.join(os.environ.get("UPLOAD_DIR", "uploads"), "blobs")
+)
+
+
+def blob_path(content_hash: str, extension: str) -> str:
+    """
+    Returns a storage path for a new blob with the given content hash.
+
+    Blobs are fanned out over 256 directories by the first byte of the hash to keep
+    directory listings small. Every blob row gets a path of its own, so when content is
+    uploaded again while the objects of its previous blob are still being deleted, the
+    new original, renditions and tiles never share keys with the ones being deleted.
+    """
+    suffix = uuid.uuid4().hex[:12]
+    return f"{BLOB_DIR}/{content_hash[:2]}/{content_hash}-{suffix}.{extension}"
+
+
+async def acquire_blob(content_hash: str) -> Optional[prisma.models.Blob]:
+    """
+    Takes a reference on an existing blob.
+
+    Args:
+        content_hash (str): The SHA-256 hex digest of the uploaded bytes.
+
+    Returns:
+        Optional[prisma.models.Blob]: The blob with its reference count incremented, or None if no blob has this hash.
+    """
+    return await prisma.models.Blob.prisma().update(
+        where={"hash": content_hash}, data={"refCount": {"increment": 1}}
+    )
+
+
+async def register_blob(
+    content_hash: str, storage_path: str, width: int, height: int
+) -> prisma.models.Blob:
+    """
+    Creates the blob row for newly stored content, or takes a reference if a concurrent
+    upload of the same bytes registered it first.
+
+    The row is written before the caller stores the file. `release_blob` only deletes
+    objects once their row is gone, and a new row never reuses the path of an old one,
+    so once this returns the caller can safely (re)write the file at the blob's
+    `storagePath` if it is missing.
+    """
+    return await prisma.models.Blob.prisma().upsert(
+        where={"hash": content_hash},
+        data={
+            "create": {
+                "hash": content_hash,
+                "storagePath": storage_path,
+                "width": width,
+                "height": height,
+                "refCount": 1,
+            },
+            "update": {"refCount": {"increment": 1}},
+        },
+    )
+
+
+async def release_blob(content_hash: str) -> None:
+    """
+    Drops a reference on a blob. With the last reference the blob and rendition rows are
+    deleted, and then the stored original, renditions and tiles.
+
+    Only the rows are deleted in the transaction, so an upload of the same content waits
+    on the row lock instead of referencing a blob being deleted. The objects are deleted
+    after it commits: there can be thousands of tiles, more than fit in the transaction
+    timeout, and a rollback would leave rows pointing at already deleted objects.
+    Failures to delete an object are logged and leave it orphaned.
+    """
+    async with prisma.get_client().tx() as tx:
+        blob = await prisma.models.Blob.prisma(tx).update(
+            where={"hash": content_hash}, data={"refCount": {"decrement": 1}}
+        )
+        if blob is None or blob.refCount > 0:
+            return
+        renditions = await prisma.models.Rendition.prisma(tx).find_many(
+            where={"contentHash": content_hash}
+        )
+        await prisma.models.Rendition.prisma(tx).delete_many(
+            where={"contentHash": content_hash}
+        )
+        await prisma.models.Blob.prisma(tx).delete(where={"hash": content_hash})
+    blobs.invalidate(content_hash)
+    for key in [blob.storagePath, *(r.storagePath for r in renditions)]:
+        await delete_object(key)
+    await delete_tiles(blob)
@@ -1,9 +1,20 @@
 import os
-from datetime import datetime
+from typing import Optional
 
 import prisma
+import prisma.enums
 import prisma.models
+from fastapi import HTTPException
 from PIL import Image
+from project.audit_log import audit_log
+from project.derivative_cache import derivative_cache, derivative_key
+from project.image_encoding import EncoderOptions, save_image
+from project.image_executor import run_image_task
+from project.metrics import ImagePhases
+from project.record_cache import get_image_file
+from project.resize_image_service import CropParameters, ResizeMode, rasterize_to_file
+from project.storage import storage
+from project.tiles import clamp_box, crop_from_tiles, tile_region
 from pydantic import BaseModel
 
 
@@ -17,13 +28,43 @@ class CropImageResponse(BaseModel):
     message: str
 
 
+def crop_to_file(
+    source_path: str,
+    box: Optional[tuple[int, int, int, int]],
+    dest_path: str,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> None:
+    """
+    Crops the image at `source_path` to `box`, clipped to the image (or not at all if it
+    is None), and writes it to `dest_path`, in `image_format` or the source format.
+
+    `save_image` writes the file under a temporary name and renames it into place, so a
+    concurrent reader of the cache never sees a partially written derivative.
+
+    Runs on the image executor, so it only takes picklable values.
+    """
+    with Image.open(source_path) as img:
+        phases = ImagePhases("crop", img.format, img.size)
+        with phases.time("decode"):
+            img.load()
+        with phases.time("transform"):
+            if box is not None:
+                box = clamp_box(box, img.size)
+            cropped_img = img.crop(box)
+        image_format = image_format or img.format
+    with phases.time("encode", image_format):
+        save_image(cropped_img, dest_path, image_format, encoder)
+
+
 async def crop_image(
-    image_id: str, x: int, y: int, width: int, height: int
+    user_id: str, image_id: str, x: int, y: int, width: int, height: int
 ) -> CropImageResponse:
     """
     Endpoint for cropping an uploaded image.
 
     Args:
+        user_id (str): The ID of the user requesting the crop. Only the owner may crop the image.
         image_id (str): The ID of the image to be cropped, as stored in the database upon upload.
         x (int): The x-coordinate of the top left corner for the crop area.
         y (int): The y-coordinate of the top left corner for the crop area.
@@ -33,33 +74,59 @@ async def crop_image(
     Returns:
         CropImageResponse: Returns information about the cropped image, including a reference or path to the processed image file.
     """
-    image_record = await prisma.models.ImageFile.prisma().find_unique(
-        where={"id": image_id}
-    )
-    if not image_record:
+    image_record = await get_image_file(image_id)
+    if not image_record or image_record.userId != user_id:
         return CropImageResponse(
             image_id=image_id, cropped_image_path="", message="Image not found."
         )
+    parameters = {"x": x, "y": y, "width": width, "height": height}
     try:
-        img = Image.open(image_record.storagePath)
-        cropped_img = img.crop((x, y, x + width, y + height))
-        file_root, file_ext = os.path.splitext(image_record.storagePath)
-        new_image_path = f"{file_root}_cropped{file_ext}"
-        cropped_img.save(new_image_path)
-        await prisma.models.ImageManipulationRecord.prisma().create(
-            data={
-                "imageFileId": image_id,
-                "userId": image_record.userId,
-                "manipulation": "CROP",
-                "parameters": {"x": x, "y": y, "width": width, "height": height},
-                "createdAt": datetime.now(),
-            }
+        cache_key = derivative_key(image_id, "CROP", parameters)
+        new_image_path = derivative_cache.get(cache_key)
+        if new_image_path is None and image_record.format == prisma.enums.ImageFormat.SVG:
+            # Vectors are rendered at their intrinsic size, cut to the crop area.
+            new_image_path = derivative_cache.path_for(cache_key, ".png")
+            await run_image_task(
+                rasterize_to_file,
+                await storage.fetch(image_record.storagePath),
+                new_image_path,
+                width,
+                height,
+                CropParameters(
+                    start_x=x, start_y=y, crop_width=width, crop_height=height
+                ),
+                ResizeMode.EXACT,
+            )
+            derivative_cache.put(cache_key, new_image_path)
+        elif new_image_path is None:
+            new_image_path = derivative_cache.path_for(
+                cache_key, os.path.splitext(image_record.storagePath)[1]
+            )
+            region = await tile_region(image_record, (x, y, x + width, y + height))
+            if region is not None:
+                # Large images only read the tiles under the crop.
+                await run_image_task(crop_from_tiles, region, new_image_path)
+            else:
+                await run_image_task(
+                    crop_to_file,
+                    await storage.fetch(image_record.storagePath),
+                    (x, y, x + width, y + height),
+                    new_image_path,
+                )
+            derivative_cache.put(cache_key, new_image_path)
+        audit_log.record_manipulation(
+            image_id,
+            image_record.userId,
+            prisma.enums.ManipulationType.CROP,
+            parameters,
         )
         return CropImageResponse(
             image_id=image_id,
             cropped_image_path=new_image_path,
             message="Image cropped successfully.",
         )
+    except HTTPException:
+        raise
     except Exception as e:
         return CropImageResponse(
             image_id=image_id,
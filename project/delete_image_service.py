@@ -0,0 +1,46 @@
+import prisma
+import prisma.models
+from project.blob_store import release_blob
+from project.record_cache import get_image_file, image_files
+from project.storage import storage
+from pydantic import BaseModel
+
+
+class DeleteImageResponse(BaseModel):
+    """
+    Response model indicating whether the image and its manipulation history were deleted.
+    """
+
+    success: bool
+    message: str
+
+
+async def delete_image(user_id: str, image_id: str) -> DeleteImageResponse:
+    """
+    Endpoint for deleting an uploaded image
+
+    Uploaded images share content-addressed blobs, so the stored file is only removed
+    once the last image referencing it is deleted. Images without a blob (e.g. resize
+    outputs) own their file and it is removed directly.
+
+    Args:
+        user_id (str): The ID of the user deleting the image. Only the owner may delete it.
+        image_id (str): The ID of the image to delete.
+
+    Returns:
+        DeleteImageResponse: Response model indicating whether the image and its manipulation history were deleted.
+    """
+    image_record = await get_image_file(image_id)
+    if not image_record or image_record.userId != user_id:
+        return DeleteImageResponse(success=False, message="Image not found.")
+    async with prisma.get_client().tx() as tx:
+        await prisma.models.ImageManipulationRecord.prisma(tx).delete_many(
+            where={"imageFileId": image_id}
+        )
+        await prisma.models.ImageFile.prisma(tx).delete(where={"id": image_id})
+    image_files.invalidate(image_id)
+    if image_record.contentHash is not None:
+        await release_blob(image_record.contentHash)
+    else:
+        await storage.delete(image_record.storagePath)
+    return DeleteImageResponse(success=True, message="Image deleted successfully.")
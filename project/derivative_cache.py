@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+DERIVATIVE_CACHE_DIR = os.environ.get(
+    "DERIVATIVE_CACHE_DIR",
+    os.path.join(os.environ.get("UPLOAD_DIR", "uploads"), "derived"),
+)
+
+DERIVATIVE_CACHE_MAX_BYTES = int(
+    os.environ.get("DERIVATIVE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024))
+)
+
+
+class DerivativeCacheStats(BaseModel):
+    """
+    Counters describing the derivative cache, used to size DERIVATIVE_CACHE_MAX_BYTES.
+    """
+
+    entries: int
+    total_bytes: int
+    max_bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+
+def derivative_key(source_id: str, operation: str, parameters: Any) -> str:
+    """
+    Builds the cache key of a derived image.
+
+    The parameters are serialized canonically (sorted keys, no whitespace), so the same
+    manipulation always maps to the same key regardless of how the dict was built.
+
+    Args:
+        source_id (str): The ID of the source ImageFile.
+        operation (str): The manipulation type, e.g. "CROP".
+        parameters (Any): JSON-serializable manipulation parameters, as stored in ImageManipulationRecord.parameters.
+
+    Returns:
+        str: A hex digest identifying the derivative.
+    """
+    canonical = json.dumps(
+        [source_id, operation, parameters], sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class DerivativeCache:
+    """
+    A size-bounded on-disk cache of derived images with an in-process LRU index.
+
+    Files live under `directory` named by their key, so a restarted process rebuilds
+    the index from disk with `load`, ordering entries by modification time.
+    """
+
+    def __init__(
+        self,
+        directory: str = DERIVATIVE_CACHE_DIR,
+        max_bytes: int = DERIVATIVE_CACHE_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index: OrderedDict[str, tuple[str, int]] = OrderedDict()
+
+    def load(self) -> None:
+        """
+        Rebuilds the index from the files already in the cache directory.
+        """
+        self._index.clear()
+        self.total_bytes = 0
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, os.path.splitext(name)[0], path, stat))
+        for _, key, path, stat in sorted(entries):
+            self._index[key] = (path, stat.st_size)
+            self.total_bytes += stat.st_size
+        self._evict()
+
+    def path_for(self, key: str, extension: str) -> str:
+        """
+        Returns the path a derivative with this key should be written to.
+        """
+        return os.path.join(self.directory, key[:2], f"{key}{extension}")
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up a derivative, marking it as most recently used.
+
+        Returns:
+            Optional[str]: The path of the cached file, or None on a miss.
+        """
+        entry = self._index.get(key)
+        if entry is not None and os.path.exists(entry[0]):
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self._drop(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, path: str) -> None:
+        """
+        Registers a derivative written to `path` and evicts least recently used entries
+        until the cache fits within `max_bytes`.
+        """
+        if key in self._index:
+            self._drop(key)
+        size = os.path.getsize(path)
+        self._index[key] = (path, size)
+        self.total_bytes += size
+        self._evict()
+
+    def discard(self, key: str) -> None:
+        """
+        Removes an entry and its file.
+        """
+        entry = self._index.get(key)
+        if entry is None:
+            return
+        self._drop(key)
+        if os.path.exists(entry[0]):
+            os.unlink(entry[0])
+
+    def _drop(self, key: str) -> None:
+        _, size = self._index.pop(key)
+        self.total_bytes -= size
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            path, _ = self._index[key]
+            self._drop(key)
+            self.evictions += 1
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def stats(self) -> DerivativeCacheStats:
+        lookups = self.hits + self.misses
+        return DerivativeCacheStats(
+            entries=len(self._index),
+            total_bytes=self.total_bytes,
+            max_bytes=self.max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+        )
+
+
+derivative_cache = DerivativeCache()
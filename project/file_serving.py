@@ -0,0 +1,230 @@
+import hashlib
+import mimetypes
+import mmap
+import os
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+FILE_CHUNK_SIZE = int(os.environ.get("FILE_CHUNK_SIZE", str(256 * 1024)))
+
+ETAG_CACHE_SIZE = int(os.environ.get("ETAG_CACHE_SIZE", "4096"))
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_etag_cache: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+
+async def file_etag(
+    path: str, stat: os.stat_result, content_hash: Optional[str]
+) -> str:
+    """
+    Returns a strong ETag for a stored file.
+
+    Content-addressed files use their content hash directly. Other files are hashed once
+    and the result is cached per (path, mtime, size); stored files are never rewritten
+    in place, so the cache never serves a stale tag.
+    """
+    if content_hash is not None:
+        return f'"{content_hash}"'
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    etag = _etag_cache.get(key)
+    if etag is None:
+        etag = f'"{await run_in_threadpool(_hash_file, path)}"'
+        _etag_cache[key] = etag
+        if len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    else:
+        _etag_cache.move_to_end(key)
+    return etag
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Evaluates an If-None-Match or If-Range header against an ETag.
+    """
+    if header is None:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def not_modified_since(header: Optional[str], mtime: float) -> bool:
+    if header is None:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parses a single-range `bytes=` Range header.
+
+    Returns:
+        Optional[tuple[int, int]]: The inclusive (start, end) byte range, or None when the header is absent,
+        malformed or asks for several ranges, in which case the whole file is sent.
+
+    Raises:
+        ValueError: If the range is well-formed but cannot be satisfied.
+    """
+    if header is None or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, dash, end_text = header[len("bytes=") :].strip().partition("-")
+    if (
+        not dash
+        or not (start_text.isdigit() or end_text.isdigit())
+        or not (start_text.isdigit() or start_text == "")
+        or not (end_text.isdigit() or end_text == "")
+    ):
+        return None
+    if start_text == "":
+        suffix = int(end_text)
+        if suffix == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - suffix), size - 1
+    start = int(start_text)
+    end = int(end_text) if end_text else size - 1
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+class FileRangeResponse(Response):
+    """
+    Streams a byte range of a file without reading it into Python first.
+
+    When the server supports the ASGI zero-copy send extension the kernel copies the
+    file straight to the socket (sendfile); otherwise the file is memory-mapped and
+    sent in FILE_CHUNK_SIZE slices of the page cache.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        start: int,
+        end: int,
+        status_code: int = 200,
+        headers: Optional[dict[str, str]] = None,
+        media_type: Optional[str] = None,
+    ):
+        self.path = path
+        self.start = start
+        self.length = end - start + 1 if end >= start else 0
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.length == 0 or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": self.start,
+                        "count": self.length,
+                    }
+                )
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                end = self.start + self.length
+                for offset in range(self.start, end, FILE_CHUNK_SIZE):
+                    chunk_end = min(offset + FILE_CHUNK_SIZE, end)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": mapped[offset:chunk_end],
+                            "more_body": chunk_end < end,
+                        }
+                    )
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+async def file_response(
+    path: str,
+    content_hash: Optional[str] = None,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[str] = None,
+    media_type: Optional[str] = None,
+    extra_headers: Optional[dict[str, str]] = None,
+) -> Response:
+    """
+    Builds the response for an immutable file: validators, a 304 for a matching
+    conditional request, a 206 for a satisfiable single range, or the whole file.
+    `extra_headers` are sent with every one of them.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    stat = os.stat(path)
+    etag = await file_etag(path, stat, content_hash)
+    headers = {
+        "etag": etag,
+        "last-modified": http_date(stat.st_mtime),
+        "cache-control": IMMUTABLE_CACHE_CONTROL,
+        "accept-ranges": "bytes",
+        **(extra_headers or {}),
+    }
+    if etag_matches(if_none_match, etag) or (
+        if_none_match is None and not_modified_since(if_modified_since, stat.st_mtime)
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    media_type = (
+        media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    )
+    byte_range = None
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_range(range_header, stat.st_size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{stat.st_size}"
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers=headers,
+            )
+    if byte_range is None:
+        return FileRangeResponse(
+            path, 0, stat.st_size - 1, headers=headers, media_type=media_type
+        )
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return FileRangeResponse(
+        path,
+        start,
+        end,
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=media_type,
+    )
@@ -0,0 +1,222 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from fastapi import Query
+from PIL import Image
+from pydantic import BaseModel, Field
+
+try:
+    # Registers the AVIF codec with Pillow; optional, see the "avif" extra.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+AVIF_AVAILABLE = "AVIF" in Image.SAVE
+
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "WEBP": ".webp",
+    "AVIF": ".avif",
+}
+
+FORMAT_MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "AVIF": "image/avif",
+}
+
+# Formats "auto" may pick when the client accepts them, smallest output first.
+NEGOTIATED_FORMATS = ("AVIF", "WEBP") if AVIF_AVAILABLE else ("WEBP",)
+
+DEFAULT_QUALITY = int(os.environ.get("IMAGE_QUALITY", "82"))
+
+DEFAULT_EFFORT = int(os.environ.get("IMAGE_EFFORT", "6"))
+
+MAX_EFFORT = 9
+
+# Modes each encoder accepts as-is; anything else is converted before saving.
+_ENCODER_MODES = {
+    "JPEG": ("L", "RGB", "CMYK"),
+    "PNG": ("1", "L", "LA", "I", "P", "RGB", "RGBA"),
+    "WEBP": ("RGB", "RGBA"),
+    "AVIF": ("RGB", "RGBA"),
+}
+
+
+class EncoderOptions(BaseModel):
+    """
+    Settings for encoding an output image. Each format uses the ones that apply to it.
+    """
+
+    quality: int = Field(DEFAULT_QUALITY, ge=1, le=100)
+    lossless: bool = False
+    effort: int = Field(DEFAULT_EFFORT, ge=0, le=MAX_EFFORT)
+
+
+def encoder_options(
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    lossless: bool = False,
+    effort: Optional[int] = Query(None, ge=0, le=MAX_EFFORT),
+) -> Optional[EncoderOptions]:
+    """
+    Request dependency reading encoder options from the query string, with the
+    configured defaults for any left out, or None when none are given.
+    """
+    if quality is None and not lossless and effort is None:
+        return None
+    return EncoderOptions(
+        quality=DEFAULT_QUALITY if quality is None else quality,
+        lossless=lossless,
+        effort=DEFAULT_EFFORT if effort is None else effort,
+    )
+
+
+def output_formats() -> list[str]:
+    """
+    The formats images can be encoded to in this installation.
+    """
+    return [
+        image_format
+        for image_format in FORMAT_EXTENSIONS
+        if image_format != "AVIF" or AVIF_AVAILABLE
+    ]
+
+
+def resolve_output_format(requested: Optional[str], stored_format: str) -> str:
+    """
+    Resolves the format a derivative is encoded in: the requested one, or by default the
+    format of the stored source when it can be written, otherwise PNG.
+
+    Raises:
+        ValueError: If the requested format cannot be written.
+    """
+    formats = output_formats()
+    if requested is None:
+        return stored_format if stored_format in formats else "PNG"
+    requested = "JPEG" if requested.upper() == "JPG" else requested.upper()
+    if requested not in formats:
+        raise ValueError(f"Output format must be one of {', '.join(formats)}.")
+    return requested
+
+
+def _accepted_media_types(accept: Optional[str]) -> set[str]:
+    accepted = set()
+    for entry in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            accepted.add(media_type.lower())
+    return accepted
+
+
+def negotiate_format(accept: Optional[str], fallback: str) -> str:
+    """
+    Picks the smallest output format the client explicitly lists in its Accept header.
+
+    Wildcards are not taken as support for AVIF or WebP, since browsers send `*/*`
+    whatever they can decode; clients that list neither get `fallback`.
+    """
+    accepted = _accepted_media_types(accept)
+    for image_format in NEGOTIATED_FORMATS:
+        if FORMAT_MEDIA_TYPES[image_format] in accepted:
+            return image_format
+    return fallback
+
+
+def encoder_parameters(image_format: str, options: EncoderOptions) -> dict[str, Any]:
+    """
+    Maps encoder options to the save parameters of a Pillow encoder.
+
+    Effort runs from 0 (fastest) to MAX_EFFORT (smallest output) and is scaled to each
+    encoder's own speed/compression setting.
+    """
+    if image_format == "JPEG":
+        return {
+            "quality": 100 if options.lossless else options.quality,
+            "subsampling": 0 if options.lossless or options.quality >= 90 else 2,
+            "optimize": options.effort >= 3,
+            "progressive": True,
+        }
+    if image_format == "PNG":
+        return {
+            "compress_level": options.effort,
+            "optimize": options.effort == MAX_EFFORT,
+        }
+    if image_format == "WEBP":
+        return {
+            "quality": 100 if options.lossless else options.quality,
+            "lossless": options.lossless,
+            "method": round(options.effort * 6 / MAX_EFFORT),
+        }
+    if image_format == "AVIF":
+        return {
+            "quality": 100 if options.lossless else options.quality,
+            "speed": 10 - round(options.effort * 10 / MAX_EFFORT),
+        }
+    return {}
+
+
+def _encodable(img: Image.Image, image_format: str) -> Image.Image:
+    modes = _ENCODER_MODES.get(image_format)
+    if modes is None or img.mode in modes:
+        return img
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    if image_format == "JPEG" or not has_alpha:
+        return img.convert("RGB")
+    return img.convert("RGBA")
+
+
+@contextmanager
+def atomic_output(dest_path: str) -> Iterator[str]:
+    """
+    Yields a unique temporary path next to `dest_path` to write to, and renames the file
+    into place when the block completes. Concurrent writers of the same destination each
+    publish a whole file, readers never see a partial one, and the temporary file is
+    removed if writing fails.
+    """
+    directory = os.path.dirname(dest_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False) as tmp:
+        partial_path = tmp.name
+    try:
+        yield partial_path
+        os.replace(partial_path, dest_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+
+
+def save_image(
+    img: Image.Image,
+    dest_path: str,
+    image_format: Optional[str],
+    options: Optional[EncoderOptions] = None,
+) -> None:
+    """
+    Encodes `img` to `dest_path`, converting its mode first if the encoder cannot take it
+    (e.g. an RGBA PNG requested as JPEG).
+
+    The file is written through `atomic_output`, so a concurrent reader never sees a
+    partially written image.
+    """
+    image_format = image_format or img.format
+    if image_format == "AVIF" and not AVIF_AVAILABLE:
+        raise ValueError("AVIF output needs the pillow-avif-plugin package.")
+    with atomic_output(dest_path) as partial_path:
+        _encodable(img, image_format).save(
+            partial_path,
+            format=image_format,
+            **encoder_parameters(image_format, options or EncoderOptions()),
+        )
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, Callable, Optional, TypeVar
+
+from fastapi import HTTPException, status
+from project.workers import WEB_CONCURRENCY
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+IMAGE_EXECUTOR_MODE = os.environ.get("IMAGE_EXECUTOR_MODE", "thread").lower()
+
+# Defaults to this process's share of the cores when serving with several workers.
+IMAGE_EXECUTOR_WORKERS = int(
+    os.environ.get(
+        "IMAGE_EXECUTOR_WORKERS",
+        str(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)),
+    )
+)
+
+IMAGE_EXECUTOR_QUEUE_DEPTH = int(os.environ.get("IMAGE_EXECUTOR_QUEUE_DEPTH", "32"))
+
+IMAGE_EXECUTOR_RETRY_AFTER = int(os.environ.get("IMAGE_EXECUTOR_RETRY_AFTER", "2"))
+
+
+class ExecutorStats(BaseModel):
+    """
+    Load counters of a bounded executor, used to size its workers and queue depth.
+    """
+
+    name: str
+    workers: int
+    queue_depth: int
+    running: int
+    queued: int
+    peak_queued: int
+    completed: int
+    rejected: int
+
+
+class ImageExecutor:
+    """
+    Runs blocking Pillow work off the event loop on a dedicated thread or process pool.
+
+    At most `workers` tasks run at once and at most `queue_depth` more wait for a free
+    worker. Submissions beyond that are rejected with HTTP 503 and a Retry-After header
+    instead of queueing without bound.
+
+    Other CPU-bound work (e.g. password hashing) gets its own instance with a different
+    `name`, so it cannot starve image processing or be starved by it.
+    """
+
+    def __init__(
+        self,
+        mode: str = IMAGE_EXECUTOR_MODE,
+        workers: int = IMAGE_EXECUTOR_WORKERS,
+        queue_depth: int = IMAGE_EXECUTOR_QUEUE_DEPTH,
+        retry_after: int = IMAGE_EXECUTOR_RETRY_AFTER,
+        name: str = "image",
+        busy_detail: str = "Image processing is at capacity, please retry shortly",
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unsupported {name} executor mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.queue_depth = max(0, queue_depth)
+        self.retry_after = retry_after
+        self.name = name
+        self.busy_detail = busy_detail
+        self.pending = 0
+        self.peak_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_depth
+
+    @property
+    def queued(self) -> int:
+        """
+        Number of submitted tasks still waiting for a free worker.
+        """
+        return max(0, self.pending - self.workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=f"{self.name}-worker"
+                )
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Runs `fn(*args, **kwargs)` on the pool and awaits its result.
+
+        In process mode `fn` and its arguments must be picklable, so callers pass
+        module-level functions and plain values (paths, tuples) rather than open images.
+
+        Raises:
+            HTTPException: 503 with a Retry-After header when the pool and its queue are full.
+        """
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=self.busy_detail,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        self.pending += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        if self.mode == "thread":
+            # Lets the task add spans to the trace of the request that submitted it.
+            call = functools.partial(contextvars.copy_context().run, call)
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            self.pending -= 1
+            raise
+        # The slot is held until the pool is done with the task, not until the caller
+        # stops waiting: a cancelled request cancels a task that has not started yet,
+        # but one already running keeps its worker busy until it returns.
+        future.add_done_callback(functools.partial(self._task_done, loop))
+        return await asyncio.wrap_future(future, loop=loop)
+
+    def _task_done(self, loop: asyncio.AbstractEventLoop, future: Future) -> None:
+        try:
+            loop.call_soon_threadsafe(self._release, future)
+        except RuntimeError:
+            # The loop is closed, so nothing else touches the counters.
+            self._release(future)
+
+    def _release(self, future: Future) -> None:
+        self.pending -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.completed += 1
+
+    def stats(self) -> ExecutorStats:
+        return ExecutorStats(
+            name=self.name,
+            workers=self.workers,
+            queue_depth=self.queue_depth,
+            running=self.pending - self.queued,
+            queued=self.queued,
+            peak_queued=self.peak_queued,
+            completed=self.completed,
+            rejected=self.rejected,
+        )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+image_executor = ImageExecutor()
+
+
+async def run_image_task(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs a blocking image function on the shared image executor.
+    """
+    return await image_executor.run(fn, *args, **kwargs)
@@ -0,0 +1,111 @@
+from typing import Sequence
+
+import numpy as np
+from PIL import Image, ImageStat
+
+# A point operation is ("brightness" | "contrast", factor) or ("invert", 0.0).
+PointOperation = tuple[str, float]
+
+POINT_MODES = ("L", "LA", "RGB", "RGBA")
+
+SEPIA_MATRIX = (
+    0.393, 0.769, 0.189, 0,
+    0.349, 0.686, 0.168, 0,
+    0.272, 0.534, 0.131, 0,
+)  # fmt: skip
+
+_IDENTITY = np.arange(256, dtype=np.float64)
+
+
+def _point_mode(img: Image.Image) -> Image.Image:
+    if img.mode in POINT_MODES:
+        return img
+    has_alpha = "A" in img.getbands() or "transparency" in img.info
+    return img.convert("RGBA" if has_alpha else "RGB")
+
+
+def _color_bands(mode: str) -> int:
+    return 1 if mode in ("L", "LA") else 3
+
+
+def _mean_luminance(img: Image.Image, lut: np.ndarray) -> int:
+    """
+    Returns the mean luminance of `img` with `lut` applied, rounded as in
+    ImageEnhance.Contrast.
+
+    Pillow converts every pixel to integer luminance before averaging, so the mean
+    depends on how the bands combine within each pixel and cannot be derived from
+    per-band histograms exactly. Unless the table is still the identity it is applied
+    to a temporary copy, which only happens for contrast preceded by other operations.
+    """
+    if not np.array_equal(lut, np.broadcast_to(_IDENTITY, lut.shape)):
+        img = _apply_lut(img, lut.astype(np.uint8))
+    return int(ImageStat.Stat(img.convert("L")).mean[0] + 0.5)
+
+
+def build_lut(img: Image.Image, operations: Sequence[PointOperation]) -> np.ndarray:
+    """
+    Fuses a run of point operations into one lookup table per colour band of `img`.
+
+    Contrast scales around the mean luminance of the image as it is at that point in
+    the chain, computed the same way ImageEnhance.Contrast does. Arithmetic, truncation and
+    clipping follow Pillow's blend after every operation, so applying the table gives
+    exactly the result of applying the operations one by one.
+
+    Args:
+        img (Image.Image): The image the table is for, in one of POINT_MODES.
+        operations (Sequence[PointOperation]): The operations to fuse, in order.
+
+    Returns:
+        np.ndarray: uint8 lookup tables of shape (bands, 256).
+    """
+    lut = np.broadcast_to(_IDENTITY, (_color_bands(img.mode), 256)).astype(np.float32)
+    for kind, factor in operations:
+        # Pillow's blend works in single precision, e.g. 180 * 1.3 gives 233, not 234.
+        factor = np.float32(factor)
+        if kind == "brightness":
+            lut = lut * factor
+        elif kind == "contrast":
+            mean = np.float32(_mean_luminance(img, lut))
+            lut = mean + (lut - mean) * factor
+        elif kind == "invert":
+            lut = 255 - lut
+        else:
+            raise ValueError(f"Unsupported point operation: {kind}")
+        lut = np.clip(np.floor(lut), 0, 255)
+    return lut.astype(np.uint8)
+
+
+def _apply_lut(img: Image.Image, lut: np.ndarray) -> Image.Image:
+    """
+    Applies per-band tables in a single pass, leaving any alpha band untouched.
+    """
+    tables = list(lut)
+    if "A" in img.getbands():
+        tables.append(_IDENTITY.astype(np.uint8))
+    return img.point(np.concatenate(tables).tolist())
+
+
+def apply_point_operations(
+    img: Image.Image, operations: Sequence[PointOperation]
+) -> Image.Image:
+    """
+    Applies a run of brightness, contrast and invert operations as one fused table
+    lookup, instead of one full-image pass per operation.
+    """
+    if not operations:
+        return img
+    img = _point_mode(img)
+    return _apply_lut(img, build_lut(img, operations))
+
+
+def apply_sepia(img: Image.Image) -> Image.Image:
+    """
+    Applies a sepia tone with a single colour-matrix conversion, keeping any alpha band.
+    """
+    img = _point_mode(img)
+    alpha = img.getchannel("A") if "A" in img.getbands() else None
+    toned = img.convert("RGB").convert("RGB", SEPIA_MATRIX)
+    if alpha is not None:
+        toned.putalpha(alpha)
+    return toned
@@ -0,0 +1,188 @@
+from enum import Enum
+from typing import Any, Optional, Sequence
+
+import prisma
+import prisma.enums
+from PIL import Image, ImageFilter
+from project.image_kernels import PointOperation, apply_point_operations, apply_sepia
+from project.resize_image_service import (
+    MAX_TRANSFORM_DIMENSION,
+    REDUCING_GAP,
+    RESAMPLE_FILTERS,
+    ResampleFilter,
+    ResizeMode,
+    resize_source_box,
+    resize_target_size,
+)
+from pydantic import BaseModel, Field
+
+# Operations the pipeline planner emits in place of user-facing ManipulationType steps.
+RESIZE_REGION = "RESIZE_REGION"
+
+TRANSPOSE = "TRANSPOSE"
+
+
+class ResizeStep(BaseModel):
+    width: int = Field(gt=0, le=MAX_TRANSFORM_DIMENSION)
+    height: int = Field(gt=0, le=MAX_TRANSFORM_DIMENSION)
+    mode: ResizeMode = ResizeMode.FIT
+    resample: ResampleFilter = ResampleFilter.LANCZOS
+
+
+class CropStep(BaseModel):
+    x: int = Field(ge=0)
+    y: int = Field(ge=0)
+    width: int = Field(gt=0, le=MAX_TRANSFORM_DIMENSION)
+    height: int = Field(gt=0, le=MAX_TRANSFORM_DIMENSION)
+
+
+class AdjustStep(BaseModel):
+    factor: float = Field(ge=0)
+
+
+class FilterName(str, Enum):
+    BLUR = "blur"
+    SHARPEN = "sharpen"
+    SMOOTH = "smooth"
+    DETAIL = "detail"
+    EDGE_ENHANCE = "edge_enhance"
+    GRAYSCALE = "grayscale"
+    INVERT = "invert"
+    SEPIA = "sepia"
+
+
+class FilterStep(BaseModel):
+    name: FilterName
+
+
+class RotateStep(BaseModel):
+    degrees: float
+
+
+class FlipDirection(str, Enum):
+    HORIZONTAL = "horizontal"
+    VERTICAL = "vertical"
+
+
+class FlipStep(BaseModel):
+    direction: FlipDirection
+
+
+class RegionResizeStep(BaseModel):
+    """
+    Resamples a (possibly fractional) region of the image to an exact size in one pass.
+    Produced by the planner from crops and resizes.
+    """
+
+    box: tuple[float, float, float, float]
+    width: int
+    height: int
+    resample: ResampleFilter = ResampleFilter.LANCZOS
+
+
+class TransposeStep(BaseModel):
+    """
+    A single lossless right-angle rotation and/or flip. Produced by the planner from
+    runs of ROTATE and FLIP steps.
+    """
+
+    method: Image.Transpose
+
+
+STEP_MODELS: dict[prisma.enums.ManipulationType, type[BaseModel]] = {
+    prisma.enums.ManipulationType.RESIZE: ResizeStep,
+    prisma.enums.ManipulationType.CROP: CropStep,
+    prisma.enums.ManipulationType.ADJUST_BRIGHTNESS: AdjustStep,
+    prisma.enums.ManipulationType.ADJUST_CONTRAST: AdjustStep,
+    prisma.enums.ManipulationType.APPLY_FILTER: FilterStep,
+    prisma.enums.ManipulationType.ROTATE: RotateStep,
+    prisma.enums.ManipulationType.FLIP: FlipStep,
+}
+
+PIL_FILTERS = {
+    FilterName.BLUR: ImageFilter.BLUR,
+    FilterName.SHARPEN: ImageFilter.SHARPEN,
+    FilterName.SMOOTH: ImageFilter.SMOOTH,
+    FilterName.DETAIL: ImageFilter.DETAIL,
+    FilterName.EDGE_ENHANCE: ImageFilter.EDGE_ENHANCE,
+}
+
+
+def point_operation(manipulation: str, step: Any) -> Optional[PointOperation]:
+    """
+    Returns the fusable point operation equivalent to a step, or None if the step is
+    not a point operation.
+    """
+    if manipulation == prisma.enums.ManipulationType.ADJUST_BRIGHTNESS:
+        return "brightness", step.factor
+    if manipulation == prisma.enums.ManipulationType.ADJUST_CONTRAST:
+        return "contrast", step.factor
+    if (
+        manipulation == prisma.enums.ManipulationType.APPLY_FILTER
+        and step.name == FilterName.INVERT
+    ):
+        return "invert", 0.0
+    return None
+
+
+def apply_step(img: Image.Image, manipulation: str, step: Any) -> Image.Image:
+    """
+    Applies one validated pipeline step to an in-memory image.
+    """
+    if manipulation == prisma.enums.ManipulationType.RESIZE:
+        box = resize_source_box(img.size, None, step.width, step.height, step.mode)
+        return img.resize(
+            resize_target_size(box, step.width, step.height, step.mode),
+            RESAMPLE_FILTERS[step.resample],
+            box=box,
+            reducing_gap=REDUCING_GAP,
+        )
+    if manipulation == RESIZE_REGION:
+        return img.resize(
+            (step.width, step.height),
+            RESAMPLE_FILTERS[step.resample],
+            box=step.box,
+            reducing_gap=REDUCING_GAP,
+        )
+    if manipulation == prisma.enums.ManipulationType.CROP:
+        right = min(img.width, step.x + step.width)
+        bottom = min(img.height, step.y + step.height)
+        if right <= step.x or bottom <= step.y:
+            raise ValueError("Crop area lies outside the image.")
+        return img.crop((step.x, step.y, right, bottom))
+    operation = point_operation(manipulation, step)
+    if operation is not None:
+        return apply_point_operations(img, [operation])
+    if manipulation == prisma.enums.ManipulationType.APPLY_FILTER:
+        if step.name == FilterName.GRAYSCALE:
+            return img.convert("LA" if "A" in img.getbands() else "L")
+        if step.name == FilterName.SEPIA:
+            return apply_sepia(img)
+        return img.filter(PIL_FILTERS[step.name])
+    if manipulation == prisma.enums.ManipulationType.ROTATE:
+        return img.rotate(step.degrees, expand=True)
+    if manipulation == prisma.enums.ManipulationType.FLIP:
+        if step.direction == FlipDirection.HORIZONTAL:
+            return img.transpose(Image.Transpose.FLIP_LEFT_RIGHT)
+        return img.transpose(Image.Transpose.FLIP_TOP_BOTTOM)
+    if manipulation == TRANSPOSE:
+        return img.transpose(step.method)
+    raise ValueError(f"Unsupported manipulation: {manipulation}")
+
+
+def apply_steps(img: Image.Image, steps: Sequence[tuple[str, Any]]) -> Image.Image:
+    """
+    Applies steps in order, fusing each run of consecutive point operations into a
+    single lookup-table pass.
+    """
+    pending: list[PointOperation] = []
+    for manipulation, step in steps:
+        operation = point_operation(manipulation, step)
+        if operation is not None:
+            pending.append(operation)
+            continue
+        if pending:
+            img = apply_point_operations(img, pending)
+            pending = []
+        img = apply_step(img, manipulation, step)
+    return apply_point_operations(img, pending)
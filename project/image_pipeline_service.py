@@ -0,0 +1,198 @@
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi import HTTPException, status
+from PIL import Image
+from project.audit_log import audit_log
+from project.image_encoding import (
+    FORMAT_EXTENSIONS,
+    EncoderOptions,
+    resolve_output_format,
+    save_image,
+)
+from project.image_executor import run_image_task
+from project.image_operations import STEP_MODELS, apply_steps
+from project.metrics import ImagePhases
+from project.pipeline_planner import plan_pipeline
+from project.record_cache import get_image_file
+from project.resize_image_service import ImageReference
+from project.storage import storage
+from project.svg_rasterizer import rasterize, svg_size
+from project.upload_image_service import UPLOAD_DIR
+from pydantic import BaseModel, Field, ValidationError
+
+MAX_PIPELINE_OPERATIONS = int(os.environ.get("MAX_PIPELINE_OPERATIONS", "32"))
+
+
+class PipelineOperation(BaseModel):
+    """
+    A single step of a manipulation pipeline. The parameters depend on the type and are stored verbatim in the
+    step's ImageManipulationRecord.
+    """
+
+    type: prisma.enums.ManipulationType
+    parameters: dict[str, Any] = Field(default_factory=dict)
+
+
+class PipelineResponse(BaseModel):
+    """
+    Response model for a pipeline run, referencing the single output image produced by all steps.
+    """
+
+    success: bool
+    message: str
+    image_reference: ImageReference
+    operations_applied: int = 0
+
+
+def parse_step(
+    operation: PipelineOperation,
+) -> tuple[prisma.enums.ManipulationType, BaseModel]:
+    """
+    Validates the parameters of a pipeline operation against the model for its type.
+
+    Raises:
+        ValueError: If the parameters do not match the operation type.
+    """
+    try:
+        return operation.type, STEP_MODELS[operation.type](**operation.parameters)
+    except ValidationError as e:
+        raise ValueError(f"Invalid parameters for {operation.type}: {e}") from e
+
+
+def _run_pipeline(
+    source_path: str,
+    steps: list[tuple[prisma.enums.ManipulationType, BaseModel]],
+    dest_path: str,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+    source_format: Optional[str] = None,
+) -> tuple[int, int]:
+    """
+    Decodes the source once, applies the planned steps in memory (fusing runs of point
+    operations into one table lookup) and encodes the result once, in `image_format` or
+    the source format. Planning only needs the dimensions from the image header, so it
+    happens before any pixels are decoded. SVG sources are rasterized at their intrinsic
+    size and written as PNG by default.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        tuple[int, int]: The width and height of the written image.
+    """
+    if source_format == "SVG":
+        size = svg_size(source_path)
+        phases = ImagePhases("pipeline", "SVG", size)
+        with phases.time("decode"):
+            source = rasterize(source_path, size)
+    else:
+        source = Image.open(source_path)
+        phases = ImagePhases("pipeline", source.format, source.size)
+        with phases.time("decode"):
+            source.load()
+    with source as img:
+        image_format = image_format or img.format or "PNG"
+        with phases.time("transform"):
+            result = apply_steps(img, plan_pipeline(steps, img.size))
+        with phases.time("encode", image_format):
+            save_image(result, dest_path, image_format, encoder)
+        return result.size
+
+
+async def run_pipeline(
+    user_id: str,
+    image_id: str,
+    operations: list[PipelineOperation],
+    output_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> PipelineResponse:
+    """
+    Endpoint for applying an ordered list of manipulations to an image in one pass.
+
+    Args:
+        user_id (str): The ID of the user running the pipeline. Only the owner may use the image as a source.
+        image_id (str): The ID of the source image.
+        operations (list[PipelineOperation]): The manipulations to apply, in order.
+        output_format (Optional[str]): The format of the result (JPEG, PNG, WEBP or AVIF). Defaults to the source format.
+        encoder (Optional[EncoderOptions]): Quality, lossless and effort settings for the encoder.
+
+    Returns:
+        PipelineResponse: Response model for a pipeline run, referencing the single output image produced by all steps.
+    """
+    if not operations or len(operations) > MAX_PIPELINE_OPERATIONS:
+        return PipelineResponse(
+            success=False,
+            message=f"A pipeline needs between 1 and {MAX_PIPELINE_OPERATIONS} operations.",
+            image_reference=ImageReference(),
+        )
+    try:
+        steps = [parse_step(operation) for operation in operations]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    try:
+        image_record = await get_image_file(image_id)
+        if not image_record or image_record.userId != user_id:
+            return PipelineResponse(
+                success=False,
+                message="Image not found.",
+                image_reference=ImageReference(),
+            )
+        image_format = resolve_output_format(
+            output_format, image_record.format.value
+        )
+        new_image_id = str(uuid.uuid4())
+        file_ext = FORMAT_EXTENSIONS[image_format]
+        new_image_path = f"{UPLOAD_DIR}/{new_image_id}{file_ext}"
+        staging_path = storage.staging_path(new_image_path)
+        await run_image_task(
+            _run_pipeline,
+            await storage.fetch(image_record.storagePath),
+            steps,
+            staging_path,
+            image_format,
+            encoder,
+            image_record.format.value,
+        )
+        await storage.store(staging_path, new_image_path)
+        await prisma.models.ImageFile.prisma().create(
+            data={
+                "id": new_image_id,
+                "userId": image_record.userId,
+                "format": prisma.enums.ImageFormat[image_format],
+                "originalFilename": image_record.originalFilename,
+                "storagePath": new_image_path,
+                "uploadedAt": datetime.now(),
+            }
+        )
+        for index, operation in enumerate(operations):
+            audit_log.record_manipulation(
+                image_id,
+                image_record.userId,
+                operation.type,
+                {
+                    **operation.parameters,
+                    "step": index,
+                    "resultImageId": new_image_id,
+                },
+            )
+        return PipelineResponse(
+            success=True,
+            message="Pipeline applied successfully.",
+            image_reference=ImageReference(
+                image_id=new_image_id, image_url=f"/files/{new_image_id}{file_ext}"
+            ),
+            operations_applied=len(steps),
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        return PipelineResponse(
+            success=False,
+            message=f"Failed to apply pipeline: {str(e)}",
+            image_reference=ImageReference(),
+        )
@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 import prisma
@@ -6,7 +8,8 @@ import prisma.models
 from fastapi import HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
-from passlib.context import CryptContext
+from project.password_hashing import rehash_if_needed, verify_password
+from project.sessions import create_session
 from pydantic import BaseModel
 
 
@@ -39,14 +42,12 @@ class TokenData(BaseModel):
     username: Optional[str] = None
 
 
-SECRET_KEY = "secret_jwt_key"
+SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "secret_jwt_key")
 
 ALGORITHM = "HS256"
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -54,8 +55,10 @@ async def authenticate_user(email: str, password: str) -> Optional[prisma.models
     user = await prisma.models.User.prisma().find_unique(where={"email": email})
     if not user:
         return None
-    if not pwd_context.verify(password, user.hashedPassword):
+    verified, new_hash = await verify_password(password, user.hashedPassword)
+    if not verified:
         return None
+    await rehash_if_needed(user, new_hash)
     return user
 
 
@@ -90,7 +93,11 @@ async def login_user(email: str, password: str) -> UserLoginResponse:
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id, "jti": uuid.uuid4().hex},
+        expires_delta=access_token_expires,
+    )
+    await create_session(
+        user.id, access_token, datetime.now(timezone.utc) + access_token_expires
     )
     return UserLoginResponse(
         access_token=access_token,
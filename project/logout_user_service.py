@@ -1,6 +1,5 @@
-import prisma
-import prisma.enums
-import prisma.models
+from project.auth import AuthenticatedUser, revoke_token
+from project.sessions import end_session
 from pydantic import BaseModel
 
 
@@ -13,23 +12,19 @@ class LogoutUserResponse(BaseModel):
     message: str
 
 
-async def logout_user(auth_token: str) -> LogoutUserResponse:
+async def logout_user(user: AuthenticatedUser) -> LogoutUserResponse:
     """
     Endpoint to logout a user, invalidating their current session
 
     Args:
-        auth_token (str): The authentication token provided in the request header used to identify the user's session. This field is expected to be handled by the API's authentication middleware rather than being part of the request body or path parameters.
+        user (AuthenticatedUser): The verified claims of the access token the request was made with. The token's
+        session is deleted and its ID is added to the revocation denylist, so the token is rejected from then on even
+        though it has not expired.
 
     Returns:
         LogoutUserResponse: Response model for a logout request. Indicates whether the logout operation was successful without exposing sensitive information.
     """
-    session = await prisma.models.SystemEvent.prisma().find_unique(
-        where={
-            "details": {"path": ["authToken"], "equals": auth_token},
-            "type": prisma.enums.EventType.USER_SIGNUP,
-        }
-    )
-    if session is None:
+    await revoke_token(user)
+    if not await end_session(user.token_hash):
         return LogoutUserResponse(status="Failed", message="Session not found")
-    await prisma.models.SystemEvent.prisma().delete(where={"id": session.id})
     return LogoutUserResponse(status="Success", message="Logout successful")
@@ -0,0 +1,254 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from prisma import Prisma
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Adds a Server-Timing header with the request's aggregated spans (db, decode,
+# transform, encode, ...) to every response, for reading p99 outliers in the browser.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+# Set by prometheus_client's convention when several processes (uvicorn workers or a
+# process-mode executor) record metrics; each process then writes to files in it.
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to handle an HTTP request, until the response has been sent.",
+    ["method", "route", "status"],
+)
+
+IMAGE_PHASE_SECONDS = Histogram(
+    "image_phase_duration_seconds",
+    "Time spent in one phase of an image operation.",
+    ["operation", "phase", "format", "pixels"],
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Round trip of one Prisma query.",
+    ["model", "method"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Upper bounds of the pixel-count label, so it stays a handful of values.
+_PIXEL_CLASSES = [
+    (250_000, "<=0.25MP"),
+    (1_000_000, "<=1MP"),
+    (4_000_000, "<=4MP"),
+    (16_000_000, "<=16MP"),
+]
+
+_spans: contextvars.ContextVar[Optional[list[tuple[str, float]]]] = (
+    contextvars.ContextVar("request_spans", default=None)
+)
+
+
+def pixel_class(size: tuple[int, int]) -> str:
+    pixels = size[0] * size[1]
+    for bound, label in _PIXEL_CLASSES:
+        if pixels <= bound:
+            return label
+    return ">16MP"
+
+
+def record_span(name: str, seconds: float) -> None:
+    """
+    Adds a span to the current request's trace, if the request is traced.
+    """
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+class ImagePhases:
+    """
+    Times the phases of one image operation on a source of the given format and size.
+
+    Usage:
+        phases = ImagePhases("crop", img.format, img.size)
+        with phases.time("decode"):
+            img.load()
+    """
+
+    def __init__(
+        self, operation: str, image_format: Optional[str], size: tuple[int, int]
+    ):
+        self.operation = operation
+        self.image_format = image_format or "unknown"
+        self.pixels = pixel_class(size)
+
+    @contextmanager
+    def time(self, phase: str, image_format: Optional[str] = None) -> Iterator[None]:
+        """
+        Times the block as `phase`. Encoding passes the output format as `image_format`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start, image_format)
+
+    def observe(
+        self, phase: str, seconds: float, image_format: Optional[str] = None
+    ) -> None:
+        """
+        Records a phase timed by the caller, e.g. one that ended before the format and
+        size of the image were known.
+        """
+        IMAGE_PHASE_SECONDS.labels(
+            self.operation, phase, image_format or self.image_format, self.pixels
+        ).observe(seconds)
+        record_span(phase, seconds)
+
+
+class InstrumentedPrisma(Prisma):
+    """
+    A Prisma client that times every query it sends, by model and method.
+    """
+
+    async def _execute(self, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await super()._execute(**kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            model = kwargs.get("model")
+            DB_QUERY_SECONDS.labels(
+                model.__name__ if model is not None else "raw",
+                kwargs.get("method", "unknown"),
+            ).observe(elapsed)
+            record_span("db", elapsed)
+
+
+class ExecutorCollector:
+    """
+    Exports the load counters of bounded executors at scrape time.
+    """
+
+    def __init__(self, executors: list):
+        self.executors = executors
+
+    def collect(self):
+        running = GaugeMetricFamily(
+            "executor_running", "Tasks running on the executor.", labels=["executor"]
+        )
+        queued = GaugeMetricFamily(
+            "executor_queued",
+            "Tasks waiting for a free executor worker.",
+            labels=["executor"],
+        )
+        completed = CounterMetricFamily(
+            "executor_completed", "Tasks the executor has finished.", labels=["executor"]
+        )
+        rejected = CounterMetricFamily(
+            "executor_rejected",
+            "Tasks rejected with a 503 because the queue was full.",
+            labels=["executor"],
+        )
+        for executor in self.executors:
+            stats = executor.stats()
+            running.add_metric([stats.name], stats.running)
+            queued.add_metric([stats.name], stats.queued)
+            completed.add_metric([stats.name], stats.completed)
+            rejected.add_metric([stats.name], stats.rejected)
+        return [running, queued, completed, rejected]
+
+
+_process_collectors: list = []
+
+
+def register_collector(collector: Any) -> None:
+    """
+    Registers a collector of this process's state, such as executor queues.
+    """
+    _process_collectors.append(collector)
+    if PROMETHEUS_MULTIPROC_DIR is None:
+        REGISTRY.register(collector)
+
+
+def render_metrics() -> bytes:
+    """
+    Renders all metrics in the Prometheus text format. With PROMETHEUS_MULTIPROC_DIR set
+    the histograms are merged across processes; collectors still report this process.
+    """
+    if PROMETHEUS_MULTIPROC_DIR is None:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _process_collectors:
+        registry.register(collector)
+    return generate_latest(registry)
+
+
+def _route_of(scope: Scope) -> str:
+    # The route template rather than the path keeps label values bounded.
+    for route in scope["app"].router.routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    Records the latency and status of every HTTP request, and collects its spans for the
+    Server-Timing header when SERVER_TIMING is enabled.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+        spans: Optional[list[tuple[str, float]]] = [] if SERVER_TIMING else None
+        token = _spans.set(spans)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if spans:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"server-timing", _server_timing(spans).encode("latin-1")),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _spans.reset(token)
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], _route_of(scope), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+def _server_timing(spans: list[tuple[str, float]]) -> str:
+    totals: dict[str, tuple[float, int]] = {}
+    for name, seconds in spans:
+        total, count = totals.get(name, (0.0, 0))
+        totals[name] = (total + seconds, count + 1)
+    return ", ".join(
+        f'{name};dur={total * 1000:.2f};desc="{count}x"'
+        for name, (total, count) in totals.items()
+    )
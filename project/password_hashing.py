@@ -0,0 +1,83 @@
+import logging
+import os
+from typing import Optional
+
+import prisma
+import prisma.models
+from passlib.context import CryptContext
+from project.image_executor import ImageExecutor
+from project.record_cache import users
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+
+PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get("PASSWORD_HASH_QUEUE_DEPTH", "64"))
+
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt releases the GIL, so threads hash in parallel. The pool is deliberately small
+# and separate from the image executor: a burst of logins queues here (and is shed with
+# a 503 once the queue is full) instead of blocking the event loop or image work.
+password_executor = ImageExecutor(
+    mode="thread",
+    workers=PASSWORD_HASH_WORKERS,
+    queue_depth=PASSWORD_HASH_QUEUE_DEPTH,
+    retry_after=PASSWORD_HASH_RETRY_AFTER,
+    name="password",
+    busy_detail="Too many concurrent sign-ins, please retry shortly",
+)
+
+
+async def hash_password(password: str) -> str:
+    """
+    Hashes a plain text password with the configured bcrypt cost on the password executor.
+
+    Args:
+        password (str): The plain text password to be hashed.
+
+    Returns:
+        str: The hashed password.
+    """
+    return await password_executor.run(pwd_context.hash, password)
+
+
+async def verify_password(
+    password: str, hashed_password: str
+) -> tuple[bool, Optional[str]]:
+    """
+    Checks a password against a stored hash on the password executor.
+
+    Returns:
+        tuple[bool, Optional[str]]: Whether the password matches, and a replacement hash when it does but the stored
+        one was made with outdated settings (e.g. a lower BCRYPT_ROUNDS), as reported by passlib's needs_update.
+    """
+    return await password_executor.run(
+        pwd_context.verify_and_update, password, hashed_password
+    )
+
+
+async def rehash_if_needed(user: prisma.models.User, new_hash: Optional[str]) -> None:
+    """
+    Stores the replacement hash produced by a successful `verify_password`.
+
+    The update is conditional on the old hash, so a password changed concurrently is
+    never overwritten. Failures are only logged; the user can still sign in with the
+    old hash and is upgraded next time.
+    """
+    if new_hash is None:
+        return
+    try:
+        await prisma.models.User.prisma().update_many(
+            where={"id": user.id, "hashedPassword": user.hashedPassword},
+            data={"hashedPassword": new_hash},
+        )
+        users.invalidate(user.id)
+    except Exception:
+        logger.exception("Error rehashing password for user %s", user.id)
@@ -0,0 +1,252 @@
+from typing import Optional
+
+import prisma
+import prisma.enums
+from PIL import Image
+from project.image_operations import (
+    RESIZE_REGION,
+    TRANSPOSE,
+    CropStep,
+    FilterName,
+    FlipDirection,
+    RegionResizeStep,
+    TransposeStep,
+)
+from project.resize_image_service import resize_source_box, resize_target_size
+from pydantic import BaseModel
+
+PlannedStep = tuple[str, BaseModel]
+
+Size = Optional[tuple[int, int]]
+
+# Right-angle rotations and flips form the eight-element dihedral group of the square.
+# Each element is identified by where it moves the corners of a 2x2 grid, which makes
+# composing a run of steps and finding the single equivalent transpose a table lookup.
+_IDENTITY_GRID = ((0, 1), (2, 3))
+
+_SWAPS_AXES = {
+    Image.Transpose.ROTATE_90,
+    Image.Transpose.ROTATE_270,
+    Image.Transpose.TRANSPOSE,
+    Image.Transpose.TRANSVERSE,
+}
+
+
+def _transpose_grid(
+    grid: tuple[tuple[int, int], tuple[int, int]], method: Image.Transpose
+) -> tuple[tuple[int, int], tuple[int, int]]:
+    (a, b), (c, d) = grid
+    return {
+        Image.Transpose.FLIP_LEFT_RIGHT: ((b, a), (d, c)),
+        Image.Transpose.FLIP_TOP_BOTTOM: ((c, d), (a, b)),
+        Image.Transpose.ROTATE_90: ((b, d), (a, c)),
+        Image.Transpose.ROTATE_180: ((d, c), (b, a)),
+        Image.Transpose.ROTATE_270: ((c, a), (d, b)),
+        Image.Transpose.TRANSPOSE: ((a, c), (b, d)),
+        Image.Transpose.TRANSVERSE: ((d, b), (c, a)),
+    }[method]
+
+
+_GRID_METHODS = {
+    _transpose_grid(_IDENTITY_GRID, method): method for method in Image.Transpose
+}
+
+_ROTATION_METHODS = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+
+def _right_angle_method(
+    manipulation: str, step: BaseModel
+) -> tuple[bool, Optional[Image.Transpose]]:
+    """
+    Returns whether the step is a lossless rotation or flip and, if so, the equivalent
+    transpose method (None for a rotation by a multiple of 360 degrees).
+    """
+    if manipulation == prisma.enums.ManipulationType.FLIP:
+        if step.direction == FlipDirection.HORIZONTAL:
+            return True, Image.Transpose.FLIP_LEFT_RIGHT
+        return True, Image.Transpose.FLIP_TOP_BOTTOM
+    if manipulation == prisma.enums.ManipulationType.ROTATE and step.degrees % 90 == 0:
+        return True, _ROTATION_METHODS.get(int(step.degrees % 360))
+    return False, None
+
+
+def _is_point_operation(manipulation: str, step: BaseModel) -> bool:
+    """
+    Whether a step maps each pixel using only that pixel's value, so it commutes with
+    crops. Contrast does not: it scales around the mean luminance of the whole image,
+    which a crop changes.
+    """
+    if manipulation == prisma.enums.ManipulationType.ADJUST_BRIGHTNESS:
+        return True
+    return (
+        manipulation == prisma.enums.ManipulationType.APPLY_FILTER
+        and step.name
+        in (FilterName.GRAYSCALE, FilterName.INVERT, FilterName.SEPIA)
+    )
+
+
+def _output_size(manipulation: str, step: BaseModel, size: Size) -> Size:
+    """
+    Predicts the size a step produces, or None when it cannot be known without running
+    it (arbitrary-angle rotations).
+    """
+    if size is None:
+        return None
+    if manipulation == prisma.enums.ManipulationType.RESIZE:
+        box = resize_source_box(size, None, step.width, step.height, step.mode)
+        return resize_target_size(box, step.width, step.height, step.mode)
+    if manipulation == RESIZE_REGION:
+        return step.width, step.height
+    if manipulation == prisma.enums.ManipulationType.CROP:
+        return (
+            min(size[0], step.x + step.width) - step.x,
+            min(size[1], step.y + step.height) - step.y,
+        )
+    if manipulation == TRANSPOSE:
+        return (size[1], size[0]) if step.method in _SWAPS_AXES else size
+    if manipulation == prisma.enums.ManipulationType.ROTATE:
+        return None
+    return size
+
+
+def _size_after(planned: list[PlannedStep], size: Size) -> Size:
+    for manipulation, step in planned:
+        size = _output_size(manipulation, step, size)
+    return size
+
+
+def _push_transpose(planned: list[PlannedStep], method: Optional[Image.Transpose]):
+    grid = _IDENTITY_GRID
+    if planned and planned[-1][0] == TRANSPOSE:
+        grid = _transpose_grid(grid, planned.pop()[1].method)
+    if method is not None:
+        grid = _transpose_grid(grid, method)
+    if grid != _IDENTITY_GRID:
+        planned.append((TRANSPOSE, TransposeStep(method=_GRID_METHODS[grid])))
+
+
+def _push_crop(planned: list[PlannedStep], crop: CropStep, size: Size):
+    insert_at = len(planned)
+    while insert_at > 0 and _is_point_operation(*planned[insert_at - 1]):
+        insert_at -= 1
+    input_size = _size_after(planned[:insert_at], size)
+    if input_size is None:
+        planned.insert(insert_at, (prisma.enums.ManipulationType.CROP, crop))
+        return
+    right = min(input_size[0], crop.x + crop.width)
+    bottom = min(input_size[1], crop.y + crop.height)
+    if right <= crop.x or bottom <= crop.y:
+        raise ValueError("Crop area lies outside the image.")
+    if (crop.x, crop.y, right, bottom) == (0, 0, *input_size):
+        return
+    crop = CropStep(x=crop.x, y=crop.y, width=right - crop.x, height=bottom - crop.y)
+    previous_manipulation, previous = (
+        planned[insert_at - 1] if insert_at > 0 else (None, None)
+    )
+    if previous_manipulation == prisma.enums.ManipulationType.CROP:
+        planned[insert_at - 1] = (
+            prisma.enums.ManipulationType.CROP,
+            CropStep(
+                x=previous.x + crop.x,
+                y=previous.y + crop.y,
+                width=crop.width,
+                height=crop.height,
+            ),
+        )
+    elif previous_manipulation == RESIZE_REGION:
+        left, top, box_right, box_bottom = previous.box
+        scale_x = (box_right - left) / previous.width
+        scale_y = (box_bottom - top) / previous.height
+        planned[insert_at - 1] = (
+            RESIZE_REGION,
+            RegionResizeStep(
+                box=(
+                    left + crop.x * scale_x,
+                    top + crop.y * scale_y,
+                    left + (crop.x + crop.width) * scale_x,
+                    top + (crop.y + crop.height) * scale_y,
+                ),
+                width=crop.width,
+                height=crop.height,
+                resample=previous.resample,
+            ),
+        )
+    else:
+        planned.insert(insert_at, (prisma.enums.ManipulationType.CROP, crop))
+
+
+def _push_resize(planned: list[PlannedStep], step: BaseModel, size: Size):
+    input_size = _size_after(planned, size)
+    if input_size is None:
+        planned.append((prisma.enums.ManipulationType.RESIZE, step))
+        return
+    box = resize_source_box(input_size, None, step.width, step.height, step.mode)
+    width, height = resize_target_size(box, step.width, step.height, step.mode)
+    if box == (0, 0, *input_size) and (width, height) == input_size:
+        return
+    planned.append(
+        (
+            RESIZE_REGION,
+            RegionResizeStep(
+                box=box,
+                width=width,
+                height=height,
+                resample=step.resample,
+            ),
+        )
+    )
+
+
+def plan_pipeline(
+    steps: list[tuple[prisma.enums.ManipulationType, BaseModel]],
+    size: tuple[int, int],
+) -> list[PlannedStep]:
+    """
+    Rewrites a validated list of pipeline steps into a cheaper equivalent plan.
+
+    The planner walks the steps once, tracking the image size, and:
+      - drops brightness/contrast adjustments with a factor of 1.0, no-op crops and
+        resizes to the current size;
+      - folds runs of right-angle rotations and flips into a single transpose, or
+        nothing if they cancel out;
+      - moves crops ahead of per-pixel operations (brightness, grayscale, invert,
+        sepia) and fuses consecutive crops. Contrast depends on the whole image, so a
+        crop never moves ahead of it;
+      - merges a crop that follows a resize into the resize, so only the cropped
+        region is resampled instead of resampling pixels the crop then discards.
+
+    Args:
+        steps (list[tuple[prisma.enums.ManipulationType, BaseModel]]): The validated steps in request order.
+        size (tuple[int, int]): The source image size, read from its header.
+
+    Returns:
+        list[PlannedStep]: The steps to execute, which may include the planner-only RESIZE_REGION and TRANSPOSE operations.
+
+    Raises:
+        ValueError: If a crop lies entirely outside the image it applies to.
+    """
+    planned: list[PlannedStep] = []
+    for manipulation, step in steps:
+        is_right_angle, method = _right_angle_method(manipulation, step)
+        if is_right_angle:
+            _push_transpose(planned, method)
+        elif (
+            manipulation
+            in (
+                prisma.enums.ManipulationType.ADJUST_BRIGHTNESS,
+                prisma.enums.ManipulationType.ADJUST_CONTRAST,
+            )
+            and step.factor == 1.0
+        ):
+            continue
+        elif manipulation == prisma.enums.ManipulationType.CROP:
+            _push_crop(planned, step, size)
+        elif manipulation == prisma.enums.ManipulationType.RESIZE:
+            _push_resize(planned, step, size)
+        else:
+            planned.append((manipulation, step))
+    return planned
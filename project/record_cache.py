@@ -0,0 +1,255 @@
+import contextvars
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Type, TypeVar
+
+import prisma
+import prisma.models
+from project.shared_cache import SharedCacheTable, shared_cache
+from project.single_flight import SingleFlight
+from pydantic import BaseModel
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+T = TypeVar("T")
+
+RECORD_CACHE_MAX_ENTRIES = int(os.environ.get("RECORD_CACHE_MAX_ENTRIES", "10000"))
+
+IMAGE_RECORD_CACHE_TTL = float(os.environ.get("IMAGE_RECORD_CACHE_TTL", "300"))
+
+SUBSCRIPTION_CACHE_TTL = float(os.environ.get("SUBSCRIPTION_CACHE_TTL", "30"))
+
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+
+_request_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "record_cache_request_scope", default=None
+)
+
+
+class RecordCacheStats(BaseModel):
+    """
+    Counters describing one record cache, used to tune its TTL and size.
+    """
+
+    namespace: str
+    shared: bool
+    entries: int
+    max_entries: int
+    ttl: float
+    hits: int
+    request_hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    hit_rate: float
+
+
+class RecordCache:
+    """
+    A process-wide TTL/LRU cache of database records in front of a request-scoped memo.
+
+    A lookup is answered from the current request's memo if the same record was already
+    loaded during the request, then from the process cache while the entry is younger
+    than `ttl` seconds, and only then from the database. Concurrent misses for the same
+    key share one query.
+
+    With a `shared` table the process cache is replaced by the table, so the workers of
+    one host share their entries (records are stored as JSON of `model`) and see each
+    other's invalidations. Writers invalidate explicitly. API processes on other hosts
+    are not told, so a write becomes visible there within `ttl` seconds at most; keep
+    the TTL short for records that change.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: float,
+        max_entries: int = RECORD_CACHE_MAX_ENTRIES,
+        model: Optional[Type[Any]] = None,
+        shared: Optional[SharedCacheTable] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.model = model
+        self.shared = shared if model is not None else None
+        self.hits = 0
+        self.request_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._loads = SingleFlight()
+
+    async def get(
+        self, key: str, load: Callable[[], Awaitable[Optional[T]]]
+    ) -> Optional[T]:
+        """
+        Returns the record cached under `key`, calling `load` on a miss. Missing records
+        (None) are not cached.
+        """
+        memo = _request_scope.get()
+        memo_key = (self.namespace, key)
+        if memo is not None and memo_key in memo:
+            self.request_hits += 1
+            return memo[memo_key]
+        value, generation = self._lookup(key)
+        if value is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            value = await self._loads.do(
+                f"{key}:{self._versions.get(key, 0)}", self._load, key, load, generation
+            )
+        if memo is not None and value is not None:
+            memo[memo_key] = value
+        return value
+
+    def _lookup(self, key: str) -> tuple[Optional[Any], int]:
+        """
+        The cached record (or None) and, for the shared table, the key's generation.
+        """
+        if self.shared is not None:
+            payload, generation = self.shared.get(self.namespace, key)
+            if payload is None:
+                return None, generation
+            try:
+                return self.model.parse_raw(payload), generation
+            except ValueError:
+                return None, generation
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[1], 0
+        if entry is not None:
+            del self._entries[key]
+        return None, 0
+
+    async def _load(
+        self, key: str, load: Callable[[], Awaitable[Optional[T]]], generation: int
+    ) -> Optional[T]:
+        version = self._versions.get(key, 0)
+        value = await load()
+        # Skip storing a value read before a concurrent write invalidated the key.
+        if value is None or self.ttl <= 0 or self._versions.get(key, 0) != version:
+            return value
+        if self.shared is not None:
+            _, evicted = self.shared.put(
+                self.namespace, key, value.json().encode("utf-8"), self.ttl, generation
+            )
+            self.evictions += evicted
+            return value
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def invalidate(self, key: str) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.invalidate(self.namespace, key, self.ttl)
+        memo = _request_scope.get()
+        if memo is not None:
+            memo.pop((self.namespace, key), None)
+        self.invalidations += 1
+
+    def stats(self) -> RecordCacheStats:
+        lookups = self.hits + self.request_hits + self.misses
+        return RecordCacheStats(
+            namespace=self.namespace,
+            shared=self.shared is not None,
+            entries=self.shared.count(self.namespace)
+            if self.shared is not None
+            else len(self._entries),
+            max_entries=self.shared.slots
+            if self.shared is not None
+            else self.max_entries,
+            ttl=self.ttl,
+            hits=self.hits,
+            request_hits=self.request_hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            invalidations=self.invalidations,
+            hit_rate=(self.hits + self.request_hits) / lookups if lookups else 0.0,
+        )
+
+
+class RequestCacheMiddleware:
+    """
+    Gives every HTTP request its own record memo, discarded when the request ends.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_scope.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
+
+
+image_files = RecordCache(
+    "ImageFile",
+    IMAGE_RECORD_CACHE_TTL,
+    model=prisma.models.ImageFile,
+    shared=shared_cache,
+)
+
+blobs = RecordCache(
+    "Blob", IMAGE_RECORD_CACHE_TTL, model=prisma.models.Blob, shared=shared_cache
+)
+
+subscriptions = RecordCache(
+    "Subscription",
+    SUBSCRIPTION_CACHE_TTL,
+    model=prisma.models.Subscription,
+    shared=shared_cache,
+)
+
+users = RecordCache(
+    "User", USER_CACHE_TTL, model=prisma.models.User, shared=shared_cache
+)
+
+record_caches = [image_files, blobs, subscriptions, users]
+
+
+async def get_image_file(image_id: str) -> Optional[prisma.models.ImageFile]:
+    return await image_files.get(
+        image_id,
+        lambda: prisma.models.ImageFile.prisma().find_unique(where={"id": image_id}),
+    )
+
+
+async def get_blob(content_hash: str) -> Optional[prisma.models.Blob]:
+    return await blobs.get(
+        content_hash,
+        lambda: prisma.models.Blob.prisma().find_unique(where={"hash": content_hash}),
+    )
+
+
+async def get_latest_subscription(user_id: str) -> Optional[prisma.models.Subscription]:
+    """
+    The user's most recently started subscription, if any.
+    """
+    return await subscriptions.get(
+        user_id,
+        lambda: prisma.models.Subscription.prisma().find_first(
+            where={"userId": user_id}, order={"startDate": "desc"}
+        ),
+    )
+
+
+async def get_user(user_id: str) -> Optional[prisma.models.User]:
+    return await users.get(
+        user_id,
+        lambda: prisma.models.User.prisma().find_unique(where={"id": user_id}),
+    )
@@ -1,6 +1,8 @@
-import bcrypt
 import prisma
+import prisma.enums
 import prisma.models
+from project.audit_log import audit_log
+from project.password_hashing import hash_password
 from pydantic import BaseModel
 
 
@@ -37,8 +39,11 @@ async def register_user(
     )
     if existing_user:
         raise Exception("Email or username is already in use")
-    hashed_password = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    hashed_password = await hash_password(password)
     new_user = await prisma.models.User.prisma().create(
-        data={"email": email, "hashedPassword": hashed_password.decode("utf-8")}
+        data={"email": email, "hashedPassword": hashed_password}
+    )
+    audit_log.record_event(
+        prisma.enums.EventType.USER_SIGNUP, {"userId": new_user.id}
     )
     return RegisterUserResponse(id=new_user.id, email=new_user.email, username=username)
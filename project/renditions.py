@@ -0,0 +1,145 @@
+import logging
+import os
+from typing import Optional
+
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from PIL import Image
+from project.image_encoding import atomic_output
+from project.image_executor import run_image_task
+from project.storage import storage
+
+logger = logging.getLogger(__name__)
+
+RENDITION_SIZES = sorted(
+    {
+        int(size)
+        for size in os.environ.get("RENDITION_SIZES", "64,256,1024").split(",")
+        if size.strip()
+    },
+    reverse=True,
+)
+
+
+def rendition_path(storage_path: str, long_edge: int) -> str:
+    """
+    Returns the path of a rendition, stored alongside the original.
+    """
+    file_root, file_ext = os.path.splitext(storage_path)
+    return f"{file_root}_{long_edge}{file_ext}"
+
+
+def _render_renditions(
+    source_path: str, targets: list[tuple[int, str]]
+) -> list[tuple[int, int, int, str]]:
+    """
+    Renders renditions of the image at `source_path` from a single decode, each
+    `(long edge, path)` target to its path.
+
+    Sizes are produced largest first and each one is resized from the previous
+    rendition rather than from the original, so every step only reduces an already
+    small image. Sizes not smaller than the original are skipped; renditions never
+    upscale.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        list[tuple[int, int, int, str]]: (long edge, width, height, path) for each rendition written.
+    """
+    rendered = []
+    with Image.open(source_path) as img:
+        targets = sorted(
+            (target for target in targets if target[0] < max(img.size)), reverse=True
+        )
+        if not targets:
+            return rendered
+        if img.format == "JPEG":
+            scale = targets[0][0] / max(img.size)
+            img.draft(img.mode, (round(img.width * scale), round(img.height * scale)))
+        current = img
+        for size, path in targets:
+            scale = size / max(img.size)
+            target = (
+                max(1, round(img.width * scale)),
+                max(1, round(img.height * scale)),
+            )
+            current = current.resize(
+                target, Image.Resampling.LANCZOS, reducing_gap=3.0
+            )
+            with atomic_output(path) as partial_path:
+                current.save(partial_path, format=img.format)
+            rendered.append((size, target[0], target[1], path))
+    return rendered
+
+
+async def generate_renditions(content_hash: str, storage_path: str) -> None:
+    """
+    Generates and registers the configured renditions of a blob that does not have them yet.
+
+    Meant to run as a background task after the upload response has been sent. Failures
+    are logged rather than raised: a missing rendition only means resizes fall back to
+    the original.
+    """
+    try:
+        existing = {
+            rendition.longEdge
+            for rendition in await prisma.models.Rendition.prisma().find_many(
+                where={"contentHash": content_hash}
+            )
+        }
+        sizes = [size for size in RENDITION_SIZES if size not in existing]
+        if not sizes:
+            return
+        targets = [
+            (size, storage.staging_path(rendition_path(storage_path, size)))
+            for size in sizes
+        ]
+        rendered = await run_image_task(
+            _render_renditions, await storage.fetch(storage_path), targets
+        )
+        for long_edge, _, _, path in rendered:
+            await storage.store(path, rendition_path(storage_path, long_edge))
+        if rendered:
+            await prisma.models.Rendition.prisma().create_many(
+                data=[
+                    {
+                        "contentHash": content_hash,
+                        "longEdge": long_edge,
+                        "width": width,
+                        "height": height,
+                        "storagePath": rendition_path(storage_path, long_edge),
+                    }
+                    for long_edge, width, height, _ in rendered
+                ],
+                skip_duplicates=True,
+            )
+    except HTTPException:
+        logger.warning("Image executor saturated, skipping renditions for %s", content_hash)
+    except Exception:
+        logger.exception("Error generating renditions for %s", content_hash)
+
+
+async def find_rendition(
+    content_hash: str, width: int, height: int
+) -> tuple[Optional[prisma.models.Rendition], bool]:
+    """
+    Finds the best rendition to serve or resize a `width` x `height` output from.
+
+    Returns:
+        tuple[Optional[prisma.models.Rendition], bool]: The rendition with exactly that size if one exists (and True),
+        otherwise the smallest rendition at least that large (and False), or None if there is none.
+    """
+    candidates = await prisma.models.Rendition.prisma().find_many(
+        where={
+            "contentHash": content_hash,
+            "width": {"gte": width},
+            "height": {"gte": height},
+        },
+        order={"longEdge": "asc"},
+        take=1,
+    )
+    if not candidates:
+        return None, False
+    rendition = candidates[0]
+    return rendition, (rendition.width, rendition.height) == (width, height)
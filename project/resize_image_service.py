@@ -1,8 +1,32 @@
+import math
+import os
+import shutil
+import uuid
+from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 import prisma
 import prisma.enums
 import prisma.models
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from project.audit_log import audit_log
+from project.image_encoding import (
+    FORMAT_EXTENSIONS,
+    EncoderOptions,
+    resolve_output_format,
+    save_image,
+)
+from project.image_executor import run_image_task
+from project.metrics import ImagePhases
+from project.record_cache import get_blob, get_image_file
+from project.renditions import find_rendition
+from project.storage import storage
+from project.svg_rasterizer import rasterize, svg_size
+from project.tiles import TileRegion, is_tiled, resize_from_tiles, tile_region
+from project.upload_image_service import UPLOAD_DIR
 from pydantic import BaseModel
 
 
@@ -17,6 +41,42 @@ class CropParameters(BaseModel):
     crop_height: int
 
 
+class ResizeMode(str, Enum):
+    """
+    How the requested width and height are applied to the source image.
+    """
+
+    FIT = "fit"
+    FILL = "fill"
+    EXACT = "exact"
+
+
+class ResampleFilter(str, Enum):
+    NEAREST = "nearest"
+    BOX = "box"
+    BILINEAR = "bilinear"
+    HAMMING = "hamming"
+    BICUBIC = "bicubic"
+    LANCZOS = "lanczos"
+
+
+RESAMPLE_FILTERS = {
+    ResampleFilter.NEAREST: Image.Resampling.NEAREST,
+    ResampleFilter.BOX: Image.Resampling.BOX,
+    ResampleFilter.BILINEAR: Image.Resampling.BILINEAR,
+    ResampleFilter.HAMMING: Image.Resampling.HAMMING,
+    ResampleFilter.BICUBIC: Image.Resampling.BICUBIC,
+    ResampleFilter.LANCZOS: Image.Resampling.LANCZOS,
+}
+
+REDUCING_GAP = 3.0
+
+# Upper bound on the output and crop width and height of transform URLs and pipeline
+# resize and crop steps, so a request cannot make the server allocate an arbitrarily
+# large image.
+MAX_TRANSFORM_DIMENSION = int(os.environ.get("MAX_TRANSFORM_DIMENSION", "4096"))
+
+
 class ImageReference(BaseModel):
     """
     The reference to the image, which might include IDs, URLs, or other relevant identifiers.
@@ -36,48 +96,351 @@ class ImageOperationResponse(BaseModel):
     image_reference: ImageReference
 
 
+def resize_source_box(
+    image_size: tuple[int, int],
+    crop: Optional[CropParameters],
+    width: int,
+    height: int,
+    mode: ResizeMode,
+) -> tuple[int, int, int, int]:
+    """
+    Computes the region of the source image, in full-resolution coordinates, that the
+    output is rendered from: the crop parameters clamped to the image, further
+    centre-cropped to the target aspect ratio in fill mode.
+    """
+    img_w, img_h = image_size
+    left, top, right, bottom = 0, 0, img_w, img_h
+    if crop is not None and crop.crop_width > 0 and crop.crop_height > 0:
+        left = max(0, crop.start_x)
+        top = max(0, crop.start_y)
+        right = min(img_w, crop.start_x + crop.crop_width)
+        bottom = min(img_h, crop.start_y + crop.crop_height)
+        if right <= left or bottom <= top:
+            raise ValueError("Crop area lies outside the image.")
+    if mode == ResizeMode.FILL:
+        box_w, box_h = right - left, bottom - top
+        if box_w * height > box_h * width:
+            new_w = max(1, round(box_h * width / height))
+            left += (box_w - new_w) // 2
+            right = left + new_w
+        else:
+            new_h = max(1, round(box_w * height / width))
+            top += (box_h - new_h) // 2
+            bottom = top + new_h
+    return left, top, right, bottom
+
+
+def resize_target_size(
+    box: tuple[int, int, int, int], width: int, height: int, mode: ResizeMode
+) -> tuple[int, int]:
+    if mode != ResizeMode.FIT:
+        return width, height
+    box_w, box_h = box[2] - box[0], box[3] - box[1]
+    scale = min(width / box_w, height / box_h)
+    return max(1, round(box_w * scale)), max(1, round(box_h * scale))
+
+
+def resize_to_file(
+    source_path: str,
+    dest_path: str,
+    width: int,
+    height: int,
+    crop: Optional[CropParameters],
+    mode: ResizeMode,
+    resample: ResampleFilter,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> tuple[int, int]:
+    """
+    Resizes the image at `source_path` and writes the result to `dest_path`, in
+    `image_format` or the source format.
+
+    JPEG sources are decoded with `draft`, which lets libjpeg downscale by 1/2, 1/4 or
+    1/8 while decoding, so large originals are never fully materialized. Other formats
+    go through `resize` with a reducing gap, which shrinks the image by an integer
+    factor with `reduce` before the final resample.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        tuple[int, int]: The width and height of the written image.
+    """
+    with Image.open(source_path) as img:
+        phases = ImagePhases("resize", img.format, img.size)
+        full_w, full_h = img.size
+        box = resize_source_box(img.size, crop, width, height, mode)
+        target = resize_target_size(box, width, height, mode)
+        if img.format == "JPEG":
+            box_w, box_h = box[2] - box[0], box[3] - box[1]
+            img.draft(
+                img.mode,
+                (
+                    math.ceil(full_w * target[0] / box_w),
+                    math.ceil(full_h * target[1] / box_h),
+                ),
+            )
+            scale_x, scale_y = img.size[0] / full_w, img.size[1] / full_h
+            box = (
+                int(box[0] * scale_x),
+                int(box[1] * scale_y),
+                max(int(box[0] * scale_x) + 1, round(box[2] * scale_x)),
+                max(int(box[1] * scale_y) + 1, round(box[3] * scale_y)),
+            )
+        with phases.time("decode"):
+            img.load()
+        with phases.time("transform"):
+            resized_img = img.resize(
+                target,
+                RESAMPLE_FILTERS[resample],
+                box=box,
+                reducing_gap=REDUCING_GAP,
+            )
+        image_format = image_format or img.format
+    with phases.time("encode", image_format):
+        save_image(resized_img, dest_path, image_format, encoder)
+    return resized_img.size
+
+
+def rasterize_to_file(
+    source_path: str,
+    dest_path: str,
+    width: int,
+    height: int,
+    crop: Optional[CropParameters],
+    mode: ResizeMode,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> tuple[int, int]:
+    """
+    The SVG counterpart of `resize_to_file`: renders the region of the vector selected
+    by `crop` and `mode` directly at the target size and writes it to `dest_path`, in
+    `image_format` or PNG.
+
+    The whole document is drawn at the output scale and the region cut out of that, so
+    no step resamples a bitmap and a crop never magnifies pixels.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        tuple[int, int]: The width and height of the written image.
+    """
+    intrinsic = svg_size(source_path)
+    box = resize_source_box(intrinsic, crop, width, height, mode)
+    target = resize_target_size(box, width, height, mode)
+    scale_x = target[0] / (box[2] - box[0])
+    scale_y = target[1] / (box[3] - box[1])
+    left, top = round(box[0] * scale_x), round(box[1] * scale_y)
+    phases = ImagePhases("rasterize", "SVG", target)
+    with phases.time("decode"):
+        raster = rasterize(
+            source_path,
+            (
+                max(1, round(intrinsic[0] * scale_x)),
+                max(1, round(intrinsic[1] * scale_y)),
+            ),
+        )
+    region = raster.crop((left, top, left + target[0], top + target[1]))
+    with phases.time("encode", image_format or "PNG"):
+        save_image(region, dest_path, image_format or "PNG", encoder)
+    return region.size
+
+
+def link_or_copy(source_path: str, dest_path: str) -> None:
+    """
+    Hard-links an existing rendition to a new path, falling back to a copy across devices.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+
+
+async def rendition_source(
+    image_record: prisma.models.ImageFile, width: int, height: int, mode: ResizeMode
+) -> tuple[str, bool]:
+    """
+    Picks the file to resize from: a pre-generated rendition when the image has one at
+    least as large as the output, otherwise the original.
+
+    Returns:
+        tuple[str, bool]: The storage key of the source, and whether it already is the requested output.
+    """
+    if image_record.contentHash is None:
+        return image_record.storagePath, False
+    blob = await get_blob(image_record.contentHash)
+    if blob is None or not blob.width or not blob.height:
+        return image_record.storagePath, False
+    box = resize_source_box((blob.width, blob.height), None, width, height, mode)
+    target = resize_target_size(box, width, height, mode)
+    rendition, exact = await find_rendition(blob.hash, *target)
+    if rendition is None:
+        return image_record.storagePath, False
+    return rendition.storagePath, exact and mode == ResizeMode.FIT
+
+
+async def resize_tile_region(
+    image_record: prisma.models.ImageFile,
+    width: int,
+    height: int,
+    crop: Optional[CropParameters],
+    mode: ResizeMode,
+) -> Optional[tuple[TileRegion, tuple[int, int]]]:
+    """
+    Fetches the tiles a resize of a tiled image reads, from the smallest pyramid level
+    that still leaves a downscale of at least REDUCING_GAP to the output.
+
+    Returns:
+        Optional[tuple[TileRegion, tuple[int, int]]]: The region and the output size, or None if the image has no tile pyramid.
+    """
+    if image_record.contentHash is None:
+        return None
+    blob = await get_blob(image_record.contentHash)
+    if not is_tiled(blob):
+        return None
+    box = resize_source_box((blob.width, blob.height), crop, width, height, mode)
+    target = resize_target_size(box, width, height, mode)
+    region = await tile_region(image_record, box, target, REDUCING_GAP)
+    return (region, target) if region is not None else None
+
+
 async def resize_image(
-    image_id: str, width: int, height: int, crop: CropParameters
+    user_id: str,
+    image_id: str,
+    width: int,
+    height: int,
+    crop: Optional[CropParameters] = None,
+    mode: ResizeMode = ResizeMode.FIT,
+    resample: ResampleFilter = ResampleFilter.LANCZOS,
+    output_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
 ) -> ImageOperationResponse:
     """
     Endpoint for resizing an uploaded image.
 
     Args:
+        user_id (str): The ID of the user requesting the resize. Only the owner may resize the image.
         image_id (str): The unique identifier of the image to be resized.
         width (int): The desired width of the resized image.
         height (int): The desired height of the resized image.
-        crop (CropParameters): Optional cropping parameters, if the image should be cropped in addition to being resized.
+        crop (Optional[CropParameters]): Optional cropping parameters, if the image should be cropped in addition to being resized.
+        mode (ResizeMode): FIT scales the image to fit within width x height preserving its aspect ratio, FILL crops to the
+        target aspect ratio and then scales to exactly width x height, EXACT stretches to width x height.
+        resample (ResampleFilter): The resampling filter used for scaling. SVG images are rendered at the target size instead.
+        output_format (Optional[str]): The format of the resized image (JPEG, PNG, WEBP or AVIF). Defaults to the source format.
+        encoder (Optional[EncoderOptions]): Quality, lossless and effort settings for the encoder.
 
     Returns:
         ImageOperationResponse: Response model conveying the result of the image resizing operation. It includes a reference
         to the resized image, such as a URL or an ID.
     """
-    try:
-        image_record = await prisma.models.ImageFile.prisma().find_unique(
-            where={"id": image_id}
+    if width <= 0 or height <= 0:
+        return ImageOperationResponse(
+            success=False,
+            message="Width and height must be positive.",
+            image_reference=ImageReference(),
         )
-        if not image_record:
+    try:
+        image_record = await get_image_file(image_id)
+        if not image_record or image_record.userId != user_id:
             return ImageOperationResponse(
                 success=False,
                 message="Image not found.",
                 image_reference=ImageReference(),
             )
-        new_image_id = "new_resized_image_id"
-        await prisma.models.ImageManipulationRecord.prisma().create(
-            {
-                "data": {
-                    "imageFileId": image_id,
-                    "userId": image_record.userId,
-                    "manipulation": prisma.enums.ManipulationType.RESIZE,
-                    "parameters": crop.dict(),
-                }
+        image_format = resolve_output_format(
+            output_format, image_record.format.value
+        )
+        new_image_id = str(uuid.uuid4())
+        file_ext = FORMAT_EXTENSIONS[image_format]
+        new_image_path = f"{UPLOAD_DIR}/{new_image_id}{file_ext}"
+        is_vector = image_record.format == prisma.enums.ImageFormat.SVG
+        source_key, is_exact = image_record.storagePath, False
+        if crop is None and not is_vector:
+            source_key, is_exact = await rendition_source(
+                image_record, width, height, mode
+            )
+        tiled = None
+        if source_key == image_record.storagePath and not is_vector:
+            # Large originals are read from the pyramid level nearest the output size.
+            tiled = await resize_tile_region(image_record, width, height, crop, mode)
+        staging_path = storage.staging_path(new_image_path)
+        if tiled is not None:
+            region, target = tiled
+            await run_image_task(
+                resize_from_tiles,
+                region,
+                staging_path,
+                target,
+                RESAMPLE_FILTERS[resample],
+                REDUCING_GAP,
+                image_format,
+                encoder,
+            )
+        elif is_exact and encoder is None and image_format == image_record.format:
+            await run_in_threadpool(
+                link_or_copy, await storage.fetch(source_key), staging_path
+            )
+        elif is_vector:
+            await run_image_task(
+                rasterize_to_file,
+                await storage.fetch(source_key),
+                staging_path,
+                width,
+                height,
+                crop,
+                mode,
+                image_format,
+                encoder,
+            )
+        else:
+            await run_image_task(
+                resize_to_file,
+                await storage.fetch(source_key),
+                staging_path,
+                width,
+                height,
+                crop,
+                mode,
+                resample,
+                image_format,
+                encoder,
+            )
+        await storage.store(staging_path, new_image_path)
+        await prisma.models.ImageFile.prisma().create(
+            data={
+                "id": new_image_id,
+                "userId": image_record.userId,
+                "format": prisma.enums.ImageFormat[image_format],
+                "originalFilename": image_record.originalFilename,
+                "storagePath": new_image_path,
+                "uploadedAt": datetime.now(),
             }
         )
+        audit_log.record_manipulation(
+            image_id,
+            image_record.userId,
+            prisma.enums.ManipulationType.RESIZE,
+            {
+                "width": width,
+                "height": height,
+                "mode": mode.value,
+                "resample": resample.value,
+                "crop": crop.dict() if crop is not None else None,
+                "format": image_format,
+                "encoder": encoder.dict() if encoder is not None else None,
+                "resultImageId": new_image_id,
+            },
+        )
         return ImageOperationResponse(
             success=True,
             message="Image resized successfully.",
-            image_reference=ImageReference(image_id=new_image_id),
+            image_reference=ImageReference(
+                image_id=new_image_id, image_url=f"/files/{new_image_id}{file_ext}"
+            ),
         )
+    except HTTPException:
+        raise
     except Exception as e:
         return ImageOperationResponse(
             success=False,
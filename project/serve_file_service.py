@@ -0,0 +1,310 @@
+import os
+from typing import Optional
+
+import prisma
+import prisma.enums
+import prisma.models
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from project.crop_image_service import crop_to_file
+from project.derivative_cache import derivative_cache, derivative_key
+from project.file_serving import file_response
+from project.image_encoding import (
+    FORMAT_EXTENSIONS,
+    FORMAT_MEDIA_TYPES,
+    EncoderOptions,
+    negotiate_format,
+    resolve_output_format,
+)
+from project.image_executor import run_image_task
+from project.record_cache import get_image_file
+from project.resize_image_service import (
+    MAX_TRANSFORM_DIMENSION,
+    REDUCING_GAP,
+    RESAMPLE_FILTERS,
+    CropParameters,
+    ResampleFilter,
+    ResizeMode,
+    link_or_copy,
+    rasterize_to_file,
+    rendition_source,
+    resize_tile_region,
+    resize_to_file,
+)
+from project.single_flight import SingleFlight
+from project.storage import storage
+from project.svg_rasterizer import svg_size
+from project.tiles import crop_from_tiles, resize_from_tiles, tile_region
+from starlette.responses import Response
+
+SVG_CONTENT_SECURITY_POLICY = "default-src 'none'; style-src 'unsafe-inline'; sandbox"
+
+_renders = SingleFlight()
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _parse_crop(crop: Optional[str]) -> Optional[CropParameters]:
+    if crop is None:
+        return None
+    try:
+        x, y, width, height = (int(value) for value in crop.split(","))
+    except ValueError:
+        raise _bad_request("crop must be x,y,width,height.")
+    if width <= 0 or height <= 0:
+        raise _bad_request("Crop width and height must be positive.")
+    if width > MAX_TRANSFORM_DIMENSION or height > MAX_TRANSFORM_DIMENSION:
+        raise _bad_request(
+            f"Crop width and height must be at most {MAX_TRANSFORM_DIMENSION}."
+        )
+    return CropParameters(start_x=x, start_y=y, crop_width=width, crop_height=height)
+
+
+def _transform_parameters(
+    width: Optional[int],
+    height: Optional[int],
+    fit: Optional[ResizeMode],
+    fmt: Optional[str],
+    crop: Optional[CropParameters],
+    encoder: Optional[EncoderOptions],
+    stored_format: str,
+    accept: Optional[str],
+) -> dict:
+    """
+    Validates transform query parameters and normalizes them, so equivalent URLs share
+    one cache entry. `fmt=auto` is resolved here from the Accept header.
+    """
+    for name, value in (("w", width), ("h", height)):
+        if value is not None and not 0 < value <= MAX_TRANSFORM_DIMENSION:
+            raise _bad_request(
+                f"{name} must be between 1 and {MAX_TRANSFORM_DIMENSION}."
+            )
+    fit = fit or ResizeMode.FIT
+    if (width is None or height is None) and (width, height) != (None, None):
+        if fit != ResizeMode.FIT:
+            raise _bad_request(f"fit={fit.value} needs both w and h.")
+        # Fitting within a single bound: the other side is only capped.
+        width = width or MAX_TRANSFORM_DIMENSION
+        height = height or MAX_TRANSFORM_DIMENSION
+    try:
+        image_format = resolve_output_format(None, stored_format)
+        if fmt is not None and fmt.lower() == "auto":
+            image_format = negotiate_format(accept, image_format)
+        elif fmt is not None:
+            image_format = resolve_output_format(fmt, stored_format)
+    except ValueError as e:
+        raise _bad_request(str(e))
+    return {
+        "w": width,
+        "h": height,
+        "fit": fit.value if width is not None else None,
+        "fmt": image_format,
+        "crop": crop.dict() if crop is not None else None,
+        "encoder": encoder.dict() if encoder is not None else None,
+    }
+
+
+async def _render_transform(
+    image_record: prisma.models.ImageFile, parameters: dict, cache_key: str
+) -> str:
+    """
+    Renders a transform into the derivative cache, reusing the crop and resize code
+    paths, and returns the cached path.
+    """
+    image_format = parameters["fmt"]
+    dest_path = derivative_cache.path_for(cache_key, FORMAT_EXTENSIONS[image_format])
+    crop = (
+        CropParameters(**parameters["crop"]) if parameters["crop"] is not None else None
+    )
+    encoder = (
+        EncoderOptions(**parameters["encoder"])
+        if parameters["encoder"] is not None
+        else None
+    )
+    if image_record.format == prisma.enums.ImageFormat.SVG:
+        source_path = await storage.fetch(image_record.storagePath)
+        width, height = parameters["w"], parameters["h"]
+        mode = ResizeMode(parameters["fit"] or ResizeMode.EXACT)
+        if width is None and crop is not None:
+            width, height = crop.crop_width, crop.crop_height
+        elif width is None:
+            width, height = await run_in_threadpool(svg_size, source_path)
+        await run_image_task(
+            rasterize_to_file,
+            source_path,
+            dest_path,
+            width,
+            height,
+            crop,
+            mode,
+            image_format,
+            encoder,
+        )
+    elif parameters["w"] is None:
+        box, region = None, None
+        if crop is not None:
+            box = (
+                crop.start_x,
+                crop.start_y,
+                crop.start_x + crop.crop_width,
+                crop.start_y + crop.crop_height,
+            )
+            region = await tile_region(image_record, box)
+        if region is not None:
+            await run_image_task(
+                crop_from_tiles, region, dest_path, image_format, encoder
+            )
+        else:
+            await run_image_task(
+                crop_to_file,
+                await storage.fetch(image_record.storagePath),
+                box,
+                dest_path,
+                image_format,
+                encoder,
+            )
+    else:
+        width, height = parameters["w"], parameters["h"]
+        mode = ResizeMode(parameters["fit"])
+        source_key, is_exact = image_record.storagePath, False
+        if crop is None:
+            source_key, is_exact = await rendition_source(
+                image_record, width, height, mode
+            )
+        tiled = None
+        if source_key == image_record.storagePath:
+            tiled = await resize_tile_region(image_record, width, height, crop, mode)
+        if tiled is not None:
+            region, target = tiled
+            await run_image_task(
+                resize_from_tiles,
+                region,
+                dest_path,
+                target,
+                RESAMPLE_FILTERS[ResampleFilter.LANCZOS],
+                REDUCING_GAP,
+                image_format,
+                encoder,
+            )
+        elif is_exact and encoder is None and image_format == image_record.format:
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            await run_in_threadpool(
+                link_or_copy, await storage.fetch(source_key), dest_path
+            )
+        else:
+            await run_image_task(
+                resize_to_file,
+                await storage.fetch(source_key),
+                dest_path,
+                width,
+                height,
+                crop,
+                mode,
+                ResampleFilter.LANCZOS,
+                image_format,
+                encoder,
+            )
+    derivative_cache.put(cache_key, dest_path)
+    return dest_path
+
+
+async def serve_file(
+    file_name: str,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[str] = None,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    fit: Optional[ResizeMode] = None,
+    fmt: Optional[str] = None,
+    crop: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+    accept: Optional[str] = None,
+) -> Response:
+    """
+    Endpoint for downloading a stored image by the URL returned from upload or manipulation endpoints.
+
+    Stored images are never modified after they are written, so responses carry a strong
+    ETag and a long-lived immutable Cache-Control, and conditional requests are answered
+    with 304 without touching the file.
+
+    With any of `w`, `h`, `fmt`, `crop` or encoder options the URL names a transform of
+    the image instead. It is rendered on the first request into the derivative cache and
+    served from there afterwards; concurrent first requests for the same transform share
+    a single render. SVG sources are rasterized directly at the requested size. Transform
+    URLs are just as immutable, so a CDN in front can cache them indefinitely; with
+    `fmt=auto` the response varies on Accept.
+
+    Args:
+        file_name (str): The file name from the image URL, i.e. the image ID with an optional extension.
+        range_header (Optional[str]): The Range request header; a single byte range is honoured with a 206.
+        if_range (Optional[str]): The If-Range request header; the range is only honoured if it matches the ETag.
+        if_none_match (Optional[str]): The If-None-Match request header.
+        if_modified_since (Optional[str]): The If-Modified-Since request header, ignored when If-None-Match is present.
+        width (Optional[int]): Transform: the output width. With only one of width and height the image is fit to it.
+        height (Optional[int]): Transform: the output height.
+        fit (Optional[ResizeMode]): Transform: how width and height are applied, as for /image/resize. Defaults to fit.
+        fmt (Optional[str]): Transform: the output format, one of jpeg, png, webp or avif, or auto for the smallest
+        one the Accept header lists. Defaults to the source format.
+        crop (Optional[str]): Transform: a region "x,y,width,height" of the source to crop before resizing.
+        encoder (Optional[EncoderOptions]): Transform: quality, lossless and effort settings for the encoder.
+        accept (Optional[str]): The Accept request header, used by fmt=auto.
+
+    Returns:
+        Response: The file contents, a byte range of them, or an empty 304/416 response.
+    """
+    image_id = file_name.split(".", 1)[0]
+    image_record = await get_image_file(image_id)
+    if image_record is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
+    path, content_hash, media_type = None, image_record.contentHash, None
+    extra_headers = {}
+    if image_record.format == prisma.enums.ImageFormat.SVG:
+        # Uploaded SVGs can carry scripts; never let one run in this origin.
+        extra_headers["content-security-policy"] = SVG_CONTENT_SECURITY_POLICY
+    if any(value is not None for value in (width, height, fmt, crop, encoder)):
+        parameters = _transform_parameters(
+            width,
+            height,
+            fit,
+            fmt,
+            _parse_crop(crop),
+            encoder,
+            image_record.format.value,
+            accept,
+        )
+        extra_headers = {}
+        if fmt is not None and fmt.lower() == "auto":
+            extra_headers["vary"] = "Accept"
+        cache_key = derivative_key(image_id, "TRANSFORM", parameters)
+        path = derivative_cache.get(cache_key)
+        if path is None:
+            try:
+                path = await _renders.do(
+                    cache_key, _render_transform, image_record, parameters, cache_key
+                )
+            except FileNotFoundError:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="Not found"
+                )
+            except ValueError as e:
+                raise _bad_request(f"Cannot transform image: {e}")
+        content_hash, media_type = None, FORMAT_MEDIA_TYPES[parameters["fmt"]]
+    try:
+        if path is None:
+            path = await storage.fetch(image_record.storagePath)
+        return await file_response(
+            path,
+            content_hash,
+            range_header,
+            if_range,
+            if_none_match,
+            if_modified_since,
+            media_type,
+            extra_headers,
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not found")
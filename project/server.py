@@ -4,29 +4,81 @@ from typing import Optional
 
 import prisma
 import prisma.enums
+import project.adjust_images_service
+import project.auth
+import project.batch_job_service
 import project.crop_image_service
+import project.delete_image_service
+import project.image_encoding
+import project.image_pipeline_service
 import project.login_user_service
 import project.logout_user_service
+import project.metrics
 import project.register_user_service
 import project.resize_image_service
+import project.serve_file_service
 import project.update_user_profile_service
 import project.upgrade_subscription_service
 import project.upload_image_service
+import project.view_cache_stats_service
+import project.view_executor_stats_service
+import project.view_record_cache_stats_service
 import project.view_subscription_service
-from fastapi import FastAPI, UploadFile
+from fastapi import (
+    BackgroundTasks,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    UploadFile,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import Response
-from prisma import Prisma
+from project.audit_log import audit_log
+from project.auth import denylist_sync
+from project.batch_worker import batch_worker
+from project.derivative_cache import derivative_cache
+from project.image_executor import image_executor
+from project.metrics import ExecutorCollector, InstrumentedPrisma, MetricsMiddleware
+from project.password_hashing import password_executor
+from project.record_cache import RequestCacheMiddleware
+from project.sessions import session_sweeper
+from project.storage import storage
+from project.workers import check_connection_budget, pooled_database_url
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
+# Each worker process gets its share of the database's connections.
+database_url = pooled_database_url()
+
+db_client = InstrumentedPrisma(
+    auto_register=True,
+    datasource={"url": database_url} if database_url else None,
+)
+
+project.metrics.register_collector(
+    ExecutorCollector([image_executor, password_executor])
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await db_client.connect()
+    await check_connection_budget(db_client)
+    await run_in_threadpool(derivative_cache.load)
+    await run_in_threadpool(storage.load)
+    audit_log.start()
+    batch_worker.start()
+    denylist_sync.start()
+    session_sweeper.start()
     yield
+    await session_sweeper.stop()
+    await denylist_sync.stop()
+    await batch_worker.stop()
+    await audit_log.stop()
+    image_executor.shutdown()
+    password_executor.shutdown()
     await db_client.disconnect()
 
 
@@ -36,17 +88,43 @@ app = FastAPI(
     description="Based on the understood requirements and prior information gathered through the interview and search process, the solution involves developing an image processing application. The core functionality of this application includes accepting an image file from the user, resizing the image to fit within specified dimensions and optionally cropping it to maintain the aspect ratio, and finally returning the resized image file to the user. The preferences for supporting PNG and SVG formats are noted, ensuring versatility and scalability in image handling. Maintaining the aspect ratio during resizing is essential for preserving the image's original visual integrity, as highlighted by the user. Additional features such as adjusting brightness and contrast, applying filters, and performing rotation and flipping have been considered to enhance the visual appeal and suitability of images for various contexts.\n\nThe tech stack recommended for this project includes Python as the programming language, known for its robust libraries and frameworks for image processing tasks. The PIL (Python Imaging Library) or its more updated fork, Pillow, will be utilized for the core image manipulation tasks, such as resizing, cropping, and applying additional visual adjustments as per the user's requirements. These libraries offer built-in functions to handle aspect ratio calculations, interpolation methods, and format-specific settings, aligning with the best practices identified during the research phase.\n\nFor the backend API, FastAPI is chosen for its performance and ease of building async APIs that can handle file uploads and processing efficiently. PostgreSQL will serve as the database to manage user sessions or stored images if needed, with Prisma as the ORM for seamless integration and database management. FastAPI's ability to work asynchronously fits well with the potentially resource-intensive nature of image processing, ensuring the application remains responsive.\n\nThe application will provide endpoints allowing users to upload images, specify desired dimensions (and optionally request cropping), and receive the processed image. This setup aims to offer a user-friendly, efficient, and scalable solution to image resizing and manipulation needs.",
 )
 
+app.add_middleware(RequestCacheMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def api_get_metrics() -> Response:
+    """
+    Endpoint for Prometheus to scrape request, image phase, executor and database metrics
+    """
+    try:
+        return Response(
+            content=project.metrics.render_metrics(),
+            media_type=project.metrics.METRICS_CONTENT_TYPE,
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
 
 @app.post("/auth/logout", response_model=project.logout_user_service.LogoutUserResponse)
 async def api_post_logout_user(
-    auth_token: str,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.logout_user_service.LogoutUserResponse | Response:
     """
     Endpoint to logout a user, invalidating their current session
     """
     try:
-        res = await project.logout_user_service.logout_user(auth_token)
+        res = await project.logout_user_service.logout_user(user)
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -63,19 +141,21 @@ async def api_post_logout_user(
     response_model=project.update_user_profile_service.UpdateUserProfileResponse,
 )
 async def api_put_update_user_profile(
-    user_id: str,
     email: Optional[str],
     password: Optional[str],
     subscription_type: Optional[str],
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.update_user_profile_service.UpdateUserProfileResponse | Response:
     """
     Endpoint for users to update their profile information
     """
     try:
         res = await project.update_user_profile_service.update_user_profile(
-            user_id, email, password, subscription_type
+            user.id, email, password, subscription_type
         )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -97,6 +177,8 @@ async def api_post_login_user(
     try:
         res = await project.login_user_service.login_user(email, password)
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -112,14 +194,21 @@ async def api_post_login_user(
     "/image/upload", response_model=project.upload_image_service.UploadImageResponse
 )
 async def api_post_upload_image(
-    image: UploadFile, format: Optional[str], user_id: str
+    image: UploadFile,
+    format: Optional[str],
+    background_tasks: BackgroundTasks,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.upload_image_service.UploadImageResponse | Response:
     """
     Endpoint to allow users to upload images
     """
     try:
-        res = await project.upload_image_service.upload_image(image, format, user_id)
+        res = await project.upload_image_service.upload_image(
+            image, format, user.id, background_tasks
+        )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -136,16 +225,19 @@ async def api_post_upload_image(
     response_model=project.upgrade_subscription_service.UpgradeSubscriptionResponse,
 )
 async def api_post_upgrade_subscription(
-    user_id: str, new_subscription_type: prisma.enums.SubscriptionType
+    new_subscription_type: prisma.enums.SubscriptionType,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.upgrade_subscription_service.UpgradeSubscriptionResponse | Response:
     """
     Endpoint for users to upgrade their subscription level
     """
     try:
         res = await project.upgrade_subscription_service.upgrade_subscription(
-            user_id, new_subscription_type
+            user.id, new_subscription_type
         )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -162,13 +254,13 @@ async def api_post_upgrade_subscription(
     response_model=project.view_subscription_service.ViewSubscriptionResponse,
 )
 async def api_get_view_subscription(
-    user_id: str,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.view_subscription_service.ViewSubscriptionResponse | Response:
     """
     Endpoint for users to view their current subscription details
     """
     try:
-        res = await project.view_subscription_service.view_subscription(user_id)
+        res = await project.view_subscription_service.view_subscription(user.id)
         return res
     except Exception as e:
         logger.exception("Error processing request")
@@ -188,16 +280,33 @@ async def api_post_resize_image(
     image_id: str,
     width: int,
     height: int,
-    crop: project.resize_image_service.CropParameters,
+    crop: Optional[project.resize_image_service.CropParameters] = None,
+    mode: project.resize_image_service.ResizeMode = project.resize_image_service.ResizeMode.FIT,
+    resample: project.resize_image_service.ResampleFilter = project.resize_image_service.ResampleFilter.LANCZOS,
+    output_format: Optional[str] = None,
+    encoder: Optional[project.image_encoding.EncoderOptions] = Depends(
+        project.image_encoding.encoder_options
+    ),
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.resize_image_service.ImageOperationResponse | Response:
     """
     Endpoint for resizing an uploaded image
     """
     try:
         res = await project.resize_image_service.resize_image(
-            image_id, width, height, crop
+            user.id,
+            image_id,
+            width,
+            height,
+            crop,
+            mode,
+            resample,
+            output_format,
+            encoder,
         )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -223,6 +332,8 @@ async def api_post_register_user(
             email, username, password
         )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
@@ -236,14 +347,290 @@ async def api_post_register_user(
 
 @app.post("/image/crop", response_model=project.crop_image_service.CropImageResponse)
 async def api_post_crop_image(
-    image_id: str, x: int, y: int, width: int, height: int
+    image_id: str,
+    x: int,
+    y: int,
+    width: int,
+    height: int,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
 ) -> project.crop_image_service.CropImageResponse | Response:
     """
     Endpoint for cropping an uploaded image
     """
     try:
-        res = await project.crop_image_service.crop_image(image_id, x, y, width, height)
+        res = await project.crop_image_service.crop_image(
+            user.id, image_id, x, y, width, height
+        )
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.delete(
+    "/image/delete", response_model=project.delete_image_service.DeleteImageResponse
+)
+async def api_delete_image(
+    image_id: str,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
+) -> project.delete_image_service.DeleteImageResponse | Response:
+    """
+    Endpoint for deleting an uploaded image
+    """
+    try:
+        res = await project.delete_image_service.delete_image(user.id, image_id)
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/executors/stats",
+    response_model=list[project.view_executor_stats_service.ExecutorStats],
+)
+async def api_get_view_executor_stats() -> (
+    list[project.view_executor_stats_service.ExecutorStats] | Response
+):
+    """
+    Endpoint for viewing the load and queue length of the bounded worker pools
+    """
+    try:
+        res = await project.view_executor_stats_service.view_executor_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/image/cache/stats",
+    response_model=project.view_cache_stats_service.DerivativeCacheStats,
+)
+async def api_get_view_cache_stats() -> (
+    project.view_cache_stats_service.DerivativeCacheStats | Response
+):
+    """
+    Endpoint for viewing derivative cache hit/miss counters and size
+    """
+    try:
+        res = await project.view_cache_stats_service.view_cache_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/cache/records/stats",
+    response_model=list[project.view_record_cache_stats_service.RecordCacheStats],
+)
+async def api_get_view_record_cache_stats() -> (
+    list[project.view_record_cache_stats_service.RecordCacheStats] | Response
+):
+    """
+    Endpoint for viewing hit/miss counters of the database record caches
+    """
+    try:
+        res = await project.view_record_cache_stats_service.view_record_cache_stats()
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/image/pipeline", response_model=project.image_pipeline_service.PipelineResponse
+)
+async def api_post_image_pipeline(
+    image_id: str,
+    operations: list[project.image_pipeline_service.PipelineOperation],
+    output_format: Optional[str] = None,
+    encoder: Optional[project.image_encoding.EncoderOptions] = Depends(
+        project.image_encoding.encoder_options
+    ),
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
+) -> project.image_pipeline_service.PipelineResponse | Response:
+    """
+    Endpoint for applying an ordered list of manipulations to an image in one pass
+    """
+    try:
+        res = await project.image_pipeline_service.run_pipeline(
+            user.id, image_id, operations, output_format, encoder
+        )
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/image/adjust/batch",
+    response_model=project.adjust_images_service.BatchAdjustResponse,
+)
+async def api_post_adjust_images(
+    image_ids: list[str],
+    operations: list[project.image_pipeline_service.PipelineOperation],
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
+) -> project.adjust_images_service.BatchAdjustResponse | Response:
+    """
+    Endpoint for applying the same brightness, contrast and invert adjustments to many images in one call
+    """
+    try:
+        res = await project.adjust_images_service.adjust_images(
+            user.id, image_ids, operations
+        )
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.post(
+    "/image/batch", response_model=project.batch_job_service.CreateBatchJobResponse
+)
+async def api_post_create_batch_job(
+    image_ids: list[str],
+    operations: list[project.image_pipeline_service.PipelineOperation],
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
+) -> project.batch_job_service.CreateBatchJobResponse | Response:
+    """
+    Endpoint for queueing the same pipeline of operations over many images
+    """
+    try:
+        res = await project.batch_job_service.create_batch_job(
+            user.id, image_ids, operations
+        )
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get(
+    "/image/batch/{job_id}",
+    response_model=project.batch_job_service.BatchJobStatusResponse,
+)
+async def api_get_view_batch_job(
+    job_id: str,
+    user: project.auth.AuthenticatedUser = Depends(project.auth.authenticated_user),
+) -> project.batch_job_service.BatchJobStatusResponse | Response:
+    """
+    Endpoint for polling the status, progress and partial results of a batch job
+    """
+    try:
+        res = await project.batch_job_service.view_batch_job(user.id, job_id)
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        res = dict()
+        res["error"] = str(e)
+        return Response(
+            content=jsonable_encoder(res),
+            status_code=500,
+            media_type="application/json",
+        )
+
+
+@app.get("/files/{file_name}")
+async def api_get_serve_file(
+    file_name: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    w: Optional[int] = None,
+    h: Optional[int] = None,
+    fit: Optional[project.resize_image_service.ResizeMode] = None,
+    fmt: Optional[str] = None,
+    crop: Optional[str] = None,
+    encoder: Optional[project.image_encoding.EncoderOptions] = Depends(
+        project.image_encoding.encoder_options
+    ),
+    accept: Optional[str] = Header(None),
+) -> Response:
+    """
+    Endpoint for downloading a stored image by the URL returned from upload or manipulation endpoints,
+    optionally transformed on the fly, e.g. /files/{id}?w=256&h=256&fit=fill&fmt=auto&quality=75
+    """
+    try:
+        res = await project.serve_file_service.serve_file(
+            file_name,
+            range,
+            if_range,
+            if_none_match,
+            if_modified_since,
+            w,
+            h,
+            fit,
+            fmt,
+            crop,
+            encoder,
+            accept,
+        )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
         res = dict()
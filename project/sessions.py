@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+import prisma
+import prisma.models
+
+logger = logging.getLogger(__name__)
+
+SESSION_SWEEP_INTERVAL = float(os.environ.get("SESSION_SWEEP_INTERVAL", "300"))
+
+
+def token_hash(token: str) -> str:
+    """
+    The key sessions are stored under; tokens themselves are never written to the database.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def create_session(user_id: str, token: str, expires_at: datetime) -> None:
+    await prisma.models.Session.prisma().create(
+        data={
+            "tokenHash": token_hash(token),
+            "userId": user_id,
+            "expiresAt": expires_at,
+        }
+    )
+
+
+async def end_session(hashed_token: str) -> bool:
+    """
+    Deletes the session of a token by its hash, a single unique-index lookup.
+
+    Returns:
+        bool: Whether a session was found.
+    """
+    return bool(
+        await prisma.models.Session.prisma().delete_many(
+            where={"tokenHash": hashed_token}
+        )
+    )
+
+
+class SessionSweeper:
+    """
+    Deletes expired sessions in bulk every SESSION_SWEEP_INTERVAL seconds, so the
+    Session table only holds live sessions and sessions that were never logged out do
+    not accumulate.
+    """
+
+    def __init__(self, interval: float = SESSION_SWEEP_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Error sweeping expired sessions")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> int:
+        deleted = await prisma.models.Session.prisma().delete_many(
+            where={"expiresAt": {"lte": datetime.now(timezone.utc)}}
+        )
+        if deleted:
+            logger.info("Swept %d expired sessions", deleted)
+        return deleted
+
+
+session_sweeper = SessionSweeper()
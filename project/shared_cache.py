@@ -0,0 +1,233 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# File backing the table; on tmpfs (/dev/shm) it never touches a disk. Empty disables
+# the shared table, so every process keeps its own record caches. `python -m
+# project.workers` sets it when serving with more than one worker.
+SHARED_CACHE_PATH = os.environ.get("SHARED_CACHE_PATH", "")
+
+SHARED_CACHE_SLOTS = int(os.environ.get("SHARED_CACHE_SLOTS", "16384"))
+
+# Records whose serialized form does not fit in a slot are not shared.
+SHARED_CACHE_SLOT_BYTES = int(os.environ.get("SHARED_CACHE_SLOT_BYTES", "2048"))
+
+_MAGIC = b"SHMCACH1"
+
+# magic, slot count, slot size
+_HEADER = struct.Struct("<8sQQ")
+
+_HEADER_BYTES = 64
+
+# seq, expires at (epoch seconds), generation, namespace tag, key digest, payload length
+_SLOT = struct.Struct("<QdII16sI")
+
+_SLOT_HEADER_BYTES = 48
+
+_SEQ = struct.Struct("<Q")
+
+# Slots a key may occupy; a write replaces the one that expires first.
+_WAYS = 4
+
+_READ_ATTEMPTS = 8
+
+
+class SharedCacheTable:
+    """
+    A fixed-size hash table of byte strings in a memory-mapped file, shared by every
+    process on the host that maps the same path.
+
+    Each key hashes to a set of `_WAYS` slots. Readers never lock: every slot carries a
+    sequence number that a writer makes odd while it rewrites the slot and even again
+    when it is done, and a reader retries if the number was odd or changed while it
+    copied the slot. Writers serialize on an exclusive flock of the file, which is held
+    only for the few microseconds of a slot update.
+
+    Invalidating a key leaves a tombstone with a bumped generation. A process that
+    misses remembers the generation it saw and `put` refuses to store its value if the
+    key was invalidated meanwhile, so a value read from the database before a write in
+    another process cannot overwrite the invalidation.
+    """
+
+    def __init__(
+        self,
+        path: str = SHARED_CACHE_PATH,
+        slots: int = SHARED_CACHE_SLOTS,
+        slot_bytes: int = SHARED_CACHE_SLOT_BYTES,
+    ):
+        self.path = path
+        self.slots = max(_WAYS, slots - slots % _WAYS)
+        self.slot_bytes = max(slot_bytes, _SLOT_HEADER_BYTES + 64)
+        self.capacity = self.slot_bytes - _SLOT_HEADER_BYTES
+        size = _HEADER_BYTES + self.slots * self.slot_bytes
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            header = os.pread(self._fd, _HEADER.size, 0)
+            if len(header) < _HEADER.size or _HEADER.unpack(header) != (
+                _MAGIC,
+                self.slots,
+                self.slot_bytes,
+            ):
+                # New file, or one laid out differently: start over with empty slots.
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, size)
+                os.pwrite(
+                    self._fd, _HEADER.pack(_MAGIC, self.slots, self.slot_bytes), 0
+                )
+        self._map = mmap.mmap(self._fd, size)
+
+    @staticmethod
+    def tag(namespace: str) -> int:
+        return zlib.crc32(namespace.encode("utf-8"))
+
+    @staticmethod
+    def digest(namespace: str, key: str) -> bytes:
+        return hashlib.blake2b(
+            f"{namespace}\0{key}".encode("utf-8"), digest_size=16
+        ).digest()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offsets(self, digest: bytes) -> list[int]:
+        first = int.from_bytes(digest[:8], "little") % (self.slots // _WAYS) * _WAYS
+        return [
+            _HEADER_BYTES + (first + way) * self.slot_bytes for way in range(_WAYS)
+        ]
+
+    def _read(self, offset: int) -> Optional[tuple[float, int, int, bytes, bytes]]:
+        """
+        Copies a consistent snapshot of a slot, or returns None if writers kept it busy.
+        """
+        for _ in range(_READ_ATTEMPTS):
+            seq, expires, generation, tag, digest, length = _SLOT.unpack_from(
+                self._map, offset
+            )
+            if seq & 1:
+                continue
+            start = offset + _SLOT_HEADER_BYTES
+            payload = self._map[start : start + min(length, self.capacity)]
+            if _SEQ.unpack_from(self._map, offset)[0] == seq:
+                return expires, generation, tag, digest, payload
+        return None
+
+    def get(self, namespace: str, key: str) -> tuple[Optional[bytes], int]:
+        """
+        Returns the live value stored under `key` (or None) and the key's generation, to
+        be passed back to `put` after loading the value on a miss.
+        """
+        digest = self.digest(namespace, key)
+        for offset in self._offsets(digest):
+            slot = self._read(offset)
+            if slot is None or slot[3] != digest:
+                continue
+            expires, generation, _, _, payload = slot
+            if payload and expires > time.time():
+                return payload, generation
+            return None, generation
+        return None, 0
+
+    def _slot_for(self, digest: bytes) -> tuple[int, bool]:
+        """
+        The slot holding `digest`, or else the one to replace for it, and whether the
+        slot already holds `digest`. Called with the lock held.
+        """
+        victim, victim_expires = 0, float("inf")
+        for offset in self._offsets(digest):
+            seq, expires, _, _, slot_digest, _ = _SLOT.unpack_from(self._map, offset)
+            if slot_digest == digest:
+                return offset, True
+            if seq == 0:
+                expires = float("-inf")
+            if expires < victim_expires:
+                victim, victim_expires = offset, expires
+        return victim, False
+
+    def _write(
+        self,
+        offset: int,
+        expires: float,
+        generation: int,
+        tag: int,
+        digest: bytes,
+        payload: bytes,
+    ) -> None:
+        seq = _SEQ.unpack_from(self._map, offset)[0]
+        _SEQ.pack_into(self._map, offset, seq + 1)
+        self._map[
+            offset + _SLOT_HEADER_BYTES : offset + _SLOT_HEADER_BYTES + len(payload)
+        ] = payload
+        _SLOT.pack_into(
+            self._map, offset, seq + 1, expires, generation, tag, digest, len(payload)
+        )
+        _SEQ.pack_into(self._map, offset, seq + 2)
+
+    def put(
+        self, namespace: str, key: str, payload: bytes, ttl: float, generation: int
+    ) -> tuple[bool, bool]:
+        """
+        Stores `payload` under `key` for `ttl` seconds, unless the key was invalidated
+        since `get` returned `generation` or the payload does not fit in a slot.
+
+        Returns:
+            tuple[bool, bool]: Whether the value was stored, and whether another live entry was evicted for it.
+        """
+        if not payload or len(payload) > self.capacity:
+            return False, False
+        digest = self.digest(namespace, key)
+        now = time.time()
+        with self._locked():
+            offset, found = self._slot_for(digest)
+            _, expires, current, _, _, length = _SLOT.unpack_from(self._map, offset)
+            if (current if found else 0) != generation:
+                return False, False
+            evicted = not found and length > 0 and expires > now
+            self._write(
+                offset, now + ttl, generation, self.tag(namespace), digest, payload
+            )
+        return True, evicted
+
+    def invalidate(self, namespace: str, key: str, ttl: float) -> None:
+        """
+        Drops the value stored under `key` in every process. The tombstone lives for
+        `ttl` seconds, as long as any load that raced with the invalidation could.
+        """
+        digest = self.digest(namespace, key)
+        with self._locked():
+            offset, found = self._slot_for(digest)
+            generation = _SLOT.unpack_from(self._map, offset)[2] if found else 0
+            self._write(
+                offset,
+                time.time() + ttl,
+                (generation + 1) & 0xFFFFFFFF,
+                self.tag(namespace),
+                digest,
+                b"",
+            )
+
+    def count(self, namespace: str) -> int:
+        """
+        The number of live values in `namespace`, by a scan of every slot.
+        """
+        tag, now, live = self.tag(namespace), time.time(), 0
+        for index in range(self.slots):
+            _, expires, _, slot_tag, _, length = _SLOT.unpack_from(
+                self._map, _HEADER_BYTES + index * self.slot_bytes
+            )
+            if slot_tag == tag and length > 0 and expires > now:
+                live += 1
+        return live
+
+
+shared_cache = SharedCacheTable() if SHARED_CACHE_PATH else None
@@ -0,0 +1,43 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single execution.
+
+    The first caller for a key starts the work; callers arriving while it is in flight
+    await the same result instead of starting their own, so a burst of identical cache
+    misses does the work once. The key is forgotten as soon as the work finishes, so
+    results are never cached here.
+    """
+
+    def __init__(self):
+        self._flights: dict[str, asyncio.Future] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(
+        self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any
+    ) -> Any:
+        """
+        Runs `fn(*args, **kwargs)` unless a call for `key` is already running, and
+        returns (or raises) its result either way.
+
+        A caller that is cancelled stops waiting without cancelling the shared work, so
+        the other waiters still get the result.
+        """
+        future = self._flights.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn(*args, **kwargs))
+            self._flights[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        self._flights.pop(key, None)
+        if not future.cancelled():
+            # Marks the exception as retrieved even if every waiter was cancelled.
+            future.exception()
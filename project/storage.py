@@ -0,0 +1,296 @@
+import abc
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+from project.derivative_cache import DerivativeCache
+from project.image_encoding import atomic_output
+from project.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "local").lower()
+
+# Local backend: keys (ImageFile.storagePath etc.) are paths relative to this directory.
+STORAGE_LOCAL_ROOT = os.environ.get("STORAGE_LOCAL_ROOT", ".")
+
+# S3 backend: read-through cache of downloaded objects on this replica's disk.
+STORAGE_CACHE_DIR = os.environ.get(
+    "STORAGE_CACHE_DIR",
+    os.path.join(os.environ.get("UPLOAD_DIR", "uploads"), "storage-cache"),
+)
+
+STORAGE_CACHE_MAX_BYTES = int(
+    os.environ.get("STORAGE_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+)
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+
+# Set for S3-compatible services such as MinIO, e.g. "http://localhost:9000".
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+
+S3_REGION = os.environ.get("S3_REGION") or None
+
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", "32"))
+
+S3_MULTIPART_THRESHOLD = int(
+    os.environ.get("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024))
+)
+
+S3_MULTIPART_CHUNK_SIZE = int(
+    os.environ.get("S3_MULTIPART_CHUNK_SIZE", str(8 * 1024 * 1024))
+)
+
+S3_TRANSFER_CONCURRENCY = int(os.environ.get("S3_TRANSFER_CONCURRENCY", "4"))
+
+S3_AVAILABLE = importlib.util.find_spec("boto3") is not None
+
+
+class Storage(abc.ABC):
+    """
+    Where stored images, renditions, tiles and pipeline results live, addressed by key
+    (usually the `storagePath` of their database row).
+
+    Image code only ever works on local files: it asks `fetch` for a local copy of a key
+    to read, writes new files to `staging_path(key)`, and hands them over with `store`.
+    Backends decide what those mean, so replicas can share a bucket instead of a disk.
+
+    Cached derivatives (crops and on-the-fly transforms) are not stored here: they stay
+    in each replica's local derivative cache and are recomputed from stored objects on a
+    miss.
+    """
+
+    @abc.abstractmethod
+    def staging_path(self, key: str) -> str:
+        """
+        Returns the local path a new object for `key` should be written to before `store`.
+        """
+
+    @abc.abstractmethod
+    async def store(self, local_path: str, key: str) -> None:
+        """
+        Makes a finished local file the object for `key`. The file may be moved.
+        """
+
+    @abc.abstractmethod
+    async def fetch(self, key: str) -> str:
+        """
+        Returns the path of a local file holding the object for `key`.
+
+        Raises:
+            FileNotFoundError: If there is no such object.
+        """
+
+    @abc.abstractmethod
+    async def exists(self, key: str) -> bool:
+        """
+        Returns whether there is an object for `key`.
+        """
+
+    @abc.abstractmethod
+    async def delete(self, key: str) -> None:
+        """
+        Deletes the object for `key`, if there is one.
+        """
+
+    def load(self) -> None:
+        """
+        Rebuilds any local index the backend keeps; called once at startup.
+        """
+
+
+class LocalStorage(Storage):
+    """
+    Objects are files under `root`, shared by replicas only if `root` is a shared volume.
+    Files are written under a temporary name and renamed into place, so readers never see
+    a partial object, and `fetch` returns the file itself, so downloads keep using
+    sendfile or memory-mapped reads.
+    """
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.normpath(os.path.join(self.root, key))
+
+    def staging_path(self, key: str) -> str:
+        # New files are written in place; save_image already renames them atomically.
+        return self._path(key)
+
+    async def store(self, local_path: str, key: str) -> None:
+        path = self._path(key)
+        if os.path.abspath(local_path) == os.path.abspath(path):
+            return
+        await run_in_threadpool(_move_atomically, local_path, path)
+
+    async def fetch(self, key: str) -> str:
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise FileNotFoundError(key)
+        return path
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _move_atomically(source_path: str, dest_path: str) -> None:
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    try:
+        os.replace(source_path, dest_path)
+    except OSError:
+        # Different filesystems: copy next to the destination, then rename.
+        with atomic_output(dest_path) as partial_path:
+            shutil.copyfile(source_path, partial_path)
+        os.unlink(source_path)
+
+
+class S3Storage(Storage):
+    """
+    Objects live in an S3 bucket (or an S3-compatible service such as MinIO), so every
+    replica sees the same images.
+
+    One boto3 client with a pool of S3_MAX_POOL_CONNECTIONS keep-alive connections is
+    shared by all requests. Files of S3_MULTIPART_THRESHOLD bytes or more are uploaded
+    and downloaded in S3_MULTIPART_CHUNK_SIZE parts, S3_TRANSFER_CONCURRENCY at a time,
+    streaming from and to disk. Fetched objects are kept in a size-bounded local cache;
+    objects are never rewritten under the same key, so cached copies cannot go stale.
+    Concurrent fetches of the same key share one download.
+    """
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        cache_dir: str = STORAGE_CACHE_DIR,
+        cache_max_bytes: int = STORAGE_CACHE_MAX_BYTES,
+    ):
+        if not S3_AVAILABLE:
+            raise ValueError("The S3 storage backend needs the boto3 package.")
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set for the S3 storage backend.")
+        import boto3
+        import boto3.s3.transfer
+        import botocore.config
+
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            config=botocore.config.Config(
+                max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                retries={"mode": "adaptive", "max_attempts": 5},
+            ),
+        )
+        self.transfer_config = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+            max_concurrency=S3_TRANSFER_CONCURRENCY,
+        )
+        self.cache = DerivativeCache(cache_dir, cache_max_bytes)
+        self._downloads = SingleFlight()
+
+    @staticmethod
+    def _cache_key(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _cache_path(self, key: str) -> str:
+        return self.cache.path_for(self._cache_key(key), os.path.splitext(key)[1])
+
+    def load(self) -> None:
+        self.cache.load()
+
+    def staging_path(self, key: str) -> str:
+        # Staged files become the cached copy once uploaded.
+        return self._cache_path(key)
+
+    async def store(self, local_path: str, key: str) -> None:
+        await run_in_threadpool(
+            self.client.upload_file,
+            local_path,
+            self.bucket,
+            key,
+            Config=self.transfer_config,
+        )
+        cache_path = self._cache_path(key)
+        if os.path.abspath(local_path) != os.path.abspath(cache_path):
+            await run_in_threadpool(_move_atomically, local_path, cache_path)
+        self.cache.put(self._cache_key(key), cache_path)
+
+    async def fetch(self, key: str) -> str:
+        path = self.cache.get(self._cache_key(key))
+        if path is not None:
+            return path
+        return await self._downloads.do(key, self._download, key)
+
+    async def _download(self, key: str) -> str:
+        path = self._cache_path(key)
+        try:
+            # Other worker processes may download the same key into the same cache.
+            with atomic_output(path) as partial_path:
+                await run_in_threadpool(
+                    self.client.download_file,
+                    self.bucket,
+                    key,
+                    partial_path,
+                    Config=self.transfer_config,
+                )
+        except Exception as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(key) from e
+            raise
+        self.cache.put(self._cache_key(key), path)
+        return path
+
+    async def exists(self, key: str) -> bool:
+        if self.cache.get(self._cache_key(key)) is not None:
+            return True
+        try:
+            await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except Exception as e:
+            if _is_not_found(e):
+                return False
+            raise
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=key)
+        self.cache.discard(self._cache_key(key))
+
+
+def _is_not_found(error: Exception) -> bool:
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+async def delete_object(key: str) -> None:
+    """
+    Deletes the object for `key`, logging failures instead of raising them, for cleanup
+    after the rows referencing the object are gone. At worst the object is orphaned.
+    """
+    try:
+        await storage.delete(key)
+    except Exception:
+        logger.exception("Error deleting stored object %s", key)
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> Storage:
+    if backend == "local":
+        return LocalStorage()
+    if backend == "s3":
+        return S3Storage()
+    raise ValueError(f"Unsupported storage backend: {backend}")
+
+
+storage = create_storage()
@@ -0,0 +1,173 @@
+import importlib.util
+import io
+import math
+import os
+import re
+import resource
+import subprocess
+import sys
+from typing import Optional
+from xml.etree import ElementTree
+
+from PIL import Image
+
+SVG_RASTER_TIMEOUT = float(os.environ.get("SVG_RASTER_TIMEOUT", "10"))
+
+SVG_RASTER_MEMORY = int(
+    os.environ.get("SVG_RASTER_MEMORY", str(512 * 1024 * 1024))
+)
+
+SVG_MAX_RASTER_PIXELS = int(
+    os.environ.get("SVG_MAX_RASTER_PIXELS", str(50_000_000))
+)
+
+SVG_AVAILABLE = importlib.util.find_spec("cairosvg") is not None
+
+# Browsers size an SVG without width, height or viewBox like any replaced element.
+DEFAULT_SVG_SIZE = (300, 150)
+
+_SVG_HEAD = re.compile(
+    rb"\s*(<\?xml[^>]*>\s*)?(<!--.*?-->\s*)*"
+    rb"(<!DOCTYPE\s+svg[^>]*>\s*)?(<!--.*?-->\s*)*<svg[\s>]",
+    re.DOTALL | re.IGNORECASE,
+)
+
+# CSS absolute units in px.
+_UNITS = {
+    "": 1.0,
+    "px": 1.0,
+    "pt": 4 / 3,
+    "pc": 16.0,
+    "mm": 96 / 25.4,
+    "cm": 96 / 2.54,
+    "in": 96.0,
+}
+
+_LENGTH = re.compile(
+    r"\s*([0-9]*\.?[0-9]+(?:e[-+]?[0-9]+)?)\s*([a-z]*)\s*", re.IGNORECASE
+)
+
+
+def is_svg(head: bytes) -> bool:
+    """
+    Whether the leading bytes of a file are an SVG document.
+    """
+    return _SVG_HEAD.match(head.removeprefix(b"\xef\xbb\xbf")) is not None
+
+
+def _length(value: Optional[str]) -> Optional[float]:
+    match = _LENGTH.fullmatch(value or "")
+    if match is None or match.group(2).lower() not in _UNITS:
+        return None
+    return float(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def svg_size(path: str) -> tuple[int, int]:
+    """
+    Reads the intrinsic size of an SVG from the width, height and viewBox of its root
+    element, without parsing the rest of the document.
+
+    Raises:
+        ValueError: If the file is not an SVG document.
+    """
+    try:
+        _, root = next(ElementTree.iterparse(path, events=("start",)))
+    except (ElementTree.ParseError, StopIteration) as e:
+        raise ValueError("Invalid SVG document") from e
+    if root.tag.rsplit("}", 1)[-1] != "svg":
+        raise ValueError("Invalid SVG document")
+    width, height = _length(root.get("width")), _length(root.get("height"))
+    aspect = None
+    try:
+        _, _, box_width, box_height = (
+            float(value) for value in root.get("viewBox", "").replace(",", " ").split()
+        )
+        if box_width > 0 and box_height > 0:
+            aspect = box_width / box_height
+            if width is None and height is None:
+                width, height = box_width, box_height
+    except ValueError:
+        pass
+    if width is None and height is None:
+        width, height = DEFAULT_SVG_SIZE
+    elif width is None:
+        width = height * aspect if aspect else DEFAULT_SVG_SIZE[0]
+    elif height is None:
+        height = width / aspect if aspect else DEFAULT_SVG_SIZE[1]
+    return max(1, round(width)), max(1, round(height))
+
+
+def rasterize(path: str, size: tuple[int, int]) -> Image.Image:
+    """
+    Renders an SVG to an RGBA image of exactly `size`.
+
+    The vector is drawn at the target scale, so the output is crisp rather than
+    resampled from a bitmap. Rendering happens in a child process limited to
+    SVG_RASTER_MEMORY bytes of address space and killed after SVG_RASTER_TIMEOUT
+    seconds, so a hostile document cannot exhaust the worker; cairosvg's safe mode also
+    refuses external resources and entities.
+
+    Raises:
+        ValueError: If the SVG cannot be rendered within the limits.
+    """
+    if not SVG_AVAILABLE:
+        raise ValueError("SVG rasterization needs the cairosvg package.")
+    if size[0] * size[1] > SVG_MAX_RASTER_PIXELS:
+        raise ValueError(
+            f"Rasterizing at {size[0]}x{size[1]} exceeds the maximum of {SVG_MAX_RASTER_PIXELS} pixels"
+        )
+    intrinsic = svg_size(path)
+    scale = max(size[0] / intrinsic[0], size[1] / intrinsic[1])
+    try:
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                __name__,
+                path,
+                repr(scale),
+                str(SVG_RASTER_MEMORY),
+                str(math.ceil(SVG_RASTER_TIMEOUT)),
+            ],
+            capture_output=True,
+            timeout=SVG_RASTER_TIMEOUT,
+            env={
+                **os.environ,
+                "PYTHONPATH": os.pathsep.join(
+                    [
+                        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        os.environ.get("PYTHONPATH", ""),
+                    ]
+                ),
+            },
+        )
+    except subprocess.TimeoutExpired:
+        raise ValueError("SVG rasterization timed out")
+    if result.returncode != 0:
+        message = result.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise ValueError(
+            f"SVG could not be rasterized: {message[-1] if message else result.returncode}"
+        )
+    raster = Image.open(io.BytesIO(result.stdout))
+    raster.load()
+    raster = raster.convert("RGBA")
+    if raster.size != size:
+        # Non-uniform scaling (or rounding in the renderer): the vector was drawn at the
+        # larger scale, so this only ever shrinks one axis.
+        raster = raster.resize(size, Image.Resampling.LANCZOS)
+    return raster
+
+
+def _main(argv: list[str]) -> None:
+    path, scale, memory, cpu_seconds = argv
+    resource.setrlimit(resource.RLIMIT_AS, (int(memory), int(memory)))
+    resource.setrlimit(resource.RLIMIT_CPU, (int(cpu_seconds), int(cpu_seconds)))
+    import cairosvg
+
+    sys.stdout.buffer.write(
+        cairosvg.svg2png(url=path, scale=float(scale), unsafe=False)
+    )
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1:])
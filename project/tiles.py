@@ -0,0 +1,388 @@
+import asyncio
+import logging
+import math
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import prisma
+import prisma.models
+from fastapi import HTTPException
+from PIL import Image
+from project.image_encoding import EncoderOptions, save_image
+from project.image_executor import run_image_task
+from project.metrics import ImagePhases
+from project.record_cache import blobs, get_blob
+from project.storage import delete_object, storage
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# Uploads of at least this many pixels are also stored as a tile pyramid, which crops
+# and downscales read instead of decoding the whole original. 0 disables tiling.
+TILE_MIN_PIXELS = int(os.environ.get("TILE_MIN_PIXELS", "16000000"))
+
+TILE_SIZE = int(os.environ.get("TILE_SIZE", "512"))
+
+# Tiles fetched from or handed to storage at once.
+TILE_STORAGE_CONCURRENCY = int(os.environ.get("TILE_STORAGE_CONCURRENCY", "16"))
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+
+
+class TileRegion(BaseModel):
+    """
+    The tiles of one pyramid level covering an area of the image, as local files.
+
+    `tiles` are (x, y, path) with the position of each tile within the region; `box` is
+    the requested area in region coordinates. Parts of the region outside the image stay
+    zero, as with `Image.crop`.
+    """
+
+    size: tuple[int, int]
+    tiles: list[tuple[int, int, str]]
+    box: tuple[float, float, float, float]
+    source_format: str
+
+
+def tile_format(storage_path: str) -> str:
+    """
+    JPEG originals are tiled as high-quality JPEG; everything else as lossless PNG.
+    """
+    extension = os.path.splitext(storage_path)[1].lower()
+    return "JPEG" if extension in (".jpg", ".jpeg") else "PNG"
+
+
+def tile_path(storage_path: str, level: int, column: int, row: int) -> str:
+    """
+    Returns the storage key of a tile, stored alongside the original.
+    """
+    file_root, _ = os.path.splitext(storage_path)
+    extension = ".jpg" if tile_format(storage_path) == "JPEG" else ".png"
+    return f"{file_root}_tiles/{level}/{column}_{row}{extension}"
+
+
+def pyramid_levels(size: tuple[int, int], tile_size: int) -> int:
+    """
+    Levels halve the image until it fits in one tile; level 0 is full resolution.
+    """
+    return 1 + max(0, math.ceil(math.log2(max(size) / tile_size)))
+
+
+def level_size(size: tuple[int, int], level: int) -> tuple[int, int]:
+    scale = 2**level
+    return max(1, math.ceil(size[0] / scale)), max(1, math.ceil(size[1] / scale))
+
+
+def clamp_box(
+    box: tuple[int, int, int, int], size: tuple[int, int]
+) -> tuple[int, int, int, int]:
+    """
+    Clips a crop box to an image of `size`. Pillow pads a box reaching past the edges
+    out to its full size, so an unclipped box allocates however large it claims to be.
+
+    Raises:
+        ValueError: If the box does not overlap the image.
+    """
+    left, top = max(0, box[0]), max(0, box[1])
+    right, bottom = min(size[0], box[2]), min(size[1], box[3])
+    if right <= left or bottom <= top:
+        raise ValueError("Crop area lies outside the image.")
+    return left, top, right, bottom
+
+
+def is_tiled(blob: Optional[prisma.models.Blob]) -> bool:
+    return (
+        blob is not None
+        and bool(blob.tileSize)
+        and bool(blob.tileLevels)
+        and bool(blob.width)
+        and bool(blob.height)
+    )
+
+
+def _render_tiles(
+    source_path: str, dest_dir: str, tile_size: int, image_format: str
+) -> tuple[int, list[tuple[int, int, int, str]]]:
+    """
+    Cuts the image at `source_path` into a pyramid of `tile_size` tiles in `dest_dir`.
+    Each level is reduced 2x from the previous one with a box filter.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        tuple[int, list[tuple[int, int, int, str]]]: The number of levels, and (level, column, row, path) of every tile.
+    """
+    written = []
+    with Image.open(source_path) as img:
+        phases = ImagePhases("tile", img.format, img.size)
+        with phases.time("decode"):
+            img.load()
+        current = img
+        if current.mode not in ("L", "RGB", "RGBA"):
+            has_alpha = "A" in current.mode or "transparency" in current.info
+            current = current.convert("RGBA" if has_alpha else "RGB")
+        if image_format == "JPEG" and current.mode == "RGBA":
+            current = current.convert("RGB")
+        levels = pyramid_levels(img.size, tile_size)
+        for level in range(levels):
+            level_dir = os.path.join(dest_dir, str(level))
+            os.makedirs(level_dir, exist_ok=True)
+            with phases.time("encode", image_format):
+                for row in range(math.ceil(current.height / tile_size)):
+                    for column in range(math.ceil(current.width / tile_size)):
+                        left, top = column * tile_size, row * tile_size
+                        tile = current.crop(
+                            (
+                                left,
+                                top,
+                                min(left + tile_size, current.width),
+                                min(top + tile_size, current.height),
+                            )
+                        )
+                        path = os.path.join(level_dir, f"{column}_{row}")
+                        if image_format == "JPEG":
+                            tile.save(path, "JPEG", quality=95, subsampling=0)
+                        else:
+                            tile.save(path, "PNG", compress_level=1)
+                        written.append((level, column, row, path))
+            if level + 1 < levels:
+                with phases.time("transform"):
+                    current = current.reduce(2)
+    return levels, written
+
+
+async def _for_each(items: list, fn) -> list:
+    results = []
+    for start in range(0, len(items), TILE_STORAGE_CONCURRENCY):
+        results.extend(
+            await asyncio.gather(
+                *(fn(item) for item in items[start : start + TILE_STORAGE_CONCURRENCY])
+            )
+        )
+    return results
+
+
+async def generate_tiles(content_hash: str, storage_path: str) -> None:
+    """
+    Stores the tile pyramid of a large blob and records it on the blob.
+
+    Meant to run as a background task after the upload response has been sent. Failures
+    are logged rather than raised: until the pyramid exists, crops and resizes read the
+    original. If the blob is released while its tiles are being stored, or storing them
+    fails, the stored tiles are deleted again instead of being orphaned.
+    """
+    tmp_dir = None
+    keys: list[str] = []
+    recorded = False
+    try:
+        blob = await get_blob(content_hash)
+        if (
+            blob is None
+            or is_tiled(blob)
+            or TILE_MIN_PIXELS <= 0
+            or (blob.width or 0) * (blob.height or 0) < TILE_MIN_PIXELS
+        ):
+            return
+        source_path = await storage.fetch(storage_path)
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=UPLOAD_DIR, prefix="tiles-")
+        levels, written = await run_image_task(
+            _render_tiles, source_path, tmp_dir, TILE_SIZE, tile_format(storage_path)
+        )
+        keys = [tile_path(storage_path, *tile[:3]) for tile in written]
+        await _for_each(
+            list(zip(written, keys)),
+            lambda tile: storage.store(tile[0][3], tile[1]),
+        )
+        # The update doubles as a check that the blob still exists. Once recorded, the
+        # tiles are deleted with the blob; if its row is gone, they are ours to delete.
+        recorded = (
+            await prisma.models.Blob.prisma().update(
+                where={"hash": content_hash},
+                data={"tileSize": TILE_SIZE, "tileLevels": levels},
+            )
+            is not None
+        )
+        blobs.invalidate(content_hash)
+    except HTTPException:
+        logger.warning("Image executor saturated, skipping tiles for %s", content_hash)
+    except Exception:
+        logger.exception("Error generating tiles for %s", content_hash)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        if keys and not recorded:
+            await _for_each(keys, delete_object)
+
+
+def tile_keys(blob: prisma.models.Blob) -> list[str]:
+    """
+    The storage keys of every tile of a tiled blob.
+    """
+    keys = []
+    for level in range(blob.tileLevels):
+        width, height = level_size((blob.width, blob.height), level)
+        for row in range(math.ceil(height / blob.tileSize)):
+            for column in range(math.ceil(width / blob.tileSize)):
+                keys.append(tile_path(blob.storagePath, level, column, row))
+    return keys
+
+
+async def delete_tiles(blob: prisma.models.Blob) -> None:
+    if is_tiled(blob):
+        await _for_each(tile_keys(blob), delete_object)
+
+
+def region_level(
+    box: tuple[float, float, float, float],
+    target: tuple[int, int],
+    levels: int,
+    reducing_gap: float = 1.0,
+) -> int:
+    """
+    The smallest pyramid level at which `box` is still at least `reducing_gap` times
+    `target` in both dimensions, so the final resample always shrinks by at least
+    `reducing_gap`, as `Image.resize` with that gap does after its own `reduce`.
+    """
+    box_w, box_h = box[2] - box[0], box[3] - box[1]
+    level = 0
+    while (
+        level + 1 < levels
+        and box_w / 2 ** (level + 1) >= target[0] * reducing_gap
+        and box_h / 2 ** (level + 1) >= target[1] * reducing_gap
+    ):
+        level += 1
+    return level
+
+
+async def tile_region(
+    image_record: prisma.models.ImageFile,
+    box: tuple[int, int, int, int],
+    target: Optional[tuple[int, int]] = None,
+    reducing_gap: float = 1.0,
+) -> Optional[TileRegion]:
+    """
+    Fetches the tiles covering `box` (full-resolution coordinates, clipped to the image)
+    of a tiled image: from the level `region_level` picks for `target`, or from full
+    resolution without a target.
+
+    Returns:
+        Optional[TileRegion]: The region, or None if the image has no tile pyramid.
+
+    Raises:
+        ValueError: If `box` does not overlap the image.
+    """
+    if image_record.contentHash is None:
+        return None
+    blob = await get_blob(image_record.contentHash)
+    if not is_tiled(blob):
+        return None
+    box = clamp_box(box, (blob.width, blob.height))
+    level = 0
+    if target is not None:
+        level = region_level(box, target, blob.tileLevels, reducing_gap)
+    scale = 2**level
+    scaled = [coordinate / scale for coordinate in box]
+    left, top = math.floor(scaled[0]), math.floor(scaled[1])
+    right = max(left + 1, math.ceil(scaled[2]))
+    bottom = max(top + 1, math.ceil(scaled[3]))
+    width, height = level_size((blob.width, blob.height), level)
+    size = blob.tileSize
+    positions = [
+        (column, row)
+        for row in range(max(0, top // size), min(bottom, height) // size + 1)
+        for column in range(max(0, left // size), min(right, width) // size + 1)
+        if column * size < min(right, width) and row * size < min(bottom, height)
+    ]
+    paths = await _for_each(
+        positions,
+        lambda position: storage.fetch(
+            tile_path(blob.storagePath, level, position[0], position[1])
+        ),
+    )
+    return TileRegion(
+        size=(right - left, bottom - top),
+        tiles=[
+            (column * size - left, row * size - top, path)
+            for (column, row), path in zip(positions, paths)
+        ],
+        box=(
+            scaled[0] - left,
+            scaled[1] - top,
+            scaled[2] - left,
+            scaled[3] - top,
+        ),
+        source_format=image_record.format.value,
+    )
+
+
+def read_region(region: TileRegion, phases: ImagePhases) -> Image.Image:
+    """
+    Assembles a region from its tiles. Only the region and one tile are in memory at a
+    time, however large the original is.
+    """
+    canvas = None
+    with phases.time("decode"):
+        for x, y, path in region.tiles:
+            with Image.open(path) as tile:
+                tile.load()
+                if canvas is None:
+                    canvas = Image.new(tile.mode, region.size)
+                canvas.paste(tile, (x, y))
+    return canvas if canvas is not None else Image.new("RGB", region.size)
+
+
+def crop_from_tiles(
+    region: TileRegion,
+    dest_path: str,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> None:
+    """
+    The tiled counterpart of `crop_to_file`, for a region fetched at full resolution.
+
+    Runs on the image executor, so it only takes picklable values.
+    """
+    phases = ImagePhases("crop", region.source_format, region.size)
+    cropped_img = read_region(region, phases)
+    image_format = image_format or region.source_format
+    with phases.time("encode", image_format):
+        save_image(cropped_img, dest_path, image_format, encoder)
+
+
+def resize_from_tiles(
+    region: TileRegion,
+    dest_path: str,
+    target: tuple[int, int],
+    resample: Image.Resampling,
+    reducing_gap: float,
+    image_format: Optional[str] = None,
+    encoder: Optional[EncoderOptions] = None,
+) -> tuple[int, int]:
+    """
+    The tiled counterpart of `resize_to_file`: resamples the region's box to `target`.
+
+    Pyramid levels are box-filtered by powers of two where `resize_to_file` reduces by
+    any integer factor, so results differ slightly once a level above 0 is read. Against
+    `resize_to_file` on PNG sources, for a region from `tile_region` with the same
+    `reducing_gap`: identical at level 0, within 2 per channel on photographic content,
+    and within 10 (1.5 on average) on white noise, the worst case. JPEG sources add the
+    loss of the quality 95 tiles and of `draft` decoding in `resize_to_file`.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+
+    Returns:
+        tuple[int, int]: The width and height of the written image.
+    """
+    phases = ImagePhases("resize", region.source_format, region.size)
+    img = read_region(region, phases)
+    with phases.time("transform"):
+        resized_img = img.resize(
+            target, resample, box=region.box, reducing_gap=reducing_gap
+        )
+    image_format = image_format or region.source_format
+    with phases.time("encode", image_format):
+        save_image(resized_img, dest_path, image_format, encoder)
+    return resized_img.size
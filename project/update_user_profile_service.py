@@ -1,8 +1,10 @@
 from typing import Optional
 
-import bcrypt
 import prisma
 import prisma.models
+from fastapi import HTTPException
+from project import password_hashing
+from project.record_cache import users
 from pydantic import BaseModel
 
 
@@ -17,7 +19,7 @@ class UpdateUserProfileResponse(BaseModel):
 
 async def hash_password(password: str) -> str:
     """
-    Hashes a plain text password using bcrypt.
+    Hashes a plain text password using bcrypt, on the password executor.
 
     Args:
         password (str): The plain text password to be hashed.
@@ -25,9 +27,7 @@ async def hash_password(password: str) -> str:
     Returns:
         str: The hashed password.
     """
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode("utf-8"), salt)
-    return hashed.decode("utf-8")
+    return await password_hashing.hash_password(password)
 
 
 async def update_user_profile(
@@ -60,8 +60,11 @@ async def update_user_profile(
         user = await prisma.models.User.prisma().update(
             where={"id": user_id}, data=update_data
         )
+        users.invalidate(user_id)
         return UpdateUserProfileResponse(
             success=True, message="User profile updated successfully."
         )
+    except HTTPException:
+        raise
     except Exception as e:
         return UpdateUserProfileResponse(success=False, message=str(e))
@@ -4,6 +4,8 @@ from typing import Optional
 import prisma
 import prisma.enums
 import prisma.models
+from project.audit_log import audit_log
+from project.record_cache import subscriptions
 from pydantic import BaseModel
 
 
@@ -59,6 +61,11 @@ async def upgrade_subscription(
                 "endDate": current_datetime + duration,
             }
         )
+    subscriptions.invalidate(user_id)
+    audit_log.record_event(
+        prisma.enums.EventType.SUBSCRIPTION_UPGRADE,
+        {"userId": user_id, "subscriptionType": new_subscription_type},
+    )
     response = UpgradeSubscriptionResponse(
         user_id=user_id,
         subscription_type=new_subscription_type,
@@ -1,4 +1,7 @@
-import io
+import hashlib
+import os
+import tempfile
+import time
 import uuid
 from datetime import datetime
 from typing import Optional
@@ -6,8 +9,23 @@ from typing import Optional
 import prisma
 import prisma.enums
 import prisma.models
-from fastapi import UploadFile
+from fastapi import BackgroundTasks, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from PIL import Image
+from project.audit_log import audit_log
+from project.blob_store import (
+    acquire_blob,
+    blob_path,
+    register_blob,
+    release_blob,
+)
+from project.image_encoding import AVIF_AVAILABLE, FORMAT_EXTENSIONS
+from project.image_executor import run_image_task
+from project.metrics import ImagePhases
+from project.renditions import RENDITION_SIZES, generate_renditions
+from project.storage import storage
+from project.svg_rasterizer import is_svg, svg_size
+from project.tiles import TILE_MIN_PIXELS, generate_tiles
 from pydantic import BaseModel
 
 
@@ -22,8 +40,122 @@ class UploadImageResponse(BaseModel):
     image_url: Optional[str] = None
 
 
+class StreamedUpload(BaseModel):
+    """
+    An upload that has been streamed to a temporary file, with its sniffed format and content hash.
+    """
+
+    path: str
+    format: str
+    size: int
+    sha256: str
+
+
+class UploadRejected(Exception):
+    """
+    Raised while streaming an upload when its content cannot be accepted.
+    """
+
+
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", "uploads")
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+
+MAX_UPLOAD_PIXELS = int(os.environ.get("MAX_UPLOAD_PIXELS", str(100_000_000)))
+
+MAGIC_NUMBERS = {
+    b"\x89PNG\r\n\x1a\n": "PNG",
+    b"\xff\xd8\xff": "JPEG",
+}
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """
+    Identifies the image format from the leading bytes of a file.
+
+    Args:
+        head (bytes): The first bytes of the file.
+
+    Returns:
+        Optional[str]: The detected format name, or None if the bytes match no supported format.
+    """
+    for magic, detected_format in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return detected_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if is_svg(head):
+        return "SVG"
+    if AVIF_AVAILABLE and head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis"):
+        return "AVIF"
+    return None
+
+
+async def stream_to_temp_file(image: UploadFile) -> StreamedUpload:
+    """
+    Streams an upload in chunks to a temporary file in the upload directory, hashing it
+    on the way through.
+
+    The first chunk is sniffed before anything is written, and the stream is abandoned as
+    soon as it exceeds MAX_UPLOAD_BYTES, so rejected uploads cost at most one chunk.
+
+    Args:
+        image (UploadFile): The uploaded file.
+
+    Returns:
+        StreamedUpload: The temporary file with its sniffed format, size and SHA-256 digest.
+
+    Raises:
+        UploadRejected: If the content is not a supported image or is too large.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    chunk = await image.read(UPLOAD_CHUNK_SIZE)
+    detected_format = sniff_format(chunk)
+    if detected_format is None:
+        raise UploadRejected("Unsupported image content")
+    tmp = tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=".part", delete=False)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with tmp:
+            while chunk:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadRejected(
+                        f"Image exceeds the maximum upload size of {MAX_UPLOAD_BYTES} bytes"
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(tmp.write, chunk)
+                chunk = await image.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        os.unlink(tmp.name)
+        raise
+    return StreamedUpload(
+        path=tmp.name, format=detected_format, size=size, sha256=digest.hexdigest()
+    )
+
+
+def _probe(path: str) -> tuple[str, tuple[int, int]]:
+    """
+    Reads only the image header to get its format and dimensions.
+
+    Runs on the image executor, so it only takes and returns picklable values.
+    """
+    with Image.open(path) as pil_image:
+        return pil_image.format, pil_image.size
+
+
+def _probe_svg(path: str) -> tuple[str, tuple[int, int]]:
+    return "SVG", svg_size(path)
+
+
 async def upload_image(
-    image: UploadFile, format: Optional[str], user_id: str
+    image: UploadFile,
+    format: Optional[str],
+    user_id: str,
+    background_tasks: Optional[BackgroundTasks] = None,
 ) -> UploadImageResponse:
     """
     Endpoint to allow users to upload images
@@ -32,38 +164,103 @@ async def upload_image(
     image (UploadFile): The image file to be uploaded.
     format (Optional[str]): The format of the image being uploaded (e.g., PNG, JPG). This is optional and can be determined from the file if not provided.
     user_id (str): The ID of the user uploading the image, used to associate the image with a user.
+    background_tasks (Optional[BackgroundTasks]): When given, renditions (and, for large images, tiles) of newly stored content are generated after the response is sent.
 
     Returns:
     UploadImageResponse: Response model indicating the result of the image upload operation, including references to the uploaded image.
     """
     if format is None:
         format = image.filename.split(".")[-1].upper()
-        if format not in ["PNG", "JPG", "JPEG", "SVG"]:
+        if format not in ["PNG", "JPG", "JPEG", "WEBP", "AVIF", "SVG"]:
             return UploadImageResponse(
                 success=False, message="Unsupported image format"
             )
+    upload = None
     try:
-        contents = await image.read()
-        pil_image = Image.open(io.BytesIO(contents))
-        output_format = "PNG" if format != "SVG" else "SVG"
+        started = time.perf_counter()
+        upload = await stream_to_temp_file(image)
+        received = time.perf_counter() - started
+        probed = None
+        output_format = upload.format
+        file_ext = FORMAT_EXTENSIONS.get(output_format, ".svg")
+        blob = await acquire_blob(upload.sha256)
+        is_new_blob = blob is None
+        if is_new_blob:
+            started = time.perf_counter()
+            if output_format == "SVG":
+                _, (width, height) = await run_in_threadpool(_probe_svg, upload.path)
+            else:
+                _, (width, height) = await run_image_task(_probe, upload.path)
+            probed = time.perf_counter() - started
+            if output_format != "SVG" and width * height > MAX_UPLOAD_PIXELS:
+                return UploadImageResponse(
+                    success=False,
+                    message=f"Image dimensions {width}x{height} exceed the maximum of {MAX_UPLOAD_PIXELS} pixels",
+                )
+            blob = await register_blob(
+                upload.sha256,
+                blob_path(upload.sha256, file_ext.lstrip(".")),
+                width,
+                height,
+            )
+        phases = ImagePhases(
+            "upload", output_format, (blob.width or 0, blob.height or 0)
+        )
+        phases.observe("receive", received)
+        if probed is not None:
+            phases.observe("decode", probed)
         image_id = str(uuid.uuid4())
-        storage_path = f"uploads/{image_id}.{output_format.lower()}"
-        pil_image.save(storage_path)
-        uploaded_image = await prisma.models.ImageFile.prisma().create(
-            data={
-                "id": image_id,
+        try:
+            # Originals are kept byte for byte in the format they were uploaded in;
+            # other formats are only produced for derivatives. Stores are atomic, so
+            # concurrent uploads of the same content can both store it safely.
+            if not await storage.exists(blob.storagePath):
+                with phases.time("store"):
+                    await storage.store(upload.path, blob.storagePath)
+            uploaded_image = await prisma.models.ImageFile.prisma().create(
+                data={
+                    "id": image_id,
+                    "userId": user_id,
+                    "format": prisma.enums.ImageFormat[output_format],
+                    "originalFilename": image.filename,
+                    "storagePath": blob.storagePath,
+                    "contentHash": blob.hash,
+                    "uploadedAt": datetime.now(),
+                }
+            )
+        except BaseException:
+            await release_blob(blob.hash)
+            raise
+        # Vectors are rasterized on demand at the requested size instead.
+        if is_new_blob and background_tasks is not None and output_format != "SVG":
+            if RENDITION_SIZES:
+                background_tasks.add_task(
+                    generate_renditions, blob.hash, blob.storagePath
+                )
+            if 0 < TILE_MIN_PIXELS <= (blob.width or 0) * (blob.height or 0):
+                background_tasks.add_task(generate_tiles, blob.hash, blob.storagePath)
+        audit_log.record_event(
+            prisma.enums.EventType.IMAGE_UPLOAD,
+            {
                 "userId": user_id,
-                "format": prisma.enums.ImageFormat[output_format],
-                "originalFilename": image.filename,
-                "storagePath": storage_path,
-                "uploadedAt": datetime.now(),
-            }
+                "imageId": image_id,
+                "format": output_format,
+                "contentHash": blob.hash,
+                "deduplicated": not is_new_blob,
+            },
         )
         return UploadImageResponse(
             success=True,
             message="Image uploaded successfully",
             image_id=image_id,
-            image_url=f"/files/{image_id}.{output_format.lower()}",
+            image_url=f"/files/{image_id}{file_ext}",
         )
+    except UploadRejected as e:
+        return UploadImageResponse(success=False, message=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         return UploadImageResponse(success=False, message=str(e))
+    finally:
+        if upload is not None and os.path.exists(upload.path):
+            os.unlink(upload.path)
@@ -0,0 +1,11 @@
+from project.derivative_cache import DerivativeCacheStats, derivative_cache
+
+
+async def view_cache_stats() -> DerivativeCacheStats:
+    """
+    Endpoint for viewing derivative cache hit/miss counters and size
+
+    Returns:
+        DerivativeCacheStats: Counters describing the derivative cache, used to size DERIVATIVE_CACHE_MAX_BYTES.
+    """
+    return derivative_cache.stats()
@@ -0,0 +1,12 @@
+from project.image_executor import ExecutorStats, image_executor
+from project.password_hashing import password_executor
+
+
+async def view_executor_stats() -> list[ExecutorStats]:
+    """
+    Endpoint for viewing the load and queue length of the bounded worker pools
+
+    Returns:
+        list[ExecutorStats]: Load counters of each executor, used to size its workers and queue depth.
+    """
+    return [image_executor.stats(), password_executor.stats()]
@@ -0,0 +1,11 @@
+from project.record_cache import RecordCacheStats, record_caches
+
+
+async def view_record_cache_stats() -> list[RecordCacheStats]:
+    """
+    Endpoint for viewing hit/miss counters of the database record caches
+
+    Returns:
+        list[RecordCacheStats]: Counters for each record cache, used to tune the *_CACHE_TTL settings.
+    """
+    return [cache.stats() for cache in record_caches]
@@ -5,6 +5,7 @@ from typing import Optional
 import prisma
 import prisma.enums
 import prisma.models
+from project.record_cache import get_latest_subscription
 from pydantic import BaseModel
 
 
@@ -34,9 +35,7 @@ async def view_subscription(user_id: str) -> ViewSubscriptionResponse:
     Returns:
     ViewSubscriptionResponse: Response model containing the subscription details of the requesting user.
     """
-    subscription = await prisma.models.Subscription.prisma().find_first(
-        where={"userId": user_id}, order={"startDate": "desc"}
-    )
+    subscription = await get_latest_subscription(user_id)
     if not subscription:
         return ViewSubscriptionResponse(
             subscription_type=prisma.enums.SubscriptionType.FREE,
@@ -0,0 +1,130 @@
+import argparse
+import logging
+import os
+import tempfile
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+logger = logging.getLogger(__name__)
+
+# Uvicorn worker processes per replica; uvicorn reads the same variable for --workers.
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+
+# Replicas (containers) of the app sharing the database.
+APP_REPLICAS = max(1, int(os.environ.get("APP_REPLICAS", "1")))
+
+# Postgres's max_connections, and how many of those to leave for migrations, psql and
+# other clients. The rest is split evenly between the workers of every replica.
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "100"))
+
+DB_RESERVED_CONNECTIONS = int(os.environ.get("DB_RESERVED_CONNECTIONS", "10"))
+
+# Overrides the derived per-worker pool size.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "0"))
+
+# Seconds a query waits for a free pooled connection before failing.
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+
+def db_pool_size() -> int:
+    """
+    Connections one worker's Prisma client may open, so that all workers of all
+    replicas together stay within DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS.
+    """
+    if DB_POOL_SIZE > 0:
+        return DB_POOL_SIZE
+    available = DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS
+    return max(1, available // (WEB_CONCURRENCY * APP_REPLICAS))
+
+
+def pooled_database_url(url: Optional[str] = None) -> Optional[str]:
+    """
+    Returns DATABASE_URL with this worker's `connection_limit` and `pool_timeout`,
+    unless the URL already sets them.
+    """
+    url = url if url is not None else os.environ.get("DATABASE_URL")
+    if not url:
+        return None
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.setdefault("connection_limit", str(db_pool_size()))
+    query.setdefault("pool_timeout", str(DB_POOL_TIMEOUT))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+async def check_connection_budget(client) -> None:
+    """
+    Warns when the pools of all workers could need more connections than Postgres
+    allows, e.g. because DB_MAX_CONNECTIONS does not match the server.
+    """
+    try:
+        rows = await client.query_raw("SHOW max_connections")
+        max_connections = int(rows[0]["max_connections"])
+    except Exception:
+        logger.exception("Could not read max_connections")
+        return
+    planned = db_pool_size() * WEB_CONCURRENCY * APP_REPLICAS
+    if planned + DB_RESERVED_CONNECTIONS > max_connections:
+        logger.warning(
+            "%d workers x %d replicas with %d connections each, plus %d reserved, "
+            "exceed the server's max_connections of %d",
+            WEB_CONCURRENCY,
+            APP_REPLICAS,
+            db_pool_size(),
+            DB_RESERVED_CONNECTIONS,
+            max_connections,
+        )
+
+
+def _prepare_multiprocess() -> None:
+    """
+    Points the workers at a fresh metrics directory and shared cache file, unless the
+    environment already names them, before any worker starts.
+    """
+    metrics_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        # Files of a previous run would be merged into this one's metrics.
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            if name.endswith(".db"):
+                os.unlink(os.path.join(metrics_dir, name))
+    else:
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+    if not os.environ.get("SHARED_CACHE_PATH"):
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        os.environ["SHARED_CACHE_PATH"] = os.path.join(
+            directory, f"record-cache-{os.getpid()}"
+        )
+    elif os.path.exists(os.environ["SHARED_CACHE_PATH"]):
+        os.unlink(os.environ["SHARED_CACHE_PATH"])
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve the app with WEB_CONCURRENCY uvicorn worker processes."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    args = parser.parse_args(argv)
+    # Pool sizing in the workers reads the worker count from the environment.
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    if args.workers > 1:
+        _prepare_multiprocess()
+    import uvicorn
+
+    try:
+        uvicorn.run(
+            "project.server:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+        )
+    finally:
+        shared_cache_path = os.environ.get("SHARED_CACHE_PATH")
+        if args.workers > 1 and shared_cache_path and os.path.exists(shared_cache_path):
+            os.unlink(shared_cache_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import asyncio
+import importlib.util
+import os
+import subprocess
+import sys
+
+import pytest
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "schema.prisma")
+
+
+def pytest_configure(config):
+    """
+    Generates the Prisma client from schema.prisma before test modules are imported,
+    unless it has been generated already (`prisma generate`): every service module
+    imports `prisma.models`, which only exists in a generated client.
+    """
+    spec = importlib.util.find_spec("prisma")
+    if spec is None or spec.origin is None:
+        return
+    if os.path.exists(os.path.join(os.path.dirname(spec.origin), "models.py")):
+        return
+    subprocess.run(
+        [sys.executable, "-m", "prisma", "generate", f"--schema={SCHEMA_PATH}"],
+        check=True,
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="DATABASE_URL is not set")
+    for item in items:
+        if "database" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def run():
+    """
+    Runs coroutines on one event loop that lives for the whole test, so clients and
+    background tasks created by one call can be used by the next.
+    """
+    with asyncio.Runner() as runner:
+        yield runner.run
+
+
+@pytest.fixture
+def db(run):
+    """
+    A registered Prisma client connected to DATABASE_URL, for tests marked `database`.
+    """
+    if not DATABASE_URL:
+        pytest.skip("DATABASE_URL is not set")
+    import prisma
+
+    client = prisma.Prisma(auto_register=True)
+    run(client.connect())
+    try:
+        yield client
+    finally:
+        run(client.disconnect())
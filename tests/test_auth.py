@@ -0,0 +1,90 @@
+import time
+import uuid
+from datetime import timedelta
+from types import SimpleNamespace
+
+import project.auth
+import pytest
+from fastapi import HTTPException
+from project.auth import ClaimsCache, TokenDenylist, revoke_token, verify_token
+from project.login_user_service import create_access_token
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    A settable clock for the auth module, starting at the current time.
+    """
+    clock = SimpleNamespace(now=time.time())
+    monkeypatch.setattr(project.auth, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def fresh_auth(monkeypatch):
+    monkeypatch.setattr(project.auth, "denylist", TokenDenylist())
+    monkeypatch.setattr(project.auth, "claims_cache", ClaimsCache())
+    # Keep revocations in this process instead of recording them in the database.
+    monkeypatch.setattr(project.auth, "AUTH_DENYLIST_SYNC_INTERVAL", 0)
+
+
+def _token(expires_in: timedelta = timedelta(minutes=15)) -> str:
+    return create_access_token(
+        {"sub": "user@example.com", "uid": "user-1", "jti": uuid.uuid4().hex},
+        expires_in,
+    )
+
+
+def test_denylist_forgets_tokens_once_they_expire(clock):
+    denylist = TokenDenylist()
+    denylist.revoke("a", int(clock.now) + 10)
+    denylist.revoke("b", int(clock.now) + 100)
+    assert denylist.is_revoked("a") and denylist.is_revoked("b")
+    assert len(denylist) == 2
+
+    clock.now += 50
+    denylist.revoke("c", int(clock.now) + 10)
+    assert not denylist.is_revoked("a")
+    assert denylist.is_revoked("b") and denylist.is_revoked("c")
+    assert len(denylist) == 2
+
+
+def test_denylist_ignores_expired_and_repeated_revocations(clock):
+    denylist = TokenDenylist()
+    denylist.revoke("expired", int(clock.now))
+    assert not denylist.is_revoked("expired")
+    denylist.revoke("a", int(clock.now) + 10)
+    denylist.revoke("a", int(clock.now) + 10)
+    assert len(denylist) == 1
+
+
+def test_revoked_token_is_rejected_even_when_cached(run, fresh_auth):
+    token = _token()
+    claims = verify_token(token)
+    assert (claims.id, claims.email) == ("user-1", "user@example.com")
+    assert project.auth.claims_cache.get(token) == claims
+
+    run(revoke_token(claims))
+    with pytest.raises(HTTPException) as excinfo:
+        verify_token(token)
+    assert excinfo.value.status_code == 401
+    assert excinfo.value.detail == "Authentication token has been revoked"
+    # Other tokens of the same user are unaffected.
+    assert verify_token(_token()).id == "user-1"
+
+
+def test_cached_token_expires(fresh_auth, clock):
+    token = _token(timedelta(seconds=30))
+    verify_token(token)
+    clock.now += 60
+    with pytest.raises(HTTPException) as excinfo:
+        verify_token(token)
+    assert excinfo.value.detail == "Authentication token has expired"
+    assert project.auth.claims_cache.get(token) is None
+
+
+def test_invalid_token_is_rejected(fresh_auth):
+    with pytest.raises(HTTPException) as excinfo:
+        verify_token(_token() + "x")
+    assert excinfo.value.status_code == 401
+    assert excinfo.value.detail == "Invalid authentication token"
@@ -0,0 +1,133 @@
+from types import SimpleNamespace
+
+import prisma.enums
+import prisma.models
+import pytest
+from fastapi import HTTPException
+from project import batch_worker
+from project.batch_worker import BatchWorker
+
+
+class FakeActions:
+    """
+    Records the calls made through `Model.prisma()` and answers them from `results`.
+    A list of results answers successive calls in turn.
+    """
+
+    def __init__(self, calls: list, model: str, results: dict):
+        self._calls = calls
+        self._model = model
+        self._results = results
+
+    def __getattr__(self, action: str):
+        async def call(**kwargs):
+            self._calls.append((self._model, action, kwargs))
+            result = self._results.get(action)
+            return result.pop(0) if isinstance(result, list) else result
+
+        return call
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    items = [SimpleNamespace(id="item-1", imageFileId="image-1")]
+    results = {
+        "BatchJobItem": {"update_many": 3, "find_many": [items, []]},
+        "BatchJob": {"find_unique": SimpleNamespace(completed=1, failed=0)},
+    }
+    for model, model_results in results.items():
+        actions = FakeActions(calls, model, model_results)
+        monkeypatch.setattr(
+            getattr(prisma.models, model), "prisma", lambda *_, a=actions: a
+        )
+    return calls
+
+
+def test_job_runs_its_items_and_completes(run, calls, monkeypatch):
+    async def run_pipeline(user_id, image_id, operations):
+        assert (user_id, image_id) == ("user-1", "image-1")
+        return SimpleNamespace(
+            success=True, image_reference=SimpleNamespace(image_id="out-1")
+        )
+
+    async def get_user(user_id):
+        return SimpleNamespace(id=user_id, role=prisma.enums.Role.FREEUSER)
+
+    monkeypatch.setattr(batch_worker, "get_user", get_user)
+    monkeypatch.setattr(batch_worker, "run_pipeline", run_pipeline)
+    job = SimpleNamespace(id="job-1", userId="user-1", operations=[])
+
+    run(BatchWorker()._run_job(job))
+
+    item_update = next(
+        kwargs
+        for model, action, kwargs in calls
+        if (model, action) == ("BatchJobItem", "update")
+        and kwargs["data"]["status"] == prisma.enums.BatchJobStatus.COMPLETED
+    )
+    assert item_update["where"] == {"id": "item-1"}
+    assert item_update["data"]["resultImageId"] == "out-1"
+    model, action, kwargs = calls[-1]
+    assert (model, action, kwargs["where"]) == ("BatchJob", "update", {"id": "job-1"})
+    assert kwargs["data"]["status"] == prisma.enums.BatchJobStatus.COMPLETED
+    assert kwargs["data"]["finishedAt"] is not None
+
+
+def test_job_of_a_missing_user_fails_cleanly(run, calls, monkeypatch):
+    async def get_user(user_id):
+        return None
+
+    async def run_pipeline(*args, **kwargs):
+        raise AssertionError("an item of a job without a user was processed")
+
+    monkeypatch.setattr(batch_worker, "get_user", get_user)
+    monkeypatch.setattr(batch_worker, "run_pipeline", run_pipeline)
+    job = SimpleNamespace(id="job-1", userId="gone", operations=[])
+
+    run(BatchWorker()._run_job(job))
+
+    fail_items = next(
+        kwargs
+        for model, action, kwargs in calls
+        if model == "BatchJobItem"
+        and action == "update_many"
+        and kwargs["data"].get("status") == prisma.enums.BatchJobStatus.FAILED
+    )
+    assert fail_items["where"] == {
+        "jobId": "job-1",
+        "status": prisma.enums.BatchJobStatus.QUEUED,
+    }
+    assert fail_items["data"]["error"] == "User not found."
+    model, action, kwargs = calls[-1]
+    assert (model, action, kwargs["where"]) == ("BatchJob", "update", {"id": "job-1"})
+    assert kwargs["data"]["status"] == prisma.enums.BatchJobStatus.FAILED
+    assert kwargs["data"]["failed"] == {"increment": 3}
+    assert kwargs["data"]["finishedAt"] is not None
+
+
+def test_rejected_operations_fail_the_item(run, calls, monkeypatch):
+    async def run_pipeline(user_id, image_id, operations):
+        raise HTTPException(status_code=400, detail="Invalid parameters for RESIZE")
+
+    async def get_user(user_id):
+        return SimpleNamespace(id=user_id, role=prisma.enums.Role.FREEUSER)
+
+    monkeypatch.setattr(batch_worker, "get_user", get_user)
+    monkeypatch.setattr(batch_worker, "run_pipeline", run_pipeline)
+    job = SimpleNamespace(id="job-1", userId="user-1", operations=[])
+
+    run(BatchWorker()._run_job(job))
+
+    item_update = next(
+        kwargs
+        for model, action, kwargs in calls
+        if (model, action) == ("BatchJobItem", "update")
+        and kwargs["data"]["status"] == prisma.enums.BatchJobStatus.FAILED
+    )
+    assert item_update["data"]["error"] == "Invalid parameters for RESIZE"
+    assert ("BatchJob", "update", {"id": "job-1"}, {"failed": {"increment": 1}}) in [
+        (model, action, kwargs["where"], kwargs["data"])
+        for model, action, kwargs in calls
+        if action == "update"
+    ]
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import uuid
+
+import prisma.models
+import project.storage
+import pytest
+from project.blob_store import blob_path, register_blob, release_blob
+from project.storage import LocalStorage
+
+
+@pytest.fixture
+def local_storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path))
+    monkeypatch.setattr(project.storage, "storage", storage)
+    return storage
+
+
+def _content_hash() -> str:
+    return hashlib.sha256(uuid.uuid4().bytes).hexdigest()
+
+
+def _stored(storage: LocalStorage, key: str) -> str:
+    path = storage.staging_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"image")
+    return path
+
+
+def test_blob_paths_are_unique_per_blob():
+    content_hash = _content_hash()
+    first, second = blob_path(content_hash, "png"), blob_path(content_hash, "png")
+    assert first != second
+    assert os.path.basename(first).startswith(content_hash)
+    assert first.endswith(".png")
+
+
+@pytest.mark.database
+def test_last_release_deletes_the_row_and_the_object(run, db, local_storage):
+    content_hash = _content_hash()
+    key = blob_path(content_hash, "png")
+    path = _stored(local_storage, key)
+    run(register_blob(content_hash, key, 10, 10))
+    # A second upload of the same bytes takes a reference on the same blob.
+    blob = run(register_blob(content_hash, blob_path(content_hash, "png"), 10, 10))
+    assert (blob.refCount, blob.storagePath) == (2, key)
+
+    run(release_blob(content_hash))
+    blob = run(prisma.models.Blob.prisma().find_unique(where={"hash": content_hash}))
+    assert blob.refCount == 1
+    assert os.path.exists(path)
+
+    run(release_blob(content_hash))
+    assert (
+        run(prisma.models.Blob.prisma().find_unique(where={"hash": content_hash}))
+        is None
+    )
+    assert not os.path.exists(path)
+
+
+@pytest.mark.database
+def test_release_survives_failed_object_deletes(run, db, local_storage, monkeypatch):
+    content_hash = _content_hash()
+    run(register_blob(content_hash, blob_path(content_hash, "png"), 10, 10))
+
+    async def unavailable(key):
+        raise OSError("storage unavailable")
+
+    monkeypatch.setattr(local_storage, "delete", unavailable)
+    run(release_blob(content_hash))
+    assert (
+        run(prisma.models.Blob.prisma().find_unique(where={"hash": content_hash}))
+        is None
+    )
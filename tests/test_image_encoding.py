@@ -0,0 +1,41 @@
+import os
+
+import pytest
+from PIL import Image
+from project.image_encoding import atomic_output, negotiate_format, save_image
+
+
+def test_negotiation_needs_an_explicit_media_type():
+    assert negotiate_format("image/webp,image/png;q=0.8", "PNG") == "WEBP"
+    assert negotiate_format("image/webp;q=0", "PNG") == "PNG"
+    assert negotiate_format("*/*", "JPEG") == "JPEG"
+    assert negotiate_format(None, "JPEG") == "JPEG"
+
+
+def test_concurrent_writers_each_publish_a_whole_file(tmp_path):
+    dest_path = str(tmp_path / "out.png")
+    with atomic_output(dest_path) as first, atomic_output(dest_path) as second:
+        assert first != second
+        Image.new("RGB", (40, 30), "red").save(first, format="PNG")
+        Image.new("RGB", (20, 10), "blue").save(second, format="PNG")
+    with Image.open(dest_path) as img:
+        assert img.size == (40, 30)
+    assert os.listdir(tmp_path) == ["out.png"]
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path):
+    dest_path = str(tmp_path / "out.png")
+    with pytest.raises(OSError):
+        with atomic_output(dest_path) as partial_path:
+            with open(partial_path, "wb") as f:
+                f.write(b"partial")
+            raise OSError("disk full")
+    assert os.listdir(tmp_path) == []
+
+
+def test_save_image_converts_for_the_encoder(tmp_path):
+    dest_path = str(tmp_path / "nested" / "out.jpg")
+    save_image(Image.new("RGBA", (8, 8), (255, 0, 0, 128)), dest_path, "JPEG")
+    with Image.open(dest_path) as img:
+        assert (img.format, img.mode) == ("JPEG", "RGB")
+    assert os.listdir(tmp_path / "nested") == ["out.jpg"]
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+from project.image_executor import ImageExecutor
+
+
+def test_runs_off_the_event_loop_thread(run):
+    executor = ImageExecutor(workers=2, queue_depth=0)
+    try:
+        worker = run(executor.run(threading.get_ident))
+    finally:
+        executor.shutdown()
+    assert worker != threading.get_ident()
+    assert executor.stats().completed == 1
+    assert executor.pending == 0
+
+
+def test_rejects_submissions_beyond_capacity(run):
+    executor = ImageExecutor(workers=1, queue_depth=1, retry_after=7)
+    release = threading.Event()
+
+    async def saturate():
+        tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as excinfo:
+                await executor.run(release.wait)
+        finally:
+            release.set()
+            await asyncio.gather(*tasks)
+        return excinfo.value
+
+    try:
+        error = run(saturate())
+    finally:
+        executor.shutdown()
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "7"}
+    assert executor.stats().rejected == 1
+    assert executor.pending == 0
+
+
+def test_cancelled_requests_hold_their_slot_until_the_work_stops(run):
+    executor = ImageExecutor(workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def cancel_both():
+        running = asyncio.create_task(executor.run(release.wait))
+        queued = asyncio.create_task(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        running.cancel()
+        queued.cancel()
+        await asyncio.gather(running, queued, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        # The queued task never starts; the running one keeps its worker busy.
+        pending_while_running = executor.pending
+        release.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        return pending_while_running
+
+    try:
+        pending_while_running = run(cancel_both())
+    finally:
+        executor.shutdown()
+    assert pending_while_running == 1
+    assert executor.pending == 0
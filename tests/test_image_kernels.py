@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageChops, ImageEnhance, ImageOps
+from project.adjust_images_service import _adjust_chunk
+from project.image_kernels import apply_point_operations
+
+OPERATIONS = [
+    [("contrast", 1.7)],
+    [("brightness", 1.3), ("contrast", 0.6)],
+    [("contrast", 1.4), ("brightness", 0.8), ("contrast", 2.2)],
+    [("invert", 0.0), ("contrast", 0.45), ("brightness", 1.15)],
+    [("brightness", 0.0), ("contrast", 3.0)],
+]
+
+
+def _noise(mode: str, seed: int) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    bands = len(mode)
+    pixels = rng.integers(0, 256, size=(97, 131, bands), dtype=np.uint8)
+    return Image.fromarray(pixels[:, :, 0] if bands == 1 else pixels, mode)
+
+
+def _sequential(img: Image.Image, operations) -> Image.Image:
+    for kind, factor in operations:
+        if kind == "brightness":
+            img = ImageEnhance.Brightness(img).enhance(factor)
+        elif kind == "contrast":
+            img = ImageEnhance.Contrast(img).enhance(factor)
+        else:
+            img = ImageOps.invert(img)
+    return img
+
+
+@pytest.mark.parametrize("operations", OPERATIONS)
+@pytest.mark.parametrize("mode", ["L", "RGB"])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_fused_table_matches_sequential_enhancers(mode, seed, operations):
+    img = _noise(mode, seed)
+    fused = apply_point_operations(img, operations)
+    assert fused.mode == mode
+    assert ImageChops.difference(fused, _sequential(img, operations)).getbbox() is None
+
+
+def test_alpha_band_is_left_untouched():
+    img = _noise("RGBA", 4)
+    operations = [("brightness", 1.2), ("contrast", 1.6)]
+    fused = apply_point_operations(img, operations)
+    assert fused.mode == "RGBA"
+    assert list(fused.getchannel("A").getdata()) == list(img.getchannel("A").getdata())
+    expected = _sequential(img, operations).convert("RGB")
+    assert ImageChops.difference(fused.convert("RGB"), expected).getbbox() is None
+
+
+def test_no_operations_returns_the_image():
+    img = _noise("RGB", 5)
+    assert apply_point_operations(img, []) is img
+
+
+def test_unknown_operation_is_rejected():
+    with pytest.raises(ValueError):
+        apply_point_operations(_noise("RGB", 6), [("gamma", 2.0)])
+
+
+def test_adjust_chunk_writes_each_image_and_reports_failures(tmp_path):
+    source_path = str(tmp_path / "source.png")
+    img = _noise("RGB", 7)
+    img.save(source_path, format="PNG")
+    operations = [("contrast", 1.5), ("invert", 0.0)]
+    dest_path = str(tmp_path / "out" / "adjusted.png")
+    errors = _adjust_chunk(
+        [
+            (str(tmp_path / "missing.png"), str(tmp_path / "out" / "missing.png")),
+            (source_path, dest_path),
+        ],
+        operations,
+    )
+    assert errors[0] is not None
+    assert errors[1] is None
+    with Image.open(dest_path) as adjusted:
+        assert adjusted.format == "PNG"
+        expected = _sequential(img, operations)
+        assert ImageChops.difference(adjusted, expected).getbbox() is None
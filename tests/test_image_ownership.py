@@ -0,0 +1,108 @@
+import os
+from types import SimpleNamespace
+
+import prisma.models
+import project.auth
+import project.server
+import pytest
+from PIL import Image
+from project import (
+    adjust_images_service,
+    crop_image_service,
+    delete_image_service,
+    image_pipeline_service,
+    resize_image_service,
+)
+from project.image_pipeline_service import PipelineOperation
+from project.storage import storage
+
+OWNED_ROUTES = [
+    ("/image/crop", "POST"),
+    ("/image/resize", "POST"),
+    ("/image/delete", "DELETE"),
+    ("/image/pipeline", "POST"),
+    ("/image/adjust/batch", "POST"),
+]
+
+
+@pytest.mark.parametrize("path,method", OWNED_ROUTES)
+def test_image_routes_require_authentication(path, method):
+    route = next(
+        route
+        for route in project.server.app.routes
+        if route.path == path and method in route.methods
+    )
+    dependencies = [dependency.call for dependency in route.dependant.dependencies]
+    assert project.auth.authenticated_user in dependencies
+
+
+@pytest.fixture
+def foreign_image(tmp_path, monkeypatch):
+    """
+    An image owned by another user. Its file must still be there after every test.
+    """
+    path = str(tmp_path / "image-1.png")
+    Image.new("RGB", (10, 10)).save(path, format="PNG")
+    record = SimpleNamespace(
+        id="image-1", userId="owner", storagePath=path, contentHash=None
+    )
+
+    async def get_image_file(image_id):
+        return record if image_id == record.id else None
+
+    async def untouchable(*args, **kwargs):
+        raise AssertionError("the image of another user was accessed")
+
+    for module in (
+        crop_image_service,
+        delete_image_service,
+        image_pipeline_service,
+        resize_image_service,
+    ):
+        monkeypatch.setattr(module, "get_image_file", get_image_file)
+    monkeypatch.setattr(delete_image_service, "release_blob", untouchable)
+    for method in ("fetch", "delete", "store"):
+        monkeypatch.setattr(storage, method, untouchable)
+    yield record
+    assert os.path.exists(path)
+
+
+def test_delete_rejects_other_users_image(run, foreign_image):
+    res = run(delete_image_service.delete_image("intruder", foreign_image.id))
+    assert not res.success
+
+
+def test_crop_rejects_other_users_image(run, foreign_image):
+    res = run(crop_image_service.crop_image("intruder", foreign_image.id, 0, 0, 1, 1))
+    assert res.cropped_image_path == ""
+    assert res.message == "Image not found."
+
+
+def test_resize_rejects_other_users_image(run, foreign_image):
+    res = run(resize_image_service.resize_image("intruder", foreign_image.id, 10, 10))
+    assert not res.success
+    assert res.message == "Image not found."
+
+
+def test_pipeline_rejects_other_users_image(run, foreign_image):
+    operations = [PipelineOperation(type="APPLY_FILTER", parameters={"name": "invert"})]
+    res = run(
+        image_pipeline_service.run_pipeline("intruder", foreign_image.id, operations)
+    )
+    assert not res.success
+    assert res.message == "Image not found."
+
+
+def test_adjust_only_loads_the_callers_images(run, monkeypatch):
+    queries = []
+
+    class ImageFiles:
+        async def find_many(self, where):
+            queries.append(where)
+            return []
+
+    monkeypatch.setattr(prisma.models.ImageFile, "prisma", lambda *args: ImageFiles())
+    operations = [PipelineOperation(type="APPLY_FILTER", parameters={"name": "invert"})]
+    res = run(adjust_images_service.adjust_images("intruder", ["image-1"], operations))
+    assert queries == [{"id": {"in": ["image-1"]}, "userId": "intruder"}]
+    assert [result.success for result in res.results] == [False]
@@ -0,0 +1,46 @@
+import pytest
+from fastapi import HTTPException
+from project import image_pipeline_service
+from project.image_pipeline_service import PipelineOperation, parse_step
+from project.resize_image_service import MAX_TRANSFORM_DIMENSION
+
+OVERSIZED = [
+    PipelineOperation(
+        type="RESIZE", parameters={"width": MAX_TRANSFORM_DIMENSION + 1, "height": 10}
+    ),
+    PipelineOperation(
+        type="CROP",
+        parameters={"x": 0, "y": 0, "width": 10, "height": 1_000_000_000},
+    ),
+]
+
+
+@pytest.mark.parametrize("operation", OVERSIZED)
+def test_oversized_steps_are_rejected(operation):
+    with pytest.raises(ValueError):
+        parse_step(operation)
+
+
+def test_steps_up_to_the_limit_are_accepted():
+    parse_step(
+        PipelineOperation(
+            type="RESIZE",
+            parameters={
+                "width": MAX_TRANSFORM_DIMENSION,
+                "height": MAX_TRANSFORM_DIMENSION,
+            },
+        )
+    )
+
+
+@pytest.mark.parametrize("operation", OVERSIZED)
+def test_pipeline_rejects_oversized_steps_before_loading_the_image(
+    run, monkeypatch, operation
+):
+    async def get_image_file(image_id):
+        raise AssertionError("the image was loaded")
+
+    monkeypatch.setattr(image_pipeline_service, "get_image_file", get_image_file)
+    with pytest.raises(HTTPException) as excinfo:
+        run(image_pipeline_service.run_pipeline("user-1", "image-1", [operation]))
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,86 @@
+import prisma.enums
+from PIL import Image
+from project.image_operations import (
+    TRANSPOSE,
+    AdjustStep,
+    CropStep,
+    FilterName,
+    FilterStep,
+    FlipDirection,
+    FlipStep,
+    RotateStep,
+    apply_steps,
+)
+from project.pipeline_planner import plan_pipeline
+
+BRIGHTNESS = prisma.enums.ManipulationType.ADJUST_BRIGHTNESS
+CONTRAST = prisma.enums.ManipulationType.ADJUST_CONTRAST
+CROP = prisma.enums.ManipulationType.CROP
+FILTER = prisma.enums.ManipulationType.APPLY_FILTER
+FLIP = prisma.enums.ManipulationType.FLIP
+ROTATE = prisma.enums.ManipulationType.ROTATE
+
+
+def _split_image() -> Image.Image:
+    """
+    A 200x100 image whose left half is dark and right half bright.
+    """
+    img = Image.new("RGB", (200, 100), (40, 40, 40))
+    img.paste((220, 220, 220), (100, 0, 200, 100))
+    return img
+
+
+def test_crop_moves_ahead_of_per_pixel_operations():
+    steps = [
+        (BRIGHTNESS, AdjustStep(factor=1.5)),
+        (FILTER, FilterStep(name=FilterName.INVERT)),
+        (CROP, CropStep(x=10, y=10, width=50, height=50)),
+    ]
+    plan = plan_pipeline(steps, (200, 100))
+    assert [manipulation for manipulation, _ in plan] == [CROP, BRIGHTNESS, FILTER]
+    img = _split_image()
+    assert list(apply_steps(img, plan).getdata()) == list(
+        apply_steps(img, steps).getdata()
+    )
+
+
+def test_crop_stays_behind_contrast():
+    steps = [
+        (CONTRAST, AdjustStep(factor=2.0)),
+        (CROP, CropStep(x=0, y=0, width=50, height=50)),
+    ]
+    plan = plan_pipeline(steps, (200, 100))
+    assert [manipulation for manipulation, _ in plan] == [CONTRAST, CROP]
+    # Contrast pivots on the mean of the whole image (130), pushing the dark half to 0.
+    assert apply_steps(_split_image(), plan).getpixel((0, 0)) == (0, 0, 0)
+
+
+def test_consecutive_crops_are_fused():
+    steps = [
+        (CROP, CropStep(x=10, y=20, width=100, height=60)),
+        (CROP, CropStep(x=5, y=5, width=20, height=20)),
+    ]
+    plan = plan_pipeline(steps, (200, 100))
+    assert plan == [(CROP, CropStep(x=15, y=25, width=20, height=20))]
+
+
+def test_right_angle_steps_fold_into_one_transpose_or_none():
+    plan = plan_pipeline(
+        [
+            (ROTATE, RotateStep(degrees=90)),
+            (FLIP, FlipStep(direction=FlipDirection.HORIZONTAL)),
+        ],
+        (200, 100),
+    )
+    assert [manipulation for manipulation, _ in plan] == [TRANSPOSE]
+    assert (
+        plan_pipeline(
+            [(ROTATE, RotateStep(degrees=90)), (ROTATE, RotateStep(degrees=270))],
+            (200, 100),
+        )
+        == []
+    )
+
+
+def test_identity_adjustments_are_dropped():
+    assert plan_pipeline([(BRIGHTNESS, AdjustStep(factor=1.0))], (200, 100)) == []
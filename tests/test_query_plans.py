@@ -0,0 +1,185 @@
+"""
+Checks that the SQL behind each hot lookup is served by an index.
+
+Each lookup runs through the code the app uses, against a client started with
+`log_queries`, and every statement the query engine logs is planned with
+EXPLAIN and sequential scans disabled. With enable_seqscan off Postgres still
+falls back to a sequential scan when no index can serve the query, so a Seq Scan
+in a plan means a missing index even on the nearly empty tables of a
+development database.
+"""
+
+import json
+import os
+import re
+import sys
+import uuid
+from datetime import datetime, timezone
+
+import prisma
+import prisma.enums
+import prisma.models
+import pytest
+from project.auth import DenylistSync
+from project.batch_worker import BatchWorker
+from project.record_cache import get_latest_subscription, get_user
+from project.renditions import find_rendition
+from project.sessions import end_session, session_sweeper
+
+_PLANNED_STATEMENTS = ("SELECT", "UPDATE", "DELETE", "WITH")
+
+
+def _id() -> str:
+    return str(uuid.uuid4())
+
+
+async def _recently_revoked_tokens():
+    sync = DenylistSync()
+    sync._synced_until = datetime.now(timezone.utc)
+    await sync.sync()
+
+
+HOT_LOOKUPS = {
+    "user by id": lambda: get_user(_id()),
+    "user by email": lambda: prisma.models.User.prisma().find_unique(
+        where={"email": f"{_id()}@example.com"}
+    ),
+    "latest subscription of a user": lambda: get_latest_subscription(_id()),
+    "paid subscription of a user": lambda: prisma.models.Subscription.prisma().find_first(
+        where={"userId": _id(), "type": {"not": prisma.enums.SubscriptionType.FREE}}
+    ),
+    "images of a user": lambda: prisma.models.ImageFile.prisma().find_many(
+        where={"id": {"in": [_id(), _id()]}, "userId": _id()}
+    ),
+    "manipulation history of an image": lambda: prisma.models.ImageManipulationRecord.prisma().delete_many(
+        where={"imageFileId": _id()}
+    ),
+    "smallest rendition covering a size": lambda: find_rendition(_id(), 100, 100),
+    "session by token hash": lambda: end_session(_id()),
+    "expired sessions": lambda: session_sweeper.sweep(),
+    "unexpired revoked tokens": lambda: DenylistSync().sync(),
+    "recently revoked tokens": _recently_revoked_tokens,
+    # The worker's claim query, without starting the claimed jobs.
+    "queued batch jobs": lambda: prisma.models.BatchJob.prisma().find_many(
+        where={"status": prisma.enums.BatchJobStatus.QUEUED},
+        order={"createdAt": "asc"},
+        take=4,
+    ),
+    "stale batch jobs": lambda: BatchWorker()._requeue_stale_jobs(),
+    "queued items of a batch job": lambda: prisma.models.BatchJobItem.prisma().find_many(
+        where={"jobId": _id(), "status": prisma.enums.BatchJobStatus.QUEUED},
+        take=50,
+    ),
+}
+
+
+@pytest.fixture
+def logged_db(run, tmp_path):
+    """
+    A registered client whose query engine logs every statement to a file, and a
+    function returning the statements logged since it was last called.
+    """
+    if not os.environ.get("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
+    log_path = tmp_path / "engine.log"
+    client = prisma.Prisma(auto_register=True, log_queries=True)
+    with open(log_path, "w") as log_file:
+        # The engine process inherits sys.stdout as its standard output.
+        stdout, sys.stdout = sys.stdout, log_file
+        try:
+            run(client.connect())
+        finally:
+            sys.stdout = stdout
+    offset = 0
+
+    def logged_queries() -> list[tuple[str, list]]:
+        nonlocal offset
+        with open(log_path) as log:
+            log.seek(offset)
+            lines = log.readlines()
+            offset = log.tell()
+        return [query for query in map(_logged_query, lines) if query]
+
+    try:
+        yield client, logged_queries
+    finally:
+        run(client.disconnect())
+
+
+def _logged_query(line: str):
+    try:
+        fields = json.loads(line).get("fields", {})
+    except ValueError:
+        return None
+    sql = fields.get("query")
+    if not sql or not sql.lstrip().upper().startswith(_PLANNED_STATEMENTS):
+        return None
+    return sql, json.loads(fields.get("params") or "[]")
+
+
+def _literal(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    # Untyped literals take the type of the column or cast they meet, like parameters.
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _bind(sql: str, params: list) -> str:
+    return re.sub(r"\$(\d+)", lambda m: _literal(params[int(m.group(1)) - 1]), sql)
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    tables = []
+    if plan.get("Node Type") == "Seq Scan":
+        tables.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        tables.extend(_seq_scans(child))
+    return tables
+
+
+async def _plan(client: prisma.Prisma, sql: str) -> dict:
+    async with client.tx() as tx:
+        await tx.execute_raw("SET LOCAL enable_seqscan = off")
+        rows = await tx.query_raw(f"EXPLAIN (FORMAT JSON) {sql}")
+    plan = rows[0]["QUERY PLAN"]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+@pytest.mark.database
+@pytest.mark.parametrize("lookup", HOT_LOOKUPS)
+def test_hot_lookup_uses_an_index(run, logged_db, lookup):
+    client, logged_queries = logged_db
+    logged_queries()
+    run(HOT_LOOKUPS[lookup]())
+    queries = logged_queries()
+    assert queries, "the query engine logged no statements"
+    for sql, params in queries:
+        plan = run(_plan(client, _bind(sql, params)))
+        assert _seq_scans(plan) == [], sql
+
+
+def test_logged_statements_are_bound_for_explain():
+    line = json.dumps(
+        {
+            "level": "INFO",
+            "fields": {
+                "query": 'SELECT "public"."User"."id" FROM "public"."User" WHERE'
+                ' "public"."User"."email" = $1 LIMIT $2 OFFSET $10',
+                "params": '["o\'brien@example.com",1,0,0,0,0,0,0,0,0]',
+            },
+            "target": "quaint::connector::metrics",
+        }
+    )
+    sql, params = _logged_query(line)
+    assert _bind(sql, params) == (
+        'SELECT "public"."User"."id" FROM "public"."User" WHERE'
+        ' "public"."User"."email" = \'o\'\'brien@example.com\' LIMIT 1 OFFSET 0'
+    )
+    assert _logged_query(json.dumps({"fields": {"query": "BEGIN"}})) is None
+    assert _logged_query("query engine started") is None
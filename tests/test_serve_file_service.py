@@ -0,0 +1,33 @@
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from project.crop_image_service import crop_to_file
+from project.serve_file_service import MAX_TRANSFORM_DIMENSION, _parse_crop
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = str(tmp_path / "source.png")
+    Image.new("RGB", (40, 30), "red").save(path, format="PNG")
+    return path
+
+
+@pytest.mark.parametrize(
+    "crop", [f"0,0,{MAX_TRANSFORM_DIMENSION + 1},10", "0,0,10,1000000000"]
+)
+def test_oversized_crop_is_rejected(crop):
+    with pytest.raises(HTTPException) as excinfo:
+        _parse_crop(crop)
+    assert excinfo.value.status_code == 400
+
+
+def test_crop_past_the_edges_is_clipped_to_the_image(tmp_path, source_path):
+    dest_path = str(tmp_path / "out.png")
+    crop_to_file(source_path, (-10, 20, 4000, 4000), dest_path)
+    with Image.open(dest_path) as img:
+        assert img.size == (40, 10)
+
+
+def test_crop_outside_the_image_is_rejected(tmp_path, source_path):
+    with pytest.raises(ValueError):
+        crop_to_file(source_path, (50, 0, 60, 10), str(tmp_path / "out.png"))
@@ -0,0 +1,44 @@
+import project.server
+import pytest
+from fastapi import HTTPException
+from project import (
+    delete_image_service,
+    logout_user_service,
+    upgrade_subscription_service,
+)
+from project.auth import AuthenticatedUser
+
+USER = AuthenticatedUser(
+    id="user-1", email="user@example.com", jti="jti", exp=0, token_hash="hash"
+)
+
+
+async def _not_found(*args, **kwargs):
+    raise HTTPException(status_code=404, detail="Not found")
+
+
+@pytest.mark.parametrize(
+    "module,name,route",
+    [
+        (
+            delete_image_service,
+            "delete_image",
+            lambda: project.server.api_delete_image("image-1", USER),
+        ),
+        (
+            logout_user_service,
+            "logout_user",
+            lambda: project.server.api_post_logout_user(USER),
+        ),
+        (
+            upgrade_subscription_service,
+            "upgrade_subscription",
+            lambda: project.server.api_post_upgrade_subscription("MONTHLY", USER),
+        ),
+    ],
+)
+def test_http_errors_are_not_turned_into_500s(run, monkeypatch, module, name, route):
+    monkeypatch.setattr(module, name, _not_found)
+    with pytest.raises(HTTPException) as excinfo:
+        run(route())
+    assert excinfo.value.status_code == 404
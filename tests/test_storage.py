@@ -0,0 +1,175 @@
+import asyncio
+import os
+import threading
+import time
+
+import project.storage
+import pytest
+from project.storage import LocalStorage, Storage, delete_object
+
+
+def _write(path: str, content: bytes = b"image") -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_backends_must_implement_every_operation():
+    class Incomplete(Storage):
+        def staging_path(self, key: str) -> str:
+            return key
+
+    with pytest.raises(TypeError):
+        Storage()
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_local_storage_round_trip(run, tmp_path):
+    storage = LocalStorage(str(tmp_path / "root"))
+    key = "uploads/a/image.png"
+    staged = _write(str(tmp_path / "elsewhere" / "image.png"))
+
+    run(storage.store(staged, key))
+    assert not os.path.exists(staged)
+    path = run(storage.fetch(key))
+    assert path == storage.staging_path(key)
+    assert _read(path) == b"image"
+    assert run(storage.exists(key))
+
+    run(storage.delete(key))
+    assert not run(storage.exists(key))
+    with pytest.raises(FileNotFoundError):
+        run(storage.fetch(key))
+    # Deleting a missing object is not an error.
+    run(storage.delete(key))
+
+
+def test_local_storage_keeps_files_written_in_place(run, tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    key = "uploads/image.png"
+    _write(storage.staging_path(key))
+    run(storage.store(storage.staging_path(key), key))
+    assert _read(run(storage.fetch(key))) == b"image"
+
+
+class FakeS3Client:
+    """
+    The subset of the boto3 S3 client S3Storage uses, keeping objects in a dict.
+    """
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.downloads = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _not_found():
+        import botocore.exceptions
+
+        return botocore.exceptions.ClientError(
+            {"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"
+        )
+
+    def upload_file(self, local_path, bucket, key, Config=None):
+        self.objects[key] = _read(local_path)
+
+    def download_file(self, bucket, key, local_path, Config=None):
+        with self._lock:
+            self.downloads += 1
+        time.sleep(0.05)
+        if key not in self.objects:
+            raise self._not_found()
+        with open(local_path, "wb") as f:
+            f.write(self.objects[key])
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self._not_found()
+        return {}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture
+def s3_storage(tmp_path):
+    pytest.importorskip("boto3")
+    from project.storage import S3Storage
+
+    storage = S3Storage(
+        bucket="images",
+        endpoint_url="http://localhost:9000",
+        region="us-east-1",
+        cache_dir=str(tmp_path / "cache"),
+        cache_max_bytes=1024 * 1024,
+    )
+    storage.client = FakeS3Client()
+    return storage
+
+
+def test_s3_store_uploads_and_keeps_a_cached_copy(run, s3_storage):
+    key = "uploads/image.png"
+    _write(s3_storage.staging_path(key))
+    run(s3_storage.store(s3_storage.staging_path(key), key))
+    assert s3_storage.client.objects[key] == b"image"
+    assert _read(run(s3_storage.fetch(key))) == b"image"
+    assert s3_storage.client.downloads == 0
+
+
+def test_s3_concurrent_fetches_share_one_download(run, s3_storage):
+    key = "uploads/image.png"
+    s3_storage.client.objects[key] = b"image"
+
+    async def fetch_many():
+        return await asyncio.gather(*(s3_storage.fetch(key) for _ in range(8)))
+
+    paths = run(fetch_many())
+    assert len(set(paths)) == 1
+    assert _read(paths[0]) == b"image"
+    assert s3_storage.client.downloads == 1
+    # Later fetches are served from the cache.
+    run(s3_storage.fetch(key))
+    assert s3_storage.client.downloads == 1
+
+
+def test_s3_missing_object(run, s3_storage, tmp_path):
+    key = "uploads/missing.png"
+    assert not run(s3_storage.exists(key))
+    with pytest.raises(FileNotFoundError):
+        run(s3_storage.fetch(key))
+    cache_dir = str(tmp_path / "cache")
+    leftovers = [
+        name
+        for _, _, names in os.walk(cache_dir)
+        for name in names
+        if name.endswith(".part")
+    ]
+    assert leftovers == []
+
+
+def test_s3_delete_drops_the_object_and_the_cached_copy(run, s3_storage):
+    key = "uploads/image.png"
+    _write(s3_storage.staging_path(key))
+    run(s3_storage.store(s3_storage.staging_path(key), key))
+    run(s3_storage.delete(key))
+    assert key not in s3_storage.client.objects
+    assert not run(s3_storage.exists(key))
+    with pytest.raises(FileNotFoundError):
+        run(s3_storage.fetch(key))
+
+
+def test_delete_object_logs_failures_instead_of_raising(run, monkeypatch, caplog):
+    class Unavailable(LocalStorage):
+        async def delete(self, key: str) -> None:
+            raise OSError("storage unavailable")
+
+    monkeypatch.setattr(project.storage, "storage", Unavailable())
+    run(delete_object("uploads/image.png"))
+    assert "uploads/image.png" in caplog.text
@@ -0,0 +1,190 @@
+import os
+import shutil
+from types import SimpleNamespace
+
+import numpy as np
+import prisma.models
+import project.storage
+import pytest
+from PIL import Image
+from project import tiles
+from project.crop_image_service import crop_to_file
+from project.resize_image_service import (
+    REDUCING_GAP,
+    RESAMPLE_FILTERS,
+    ResampleFilter,
+    ResizeMode,
+    resize_source_box,
+    resize_target_size,
+    resize_to_file,
+)
+from project.storage import LocalStorage
+
+TILE_SIZE = 128
+
+SIZE = (1200, 900)
+
+LANCZOS = RESAMPLE_FILTERS[ResampleFilter.LANCZOS]
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path / "storage"))
+    monkeypatch.setattr(tiles, "storage", storage)
+    monkeypatch.setattr(project.storage, "storage", storage)
+    return storage
+
+
+def _pyramid(tmp_path, monkeypatch, storage, img):
+    """
+    Stores `img` with its tile pyramid and returns the image record of it.
+    """
+    source_path = storage.staging_path("img.png")
+    os.makedirs(os.path.dirname(source_path), exist_ok=True)
+    img.save(source_path, compress_level=1)
+    levels, written = tiles._render_tiles(
+        source_path, str(tmp_path / "tiles"), TILE_SIZE, "PNG"
+    )
+    for level, column, row, path in written:
+        dest = storage.staging_path(tiles.tile_path("img.png", level, column, row))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(path, dest)
+    blob = SimpleNamespace(
+        hash="hash",
+        storagePath="img.png",
+        width=img.width,
+        height=img.height,
+        tileSize=TILE_SIZE,
+        tileLevels=levels,
+    )
+
+    async def get_blob(content_hash):
+        return blob
+
+    monkeypatch.setattr(tiles, "get_blob", get_blob)
+    return SimpleNamespace(
+        contentHash="hash",
+        storagePath="img.png",
+        format=SimpleNamespace(value="PNG"),
+    )
+
+
+def _noise(size: tuple[int, int]) -> Image.Image:
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), np.uint8))
+
+
+def _pixels(path: str) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.asarray(img).astype(int)
+
+
+def test_pyramid_halves_until_one_tile():
+    assert tiles.pyramid_levels((2000, 1500), 256) == 4
+    assert tiles.level_size((2000, 1500), 3) == (250, 188)
+    assert tiles.pyramid_levels((200, 100), 256) == 1
+
+
+def test_region_level_leaves_the_reducing_gap_to_the_output():
+    box = (0, 0, 2000, 1500)
+    assert tiles.region_level(box, (1000, 750), 4, REDUCING_GAP) == 0
+    assert tiles.region_level(box, (300, 225), 4, REDUCING_GAP) == 1
+    assert tiles.region_level(box, (100, 75), 4, REDUCING_GAP) == 2
+    assert tiles.region_level(box, (100, 75), 4) == 4 - 1
+
+
+def test_crop_from_tiles_matches_the_original(run, tmp_path, monkeypatch, storage):
+    img = _noise(SIZE)
+    image_record = _pyramid(tmp_path, monkeypatch, storage, img)
+    box = (300, 200, 1000, 700)
+    region = run(tiles.tile_region(image_record, box))
+    tiles.crop_from_tiles(region, str(tmp_path / "tiled.png"))
+    crop_to_file(
+        storage.staging_path("img.png"), box, str(tmp_path / "full.png"), "PNG"
+    )
+    assert np.array_equal(
+        _pixels(str(tmp_path / "tiled.png")), _pixels(str(tmp_path / "full.png"))
+    )
+
+
+@pytest.mark.parametrize("size", [(600, 600), (190, 190), (100, 100), (40, 40)])
+def test_resize_from_tiles_is_within_the_documented_tolerance(
+    run, tmp_path, monkeypatch, storage, size
+):
+    image_record = _pyramid(tmp_path, monkeypatch, storage, _noise(SIZE))
+    box = resize_source_box(SIZE, None, *size, ResizeMode.FIT)
+    target = resize_target_size(box, *size, ResizeMode.FIT)
+    region = run(tiles.tile_region(image_record, box, target, REDUCING_GAP))
+    tiles.resize_from_tiles(
+        region, str(tmp_path / "tiled.png"), target, LANCZOS, REDUCING_GAP
+    )
+    resize_to_file(
+        storage.staging_path("img.png"),
+        str(tmp_path / "full.png"),
+        *size,
+        None,
+        ResizeMode.FIT,
+        ResampleFilter.LANCZOS,
+    )
+    difference = np.abs(
+        _pixels(str(tmp_path / "tiled.png")) - _pixels(str(tmp_path / "full.png"))
+    )
+    assert difference.max() <= 10
+    assert difference.mean() <= 1.5
+
+
+def test_tiles_of_a_released_blob_are_deleted(run, tmp_path, monkeypatch, storage):
+    monkeypatch.setattr(tiles, "TILE_SIZE", TILE_SIZE)
+    monkeypatch.setattr(tiles, "TILE_MIN_PIXELS", 1)
+    monkeypatch.setattr(tiles, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    image_record = _pyramid(tmp_path, monkeypatch, storage, _noise((600, 400)))
+    shutil.rmtree(storage.staging_path("img_tiles"))
+    blob = run(tiles.get_blob(image_record.contentHash))
+    blob.tileSize = blob.tileLevels = None
+
+    class Blobs:
+        async def update(self, where, data):
+            # release_blob deleted the row while the tiles were being stored.
+            return None
+
+    monkeypatch.setattr(prisma.models.Blob, "prisma", lambda *args: Blobs())
+    run(tiles.generate_tiles(image_record.contentHash, image_record.storagePath))
+    assert not os.listdir(storage.staging_path("img_tiles/0"))
+
+
+def test_resize_from_tiles_reads_a_smaller_level(run, tmp_path, monkeypatch, storage):
+    image_record = _pyramid(tmp_path, monkeypatch, storage, _noise(SIZE))
+    box = resize_source_box(SIZE, None, 300, 300, ResizeMode.FIT)
+    target = resize_target_size(box, 300, 300, ResizeMode.FIT)
+    region = run(tiles.tile_region(image_record, box, target))
+    assert region.size[0] < SIZE[0] and region.size[0] >= target[0]
+    size = tiles.resize_from_tiles(
+        region, str(tmp_path / "tiled.png"), target, LANCZOS, REDUCING_GAP
+    )
+    assert size == target == (300, 225)
+
+
+def test_delete_tiles_survives_failed_deletes(run, tmp_path, monkeypatch, storage):
+    image_record = _pyramid(tmp_path, monkeypatch, storage, _noise((600, 400)))
+    blob = run(tiles.get_blob(image_record.contentHash))
+    keys = tiles.tile_keys(blob)
+    delete = storage.delete
+
+    async def flaky_delete(key):
+        if key == keys[0]:
+            raise OSError("storage unavailable")
+        await delete(key)
+
+    monkeypatch.setattr(storage, "delete", flaky_delete)
+    run(tiles.delete_tiles(blob))
+    assert [key for key in keys if os.path.exists(storage.staging_path(key))] == [
+        keys[0]
+    ]
+
+
+def test_tile_region_clips_the_box_to_the_image(run, tmp_path, monkeypatch, storage):
+    image_record = _pyramid(tmp_path, monkeypatch, storage, _noise(SIZE))
+    region = run(tiles.tile_region(image_record, (1000, 800, 5000, 5000)))
+    assert region.size == (200, 100)
+    with pytest.raises(ValueError):
+        run(tiles.tile_region(image_record, (1300, 0, 1400, 100)))